@@ -0,0 +1,295 @@
+#!/usr/bin/python3
+
+# MIT License
+# 
+# Copyright (c) 2020 Andrii Melnyk andriy.melnyk@onapp.com
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# cgroup v2 IO isolation benchmark: a latency sensitive protected fio job runs next to an aggressive noisy job,
+# each in its own temporary cgroup. The protected job runs alone, then with the noisy job without IO control,
+# then with io.max, io.weight or io.latency applied. Reports how accurately the control was enforced and how much
+# the protected job latency inflated. Temporary cgroups are removed at the end.
+
+import os
+import csv
+import time
+import uuid
+import asyncio
+import argparse
+import devinfo
+import testutils
+import performance_test
+from fiolib import FioConfig, OUTPUT_FORMAT_OPTION, JOB_STDIN, get_config_timeout
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+CONTROL_MAX = "max"
+CONTROL_WEIGHT = "weight"
+CONTROL_LATENCY = "latency"
+CONTROLS = [CONTROL_MAX, CONTROL_WEIGHT, CONTROL_LATENCY]
+# io.max limits of the noisy job, io.weight of the noisy job, io.latency target of the protected job in us
+DEFAULT_CONTROL_VALUES = {CONTROL_MAX: "riops=2000 wiops=2000", CONTROL_WEIGHT: "100", CONTROL_LATENCY: "2000"}
+PROTECTED_WEIGHT = 1000
+PROTECTED_PARAMS = {"rw": "randread", "bs": "4k", "iodepth": "1", "numjobs": "1"}
+NOISY_PARAMS = {"bs": "128k", "iodepth": "32", "numjobs": "4", "group_reporting": "1"}
+PHASES = ["alone", "uncontrolled", "controlled"]
+SUMMARY_KEYS = ["phase", "protected_iops", "protected_lat", "protected_p99", "p99_inflation", "noisy_iops", "noisy_bw"]
+
+
+def write_cgroup_file(path, value):
+    with open(path, "w") as cgroup_file:
+        cgroup_file.write(value)
+
+
+# Temporary cgroup tree ptest-<id>/{protected,noisy} with io controller enabled, use as context manager
+class IoCgroups:
+    def __init__(self, root=CGROUP_ROOT, logger=testutils.DEFULT_LOGGER):
+        self.root = root
+        self.logger = logger
+        self.path = os.path.join(root, "ptest-" + uuid.uuid4().hex[:10])
+        self.children = []
+        # io is enabled at the root only when it was not, and disabled again at the end
+        self.root_io_enabled = False
+
+    def create(self, names):
+        controllers = devinfo.read_sys_value(os.path.join(self.root, "cgroup.controllers"))
+        if controllers is None:
+            raise Exception("%s is not cgroup v2 hierarchy" % self.root)
+
+        if "io" not in controllers.split():
+            raise Exception("cgroup v2 io controller is not available at %s" % self.root)
+
+        if "io" not in devinfo.read_sys_value(os.path.join(self.root, "cgroup.subtree_control"), "").split():
+            write_cgroup_file(os.path.join(self.root, "cgroup.subtree_control"), "+io")
+            self.root_io_enabled = True
+
+        os.mkdir(self.path)
+        write_cgroup_file(os.path.join(self.path, "cgroup.subtree_control"), "+io")
+        for name in names:
+            os.mkdir(self.get_path(name))
+            self.children.append(name)
+
+        return self
+
+    def get_path(self, name):
+        return os.path.join(self.path, name)
+
+    def set(self, name, control_file, value):
+        self.logger.debug("cgroup %s %s %s" % (name, control_file, value))
+        write_cgroup_file(os.path.join(self.get_path(name), control_file), value)
+
+    # processes left after a timeout are killed, cgroup with processes can not be removed
+    def remove(self):
+        for name in reversed(self.children):
+            path = self.get_path(name)
+            if devinfo.read_sys_value(os.path.join(path, "cgroup.procs"), "") != "":
+                try:
+                    write_cgroup_file(os.path.join(path, "cgroup.kill"), "1")
+                except OSError:
+                    for pid in devinfo.read_sys_value(os.path.join(path, "cgroup.procs"), "").split():
+                        testutils.systemExec(["kill", "-9", pid])
+
+            for i in range(50):
+                try:
+                    os.rmdir(path)
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            else:
+                self.logger.error("Failed to remove cgroup %s" % path)
+
+        self.children = []
+        try:
+            os.rmdir(self.path)
+        except OSError as e:
+            self.logger.error("Failed to remove cgroup %s %s" % (self.path, str(e)))
+
+    def restore_root(self):
+        if self.root_io_enabled:
+            try:
+                write_cgroup_file(os.path.join(self.root, "cgroup.subtree_control"), "-io")
+                self.root_io_enabled = False
+            except OSError as e:
+                self.logger.error("Failed to disable io controller at %s %s" % (self.root, str(e)))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if os.path.isdir(self.path):
+            self.remove()
+        self.restore_root()
+
+
+def get_config(job_name, params):
+    config = FioConfig()
+    config.add_job(job_name, params)
+    return config
+
+
+# fio moves itself to the cgroup before start, so all its IO is charged there
+async def run_in_cgroup(cgroup_path, config):
+    cmd = ["sh", "-c", "echo $$ > %s/cgroup.procs && exec fio %s %s" % (cgroup_path, JOB_STDIN, OUTPUT_FORMAT_OPTION)]
+    return await testutils.asyncExec(cmd, input=config.to_string(), timeout=get_config_timeout(config))
+
+
+async def run_jobs(jobs):
+    return await asyncio.gather(*[run_in_cgroup(cgroup_path, config) for cgroup_path, config in jobs])
+
+
+def parse_job(exec_result, job_name, logger):
+    if not exec_result.ok:
+        raise Exception("fio %s failed %s" % (job_name, exec_result.get_error()))
+
+    return performance_test.parse_result(exec_result.out, logger)
+
+
+def get_iops(result):
+    return int(result["read_iops"]) + int(result["write_iops"])
+
+
+def get_bw(result):
+    return int(result["read_bw"]) + int(result["write_bw"])
+
+
+# measured value against the configured limit for every io.max key, in percents of the limit
+def get_max_enforcement(limits, noisy):
+    measured = {"riops": int(noisy["read_iops"]), "wiops": int(noisy["write_iops"]), "rbps": int(noisy["read_bw"]) * 1024,
+        "wbps": int(noisy["write_bw"]) * 1024}
+    enforcement = dict()
+    for item in limits.split():
+        key, _, value = item.partition("=")
+        # limits of the direction noisy job does not use say nothing
+        if key in measured and value != "max" and measured[key] != 0:
+            enforcement[key] = round(measured[key] * 100.0 / int(value), 1)
+
+    return enforcement
+
+
+def get_enforcement(control, value, protected, noisy):
+    if control == CONTROL_MAX:
+        return {"%s_of_limit_pct" % k: v for k, v in get_max_enforcement(value, noisy).items()}
+
+    if control == CONTROL_WEIGHT:
+        # shares follow weights only while both jobs want more IO than they get
+        return {"weight_ratio": round(PROTECTED_WEIGHT / float(value), 2),
+            "bw_ratio": round(get_bw(protected) / float(max(get_bw(noisy), 1)), 2)}
+
+    return {"target_us": int(value), "protected_lat_us": round(int(protected["read_lat"]) / 1000.0, 1),
+        "lat_of_target_pct": round(int(protected["read_lat"]) / 10.0 / int(value), 1)}
+
+
+def apply_control(cgroups, control, value, disk):
+    if control == CONTROL_MAX:
+        cgroups.set("noisy", "io.max", "%s %s" % (disk, value))
+    elif control == CONTROL_WEIGHT:
+        cgroups.set("protected", "io.weight", "default %d" % PROTECTED_WEIGHT)
+        cgroups.set("noisy", "io.weight", "default %s" % value)
+    else:
+        cgroups.set("protected", "io.latency", "%s target=%s" % (disk, value))
+
+
+# io.weight is enforced only by BFQ scheduler (active one is in brackets) or io.cost enabled for the disk
+def is_weight_enforced(dev, disk, root=CGROUP_ROOT):
+    if "[bfq]" in devinfo.get_queue_settings(dev).get("scheduler", ""):
+        return True
+
+    qos = devinfo.read_sys_value(os.path.join(root, "io.cost.qos"), "")
+    return any(line.split()[0] == disk and "enable=1" in line.split() for line in qos.splitlines() if line.strip() != "")
+
+
+def get_phase_summary(phase, protected, noisy, baseline):
+    summary = {"phase": phase, "protected_iops": get_iops(protected), "protected_lat": int(protected["read_lat"]),
+        "protected_p99": int(protected["read_p99"]), "noisy_iops": get_iops(noisy) if noisy is not None else 0,
+        "noisy_bw": get_bw(noisy) if noisy is not None else 0}
+    base_p99 = int(baseline["read_p99"]) if baseline is not None else summary["protected_p99"]
+    summary["p99_inflation"] = round(summary["protected_p99"] / float(base_p99), 2) if base_p99 != 0 else 1.0
+    return summary
+
+
+def main(dev, control, value, noisy_rw, runtime, logger, csv_path=None):
+    disk = devinfo.get_disk_number(dev)
+    if disk is None:
+        raise Exception("Can not find block device of %s" % dev)
+
+    fio_params = {"filename": dev, "size": "4GB", "runtime": str(runtime), "time_based": "1", "direct": "1",
+        "ioengine": "libaio"}
+    protected_config = get_config("protected", dict(fio_params, **PROTECTED_PARAMS))
+    noisy_config = get_config("noisy", dict(fio_params, rw=noisy_rw, **NOISY_PARAMS))
+    summaries = []
+    enforcement = None
+    weight_enforced = control != CONTROL_WEIGHT or is_weight_enforced(dev, disk)
+    if not weight_enforced:
+        logger.warning("Neither BFQ scheduler nor io.cost is active for %s, io.weight has no effect" % dev)
+    with IoCgroups(logger=logger) as cgroups:
+        cgroups.create(["protected", "noisy"])
+        baseline = None
+        for phase in PHASES:
+            if phase == "controlled":
+                apply_control(cgroups, control, value, disk)
+
+            logger.info("Start phase %s" % phase)
+            jobs = [(cgroups.get_path("protected"), protected_config)]
+            if phase != "alone":
+                jobs.append((cgroups.get_path("noisy"), noisy_config))
+
+            exec_results = asyncio.run(run_jobs(jobs))
+            protected = parse_job(exec_results[0], "protected", logger)
+            noisy = parse_job(exec_results[1], "noisy", logger) if len(exec_results) > 1 else None
+            summary = get_phase_summary(phase, protected, noisy, baseline)
+            if phase == "alone":
+                baseline = protected
+            if phase == "controlled":
+                enforcement = get_enforcement(control, value, protected, noisy)
+
+            logger.info("phase %s protected iops %d lat %d ns p99 %d ns inflation %.2f noisy iops %d bw %d KiB/s" % (phase,
+                summary["protected_iops"], summary["protected_lat"], summary["protected_p99"], summary["p99_inflation"],
+                summary["noisy_iops"], summary["noisy_bw"]))
+            summaries.append(summary)
+
+    logger.info("io.%s %s enforcement %s" % (control, value, ", ".join("%s %s" % (k, str(v)) for k, v in enforcement.items())))
+    if not weight_enforced:
+        logger.warning("io.weight was not enforced for %s (no BFQ scheduler or io.cost), bandwidth ratio is not a result of the weights" % dev)
+    if csv_path is not None:
+        with open(csv_path, "w") as csv_file:
+            csv_writer = csv.writer(csv_file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            csv_writer.writerow(SUMMARY_KEYS)
+            for summary in summaries:
+                csv_writer.writerow([summary[k] for k in SUMMARY_KEYS])
+
+    return summaries, enforcement
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="cgroup v2 IO isolation benchmark parameters:")
+    parser.add_argument('-d', dest='dev', action='store', type=str, required=True, help='Test device path')
+    parser.add_argument('-c', dest='control', action='store', type=str, default=CONTROL_MAX, choices=CONTROLS, help='IO control to test default max')
+    parser.add_argument('-v', dest='value', action='store', type=str, default=None, help='Control value: io.max limits of noisy job e.g. "wbps=104857600 riops=2000", io.weight of noisy job (protected has %d) or io.latency target of protected job in us, defaults %s' % (PROTECTED_WEIGHT, str(DEFAULT_CONTROL_VALUES)))
+    parser.add_argument('-w', dest='noisy_rw', action='store', type=str, default="randread", help='fio rw mode of the noisy job default randread')
+    parser.add_argument('-r', dest='runtime', action='store', type=int, default=30, help='Runtime of every phase in seconds default 30')
+    parser.add_argument('-o', dest='csv_path', action='store', type=str, default=None, help='CSV file for phase summary')
+    parser.add_argument('-l', dest='log_level', action='store', type=int, default=5, choices=range(0, 8), help='Log level CRITICAL: 0, FATAL: 1, ERROR: 2, WARNING: 3, WARN: 4, INFO: 5, DEBUG: 6, NOTSET: 7 by default 5')
+    args = parser.parse_args()
+    logger = testutils.setup_log(testutils.LOG_TYPE_VERBOSE, args.log_level)
+    try:
+        main(args.dev, args.control, args.value or DEFAULT_CONTROL_VALUES[args.control], args.noisy_rw, args.runtime, logger,
+            args.csv_path)
+    except Exception as e:
+        logger.error("Benchmark failed %s" % str(e))
@@ -0,0 +1,87 @@
+#!/usr/bin/python3
+
+# MIT License
+# 
+# Copyright (c) 2020 Andrii Melnyk andriy.melnyk@onapp.com
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Runs the same suite workloads under several variants of fio options, e.g. IO engines or job placements,
+# and reports every variant side by side with its change against the baseline variant.
+
+import csv
+import json
+import performance_test
+
+# row format of every report key
+KEY_FORMATS = {"iops": "iops %8d", "lat": "lat %8d ns", "p50": "p50 %8d ns", "p99": "p99 %8d ns", "p99.9": "p99.9 %8d ns",
+    "cpu_us_per_io": "cpu %6.2f us/io"}
+# fio config name runs are written to, suite workload names may be the same as bundled configs
+SCRATCH_CONFIG = "seq1"
+
+
+def get_change(value, base):
+    return (value - base) * 100.0 / base if base != 0 else 0.0
+
+
+# baseline is stats of the baseline variant, None for the baseline itself or when it failed
+def format_row(test_name, name, variant_stats, keys, baseline_name, baseline, name_width=8):
+    row = "%s %-*s %s" % (test_name, name_width, name, " ".join(KEY_FORMATS[k] % variant_stats[k] for k in keys))
+    if baseline is not None and name != baseline_name:
+        row += " iops %+.1f%% p99 %+.1f%% vs %s" % (get_change(variant_stats["iops"], baseline["iops"]),
+            get_change(variant_stats["p99"], baseline["p99"]), baseline_name)
+
+    return row
+
+
+# variants are (name, fio options) applied over fio_params and test params, returns {test name: {name: stats}}
+# failed runs are logged and left out, all runs use the scratch config name so no bundled fio config is replaced
+def run_variants(tests, fio_params, variants, variant_title, logger):
+    results = dict()
+    for test in tests:
+        results[test["name"]] = dict()
+        for name, params in variants:
+            test_fio_params = dict(fio_params)
+            test_fio_params.update(test["params"])
+            test_fio_params.update(params)
+            logger.debug("test %s %s %s" % (test["name"], variant_title, name))
+            try:
+                result = performance_test.runcustom(['', '', SCRATCH_CONFIG, "params=%s" % json.dumps(test_fio_params)], logger)
+                results[test["name"]][name] = performance_test.get_main_stats(result)
+            except Exception as e:
+                logger.error("test %s %s %s failed %s" % (test["name"], variant_title, name, str(e)))
+
+    return results
+
+
+def report(results, keys, baseline_name, variant_title, logger, csv_path=None):
+    name_width = max([len(name) for variant_results in results.values() for name in variant_results], default=0)
+    logger.info("%s comparison:" % variant_title.capitalize())
+    for test_name, variant_results in results.items():
+        for name, variant_stats in variant_results.items():
+            logger.info(format_row(test_name, name, variant_stats, keys, baseline_name, variant_results.get(baseline_name),
+                name_width))
+
+    if csv_path is not None:
+        with open(csv_path, "w") as csv_file:
+            csv_writer = csv.writer(csv_file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            csv_writer.writerow(["Test Name", variant_title] + keys)
+            for test_name, variant_results in results.items():
+                for name, variant_stats in variant_results.items():
+                    csv_writer.writerow([test_name, name] + [variant_stats[k] for k in keys])
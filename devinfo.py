@@ -0,0 +1,221 @@
+#!/usr/bin/python3
+
+# MIT License
+# 
+# Copyright (c) 2020 Andrii Melnyk andriy.melnyk@onapp.com
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Helpers to find sysfs information about the block device behind a test target.
+# Target can be a block device, a partition or a regular file on a mounted fs.
+
+import os
+import re
+import stat
+
+SYS_DEV_BLOCK = "/sys/dev/block/"
+PCI_ADDR_RE = re.compile(r"^[0-9a-f]{4}:[0-9a-f]{2}:[0-9a-f]{2}\.[0-9a-f]$")
+
+
+def get_sys_block_path(target):
+    try:
+        st = os.stat(target)
+    except OSError:
+        return None
+
+    dev = st.st_rdev if stat.S_ISBLK(st.st_mode) else st.st_dev
+    sys_path = os.path.realpath(SYS_DEV_BLOCK + "%d:%d" % (os.major(dev), os.minor(dev)))
+    if not os.path.isdir(sys_path):
+        return None
+
+    # statistics and queue settings live at the whole disk, not at the partition
+    if os.path.exists(sys_path + "/partition"):
+        sys_path = os.path.dirname(sys_path)
+
+    return sys_path
+
+
+def get_block_name(target):
+    sys_path = get_sys_block_path(target)
+    if sys_path is None:
+        return None
+
+    return os.path.basename(sys_path)
+
+
+def read_sys_value(path, default=None):
+    try:
+        with open(path) as sys_file:
+            return sys_file.read().strip()
+    except OSError:
+        return default
+
+
+# sysfs directory of the PCI function the device is attached to
+def get_pci_path(target):
+    sys_path = get_sys_block_path(target)
+    if sys_path is None:
+        return None
+
+    parts = sys_path.split("/")
+    pci_indexes = [i for i, part in enumerate(parts) if PCI_ADDR_RE.match(part)]
+    if len(pci_indexes) == 0:
+        return None
+
+    return "/".join(parts[:pci_indexes[-1] + 1])
+
+
+# "major:minor" of the whole disk, cgroup io controls are set per disk
+def get_disk_number(target):
+    sys_path = get_sys_block_path(target)
+    if sys_path is None:
+        return None
+
+    return read_sys_value(sys_path + "/dev")
+
+
+def get_hba(target):
+    sys_path = get_sys_block_path(target)
+    if sys_path is None:
+        return "unknown"
+
+    pci_addrs = [part for part in sys_path.split("/") if PCI_ADDR_RE.match(part)]
+    if len(pci_addrs) == 0:
+        return "virtual"
+
+    return pci_addrs[-1]
+
+
+def get_numa_node(target):
+    sys_path = get_sys_block_path(target)
+    if sys_path is None:
+        return -1
+
+    path = sys_path
+    while path.startswith("/sys/devices/") and path != "/sys/devices":
+        node = read_sys_value(path + "/numa_node")
+        if node is not None:
+            return int(node)
+
+        path = os.path.dirname(path)
+
+    return -1
+
+
+def get_device_identity(target):
+    identity = {"name": None, "model": None, "serial": None, "firmware": None, "size": None}
+    sys_path = get_sys_block_path(target)
+    if sys_path is None:
+        return identity
+
+    identity["name"] = os.path.basename(sys_path)
+    sectors = read_sys_value(sys_path + "/size")
+    identity["size"] = int(sectors) * 512 if sectors is not None else None
+    # nvme keeps identity at controller, scsi/ata at the scsi device, virtio at the disk
+    for path in [sys_path, sys_path + "/device", sys_path + "/device/device"]:
+        identity["model"] = identity["model"] or read_sys_value(path + "/model")
+        identity["serial"] = identity["serial"] or read_sys_value(path + "/serial") or read_sys_value(path + "/wwid")
+        identity["firmware"] = identity["firmware"] or read_sys_value(path + "/firmware_rev") or read_sys_value(path + "/rev")
+
+    return identity
+
+
+# block queue settings that change device performance, missing files are left out
+QUEUE_SETTINGS = ["scheduler", "nr_requests", "read_ahead_kb", "max_sectors_kb", "rotational", "nomerges", "rq_affinity",
+    "write_cache", "logical_block_size", "io_poll"]
+
+
+def get_queue_settings(target):
+    sys_path = get_sys_block_path(target)
+    if sys_path is None:
+        return dict()
+
+    settings = dict()
+    for name in QUEUE_SETTINGS:
+        value = read_sys_value(sys_path + "/queue/" + name)
+        if value is not None:
+            settings[name] = value
+
+    return settings
+
+
+SYS_NODE_DIR = "/sys/devices/system/node/"
+PROC_IRQ_DIR = "/proc/irq/"
+
+
+# "0-3,8,10-11" to [0, 1, 2, 3, 8, 10, 11]
+def parse_cpu_list(cpu_list):
+    cpus = []
+    for part in str(cpu_list).strip().split(","):
+        if part == "":
+            continue
+
+        first, _, last = part.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+
+    return cpus
+
+
+def format_cpu_list(cpus):
+    ranges = []
+    for cpu in sorted(set(cpus)):
+        if len(ranges) != 0 and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+
+    return ",".join(str(first) if first == last else "%d-%d" % (first, last) for first, last in ranges)
+
+
+def get_numa_nodes():
+    try:
+        return sorted(int(name[4:]) for name in os.listdir(SYS_NODE_DIR) if re.match(r"^node\d+$", name))
+    except OSError:
+        return []
+
+
+def get_node_cpus(node):
+    return parse_cpu_list(read_sys_value(SYS_NODE_DIR + "node%d/cpulist" % node, ""))
+
+
+# distances from the node to every node in get_numa_nodes order
+def get_node_distances(node):
+    return [int(d) for d in read_sys_value(SYS_NODE_DIR + "node%d/distance" % node, "").split()]
+
+
+# CPUs that handle completion interrupts of the device queues (MSI/MSI-X vectors of its PCI function)
+def get_irq_cpus(target):
+    pci_path = get_pci_path(target)
+    if pci_path is None:
+        return []
+
+    try:
+        irqs = os.listdir(pci_path + "/msi_irqs")
+    except OSError:
+        irq = read_sys_value(pci_path + "/irq")
+        irqs = [irq] if irq is not None and irq != "0" else []
+
+    cpus = set()
+    for irq in irqs:
+        cpu_list = read_sys_value(PROC_IRQ_DIR + irq + "/effective_affinity_list") or \
+            read_sys_value(PROC_IRQ_DIR + irq + "/smp_affinity_list")
+        if cpu_list is not None:
+            cpus.update(parse_cpu_list(cpu_list))
+
+    return sorted(cpus)
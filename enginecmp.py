@@ -0,0 +1,114 @@
+#!/usr/bin/python3
+
+# MIT License
+# 
+# Copyright (c) 2020 Andrii Melnyk andriy.melnyk@onapp.com
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# IO engine comparison: runs the same suite workloads under libaio, io_uring with its polling and registration
+# options, psync and sync, and reports IOPS, latency percentiles and CPU time per IO side by side.
+# Engines or options the installed fio or the kernel do not support are detected with a short probe and skipped.
+
+import os
+import json
+import argparse
+import testutils
+import workloads
+import performance_test
+import comparison
+
+ENGINES_SUITE_PATH = os.path.join(workloads.SUITES_DIR, "engines.json")
+BASELINE_ENGINE = "libaio"
+# engine variant name and fio options, order is the report order
+ENGINES = [
+    ("libaio", {"ioengine": "libaio"}),
+    ("io_uring", {"ioengine": "io_uring"}),
+    ("io_uring_hipri", {"ioengine": "io_uring", "hipri": "1"}),
+    ("io_uring_sqpoll", {"ioengine": "io_uring", "sqthread_poll": "1"}),
+    ("io_uring_fixedbufs", {"ioengine": "io_uring", "fixedbufs": "1"}),
+    ("io_uring_regfiles", {"ioengine": "io_uring", "registerfiles": "1"}),
+    ("io_uring_all", {"ioengine": "io_uring", "hipri": "1", "sqthread_poll": "1", "fixedbufs": "1", "registerfiles": "1"}),
+    ("psync", {"ioengine": "psync"}),
+    ("sync", {"ioengine": "sync"}),
+]
+REPORT_KEYS = ["iops", "lat", "p50", "p99", "p99.9", "cpu_us_per_io"]
+PROBE_PARAMS = {"rw": "randread", "bs": "4k", "iodepth": "1", "numjobs": "1", "runtime": "1", "time_based": "1"}
+
+
+# engines compiled into installed fio, None when fio can not list them
+def get_fio_engines():
+    out, _ = testutils.systemExec(["fio", "--enghelp"])
+    if out is None:
+        return None
+
+    return [line.strip() for line in out.splitlines()[1:] if line.strip() != ""]
+
+
+# returns None when engine variant runs, otherwise reason to skip it
+def probe_engine(engine_params, fio_params, fio_engines, logger):
+    if fio_engines is not None and engine_params["ioengine"] not in fio_engines:
+        return "fio has no %s engine" % engine_params["ioengine"]
+
+    params = dict(fio_params)
+    params.update(PROBE_PARAMS)
+    params.update(engine_params)
+    try:
+        performance_test.runcustom(['', '', 'probe', "params=%s" % json.dumps(params)], logger)
+    except Exception as e:
+        # fio error text is long, the first line tells the reason e.g. unknown option or not supported by kernel
+        return (str(e).strip().splitlines() or [""])[0][:200]
+
+    return None
+
+
+# returns {test name: {engine name: stats}} and {engine name: skip reason}
+def main(dev, suite_path, engine_names, runtime, logger, csv_path=None):
+    fio_params = {"filename": dev, "size": "4GB", "runtime": str(runtime), "time_based": "1", "direct": "1"}
+    engines = [(name, params) for name, params in ENGINES if engine_names is None or name in engine_names]
+    fio_engines = get_fio_engines()
+    skipped = dict()
+    for name, params in engines:
+        reason = probe_engine(params, fio_params, fio_engines, logger)
+        if reason is not None:
+            logger.warning("skip engine %s: %s" % (name, reason))
+            skipped[name] = reason
+
+    engines = [(name, params) for name, params in engines if name not in skipped]
+    results = comparison.run_variants(workloads.expand_suite(workloads.load_suite(suite_path)), fio_params, engines, "engine",
+        logger)
+    comparison.report(results, REPORT_KEYS, BASELINE_ENGINE, "engine", logger, csv_path)
+    return results, skipped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IO engine comparison parameters:")
+    parser.add_argument('-d', dest='dev', action='store', type=str, required=True, help='Test device path')
+    parser.add_argument('-T', dest='suite_path', action='store', type=str, default=ENGINES_SUITE_PATH, help='Test suite json or yaml file default %s' % ENGINES_SUITE_PATH)
+    parser.add_argument('-e', dest='engines', action='store', type=str, nargs='+', default=None, choices=[name for name, _ in ENGINES], help='Engine variants to compare, all by default')
+    parser.add_argument('-r', dest='runtime', action='store', type=int, default=10, help='Runtime of every test in seconds default 10')
+    parser.add_argument('-o', dest='csv_path', action='store', type=str, default=None, help='CSV file for the comparison')
+    parser.add_argument('-l', dest='log_level', action='store', type=int, default=5, choices=range(0, 8), help='Log level CRITICAL: 0, FATAL: 1, ERROR: 2, WARNING: 3, WARN: 4, INFO: 5, DEBUG: 6, NOTSET: 7 by default 5')
+    args = parser.parse_args()
+    logger = testutils.setup_log(testutils.LOG_TYPE_VERBOSE, args.log_level)
+    try:
+        main(args.dev, args.suite_path, args.engines, args.runtime, logger, args.csv_path)
+    except Exception as e:
+        logger.error("Comparison failed %s" % str(e))
@@ -22,21 +22,188 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import io
 import os
 import glob
 import uuid
 import time
+import json
+import threading
 import configparser
-from testutils import systemExec
+import devinfo
+from testutils import systemExec, StreamExec
 from vmtestlib import Testvm
 
 CONFIG_FILE_ENDING = ".fio"
 CONFIG_FILE_DIR = "/fio/"
+DEFAULT_STATUS_INTERVAL = 1
+# json+ adds completion latency histogram bins to json output
+OUTPUT_FORMAT_OPTION = "--output-format=json+"
+# fio reads job file from stdin, so parallel runs never share a job file on disk
+JOB_STDIN = "-"
+# seconds fio may run over the configured runtime before it is considered hung and killed
+FIO_TIMEOUT_MARGIN = 300
+TIME_UNITS = {"us": 0.000001, "ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400}
+SIZE_UNITS = {"k": 1024, "m": 1024 ** 2, "g": 1024 ** 3, "t": 1024 ** 4, "p": 1024 ** 5}
+# slowest bandwidth (bytes/s) a size based job is expected to move its data with before it is considered hung
+MIN_TIMEOUT_BANDWIDTH = 10 * 1024 ** 2
+FIO_VERSION = None
+
+def get_fio_version():
+    global FIO_VERSION
+    if FIO_VERSION is None:
+        out, _ = systemExec(["fio", "--version"])
+        FIO_VERSION = out.strip() if out is not None else "unknown"
+
+    return FIO_VERSION
+
+# fio time value in seconds, plain numbers are seconds
+def parse_time(value):
+    value = str(value).strip().lower()
+    for unit in sorted(TIME_UNITS, key=len, reverse=True):
+        if value.endswith(unit) and value[:-len(unit)].replace(".", "", 1).isdigit():
+            return float(value[:-len(unit)]) * TIME_UNITS[unit]
+
+    return float(value)
+
+# fio size in bytes, fio uses 1024 base for K, M, G, T, P with optional B or iB
+def parse_size(size):
+    value = str(size).strip().lower()
+    for suffix in ["ib", "b"]:
+        if value.endswith(suffix):
+            value = value[:-len(suffix)]
+            break
+
+    if value[-1] in SIZE_UNITS:
+        return int(float(value[:-1]) * SIZE_UNITS[value[-1]])
+
+    return int(value)
+
+# bytes a size based job moves: io_size or size (whole file or device by default) times loops and numjobs,
+# None when it can not be known (size in percents, missing target)
+def get_job_bytes(params, global_params):
+    def get(key, default=None):
+        return params.get(key, global_params.get(key, default))
+
+    size = get("io_size", get("size"))
+    try:
+        if size is None:
+            filename = get("filename")
+            if filename is None or not os.path.exists(filename):
+                return None
+            size = os.path.getsize(filename) if os.path.isfile(filename) else devinfo.get_device_identity(filename)["size"]
+            if size is None:
+                return None
+        else:
+            size = parse_size(size)
+
+        return size * int(get("loops", "1")) * int(get("numjobs", "1"))
+    except (ValueError, IndexError):
+        return None
+
+# upper bound of fio run time for config, jobs without runtime are bounded by their size at MIN_TIMEOUT_BANDWIDTH,
+# None when the bound is unknown (iolog replay follows the log timing, size can not be parsed)
+def get_config_timeout(config, margin=FIO_TIMEOUT_MARGIN):
+    global_params = config.cfg["global"] if "global" in config.cfg else {}
+    total = 0
+    jobs = [section for section in config.cfg.sections() if section != "global"]
+    for section in jobs:
+        params = config.cfg[section]
+        runtime = params.get("runtime", global_params.get("runtime"))
+        try:
+            if runtime is not None:
+                total += parse_time(runtime)
+            elif params.get("read_iolog", global_params.get("read_iolog")) is None and get_job_bytes(params, global_params) is not None:
+                total += get_job_bytes(params, global_params) / MIN_TIMEOUT_BANDWIDTH
+            else:
+                return None
+
+            total += parse_time(params.get("ramp_time", global_params.get("ramp_time", "0")))
+        except ValueError:
+            return None
+
+    return total + margin if len(jobs) != 0 else None
+
+def get_running_job_index(status_json):
+    # with stonewall jobs run one by one, the last started job is running
+    index = 0
+    for i, job in enumerate(status_json["jobs"]):
+        if int(job.get("job_runtime", 0)) > 0 or int(job.get("elapsed", 0)) > 0:
+            index = i
+
+    return index
+
+def get_interval_stats(status_json, prev_json=None):
+    # fio status reports are cumulative, interval values are difference between two reports
+    index = get_running_job_index(status_json)
+    job = status_json["jobs"][index]
+    prev_job = prev_json["jobs"][index] if prev_json is not None and index < len(prev_json["jobs"]) else None
+    runtime = int(job.get("job_runtime", int(job.get("elapsed", 0)) * 1000))
+    prev_runtime = int(prev_job.get("job_runtime", int(prev_job.get("elapsed", 0)) * 1000)) if prev_job is not None else 0
+    interval = max(runtime - prev_runtime, 1)
+
+    stats = {"elapsed": int(job.get("elapsed", 0)), "runtime": runtime, "jobname": job.get("jobname", "")}
+    for direction in ["read", "write"]:
+        cur = job[direction]
+        prev = prev_job[direction] if prev_job is not None else None
+        kbytes = int(cur["io_kbytes"]) - (int(prev["io_kbytes"]) if prev is not None else 0)
+        ios = int(cur["total_ios"]) - (int(prev["total_ios"]) if prev is not None else 0)
+        lat_count = int(cur["lat_ns"].get("N", cur["total_ios"]))
+        lat_sum = float(cur["lat_ns"]["mean"]) * lat_count
+        if prev is not None:
+            prev_lat_count = int(prev["lat_ns"].get("N", prev["total_ios"]))
+            lat_sum -= float(prev["lat_ns"]["mean"]) * prev_lat_count
+            lat_count -= prev_lat_count
+
+        stats[direction + "_bw"] = (kbytes * 1000) // interval
+        stats[direction + "_iops"] = (ios * 1000) // interval
+        stats[direction + "_lat"] = int(round(lat_sum / lat_count)) if lat_count > 0 else 0
+
+    return stats
+
+# Runs fio with --status-interval and gives interval stats while fio is running
+# After iteration out and err are the same as Fio.run_test_config returns
+class FioStatusStream:
+    def __init__(self, cmd, status_interval=DEFAULT_STATUS_INTERVAL, input=None, timeout=None):
+        self.cmd = cmd + ["--status-interval=%d" % int(status_interval)]
+        self.input = input
+        self.timeout = timeout
+        self.out = None
+        self.err = None
+
+    def __iter__(self):
+        decoder = json.JSONDecoder()
+        exec_stream = StreamExec(self.cmd, input=self.input, timeout=self.timeout)
+        lines = []
+        prev_json = None
+        last_text = None
+        for line in exec_stream:
+            lines.append(line)
+            # every fio json report ends with closing bracket at the line start
+            if not line.startswith("}"):
+                continue
+
+            text = "".join(lines)
+            start = text.find("{")
+            try:
+                status_json, end = decoder.raw_decode(text, start)
+            except ValueError:
+                continue
+
+            lines = [text[end:]]
+            last_text = text[start:end]
+            yield get_interval_stats(status_json, prev_json)
+            prev_json = status_json
+
+        self.err = exec_stream.err
+        if exec_stream.returncode == 0:
+            self.out = last_text
 
 class FioConfig():
     def __init__(self, file_path=None):
         self.file_path = str(file_path)
-        self.cfg = configparser.ConfigParser()
+        # fio options may contain % e.g. steadystate=iops:2%, do not interpolate values
+        self.cfg = configparser.ConfigParser(interpolation=None)
         self.cfg.add_section("global")
 
     def read_file(self, file_path):
@@ -53,6 +220,11 @@ class FioConfig():
     def read(self):
         self.cfg.read(self.file_path)
 
+    def to_string(self):
+        text = io.StringIO()
+        self.cfg.write(text, space_around_delimiters=False)
+        return text.getvalue()
+
     def add_job(self, job_name, params={}):
         self.cfg.read_dict({job_name:params})
 
@@ -89,7 +261,7 @@ class Fio:
 
         return None
 
-    def prepare_config(self, config_name, dev=None):
+    def prepare_config(self, config_name, dev=None, params=None):
         config = self.get_config(config_name)
         if config is None:
             print("Trying to run not existen Test sequence %s" % str(config_name))
@@ -103,42 +275,110 @@ class Fio:
         else:
             print("Warning no global section in config can not use specified device %s" % dev)
 
-        tmp_config_path = self.conf_dir + self.test_uuid + CONFIG_FILE_ENDING
-        config.write_file(tmp_config_path)
-        return tmp_config_path
+        if params is not None:
+            config.cfg.read_dict({"global": params})
+
+        return config
 
     def run_test(self, config_name):
-        tmp_config_path = self.prepare_config(config_name)
-        if tmp_config_path is None:
+        config = self.prepare_config(config_name)
+        if config is None:
             return None, None
 
-        out, err =  systemExec(["fio", tmp_config_path, "--output-format=json"])
-        systemExec(["rm", "-f", tmp_config_path])
-        return out, err
+        return self.run_test_config(config)
     
-    def run_test_config(self, config):
+    # job file is passed to fio stdin, nothing is written to disk, so one process may run many fio at once
+    # fio is killed when it runs FIO_TIMEOUT_MARGIN seconds longer than the config runtime (see get_config_timeout),
+    # timeout overrides it for jobs the config does not bound
+    def run_test_config(self, config, progress=None, status_interval=DEFAULT_STATUS_INTERVAL, timeout=None):
         try:
-            tmp_config_path = self.conf_dir + self.test_uuid + CONFIG_FILE_ENDING
-            config.write_file(tmp_config_path)
+            job_text = config.to_string()
         except Exception as e:
-            return None, ("Failed to write tmp config Exception %s" % str(e))
+            return None, ("Failed to format config Exception %s" % str(e))
 
-        out, err =  systemExec(["fio", tmp_config_path, "--output-format=json"])
-        systemExec(["rm", "-f", tmp_config_path])
-        return out, err
+        if timeout is None:
+            timeout = get_config_timeout(config)
+        if progress is None:
+            return systemExec(["fio", JOB_STDIN, OUTPUT_FORMAT_OPTION], input=job_text, timeout=timeout)
 
-    def run_test_at_vm(self, config_name, vm):
-        vm = Testvm(test_dev_name=str(self.test_device))
-        vm.start()
-        tmp_config_path = self.prepare_config(config_name, dev=vm.get_dev_name_inside_vm())
-        if tmp_config_path is None:
-            return None
+        stream = FioStatusStream(["fio", JOB_STDIN, OUTPUT_FORMAT_OPTION], status_interval, input=job_text, timeout=timeout)
+        for stats in stream:
+            progress(stats)
+
+        return stream.out, stream.err
 
-        remote_config_path = "/root/" + os.path.basename(tmp_config_path)
-        vm.send_file(tmp_config_path, remote_config_path)
-        out, err = vm.run_command("fio %s --output-format=json" % remote_config_path)
-        systemExec(["rm", "-f", tmp_config_path])
-        return out, err
+    # jobs is list of (job name, params), every job starts after the previous one finished (stonewall),
+    # so the whole list runs in one fio process and json output has one report per job name
+    def get_batch_config(self, jobs):
+        config = FioConfig()
+        for job_name, params in jobs:
+            job_params = dict(params)
+            job_params["stonewall"] = "1"
+            job_params["group_reporting"] = "1"
+            config.add_job(job_name, job_params)
+
+        return config
+
+    # vm is a VM from VmPool or Testvm already started with test device, otherwise one time VM is created
+    def run_test_at_vm(self, config_name, vm=None, progress=None, status_interval=DEFAULT_STATUS_INTERVAL):
+        own_vm = not isinstance(vm, Testvm)
+        if own_vm:
+            vm = Testvm(test_dev_name=str(self.test_device))
+
+        try:
+            if own_vm:
+                vm.start()
+
+            config = self.prepare_config(config_name, dev=vm.get_dev_name_inside_vm())
+            if config is None:
+                return None, None
+
+            # ssh forwards stdin to remote fio, so no job file is copied to the VM
+            fio_command = "fio %s %s" % (JOB_STDIN, OUTPUT_FORMAT_OPTION)
+            timeout = get_config_timeout(config)
+            if progress is None:
+                return vm.run_command(fio_command, input=config.to_string(), timeout=timeout)
+
+            stream = FioStatusStream(vm.get_ssh_command(fio_command), status_interval, input=config.to_string(), timeout=timeout)
+            for stats in stream:
+                progress(stats)
+
+            return stream.out, stream.err
+        finally:
+            if own_vm:
+                vm.destroy()
+
+    # runs the same test in all VMs at once, VMs wait on barrier so fio starts at the same time everywhere
+    # returns list of (out, err) in vms order
+    def run_test_at_vms(self, config_name, vms, params=None):
+        config = self.prepare_config(config_name, dev=vms[0].get_dev_name_inside_vm(), params=params)
+        if config is None:
+            return [(None, None) for vm in vms]
+
+        job_text = config.to_string()
+        timeout = get_config_timeout(config)
+        barrier = threading.Barrier(len(vms))
+        results = [(None, None) for vm in vms]
+
+        def run_at_vm(i, vm):
+            barrier.wait()
+            results[i] = vm.run_command("fio %s %s" % (JOB_STDIN, OUTPUT_FORMAT_OPTION), input=job_text, timeout=timeout)
+
+        threads = [threading.Thread(target=run_at_vm, args=(i, vm)) for i, vm in enumerate(vms)]
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        return results
+
+    def run_test_at_pool(self, config_name, pool, progress=None, status_interval=DEFAULT_STATUS_INTERVAL):
+        vm = pool.lease(str(self.test_device))
+        try:
+            return self.run_test_at_vm(config_name, vm, progress, status_interval)
+        finally:
+            pool.release(vm)
 
     def get_result_file_path(self, config_name="fio"):
         return str(os.path.dirname(__file__)) + "/" + config_name + time.strftime("%Y%m%d-%H%M%S") +\
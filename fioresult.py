@@ -0,0 +1,228 @@
+#!/usr/bin/python3
+
+# MIT License
+# 
+# Copyright (c) 2020 Andrii Melnyk andriy.melnyk@onapp.com
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Compact typed model of fio json output. All jobs and directions (read, write, trim) are parsed in one pass,
+# aggregation sums throughput and weights latency by IO count, json+ latency histograms are merged.
+# Jobs of one group run at the same time, stonewalled groups run one after another and are chained instead.
+
+import json
+from latencyhist import LatencyHistogram
+
+DIRECTIONS = ["read", "write", "trim"]
+HIST_SUFFIX = "_hist"
+# completion latency percentiles taken from fio output, name:percentile
+PERCENTILES = [("p50", 50.0), ("p90", 90.0), ("p99", 99.0), ("p99.9", 99.9), ("p99.99", 99.99)]
+# result dict values which are not rounded to integers
+FRACTIONAL_KEYS = ["cpu_us_per_io"]
+
+
+def get_histogram_percentiles(histogram):
+    return tuple(float(histogram.percentile(percentile)) for _, percentile in PERCENTILES)
+
+
+class DirectionStats:
+    __slots__ = ["bw", "iops", "lat_mean", "lat_count", "io_kbytes", "total_ios", "runtime", "percentiles", "histogram"]
+
+    def __init__(self, bw=0, iops=0.0, lat_mean=0.0, lat_count=0, io_kbytes=0, total_ios=0, runtime=0, percentiles=None,
+        histogram=None):
+        self.bw = bw
+        self.iops = iops
+        self.lat_mean = lat_mean
+        self.lat_count = lat_count
+        self.io_kbytes = io_kbytes
+        self.total_ios = total_ios
+        self.runtime = runtime
+        # values in PERCENTILES order
+        self.percentiles = percentiles if percentiles is not None else tuple(0.0 for _ in PERCENTILES)
+        # completion latency histogram, only with json+ output
+        self.histogram = histogram
+
+    @classmethod
+    def from_json(cls, direction_json):
+        lat = direction_json.get("lat_ns", {})
+        percentiles = direction_json.get("clat_ns", {}).get("percentile", {})
+        bins = direction_json.get("clat_ns", {}).get("bins")
+        return cls(int(direction_json.get("bw", 0)), float(direction_json.get("iops", 0)), float(lat.get("mean", 0)),
+            int(lat.get("N", direction_json.get("total_ios", 0))), int(direction_json.get("io_kbytes", 0)),
+            int(direction_json.get("total_ios", 0)), int(direction_json.get("runtime", 0)),
+            # fio prints percentile keys with 6 digits precision e.g. "99.900000"
+            tuple(float(percentiles.get("%f" % percentile, 0)) for _, percentile in PERCENTILES),
+            LatencyHistogram.from_fio_bins(bins) if bins is not None else None)
+
+    # percentiles of merged jobs are taken from merged histograms, IO weighted means without json+ output
+    @classmethod
+    def aggregate(cls, stats):
+        lat_count = sum(s.lat_count for s in stats)
+        weights = [s.lat_count for s in stats] if lat_count > 0 else [1 for s in stats]
+        total_weight = sum(weights)
+        if total_weight == 0:
+            return cls()
+
+        histogram = None
+        percentiles = tuple(sum(s.percentiles[i] * w for s, w in zip(stats, weights)) / total_weight
+            for i in range(len(PERCENTILES)))
+        if all(s.histogram is not None for s in stats):
+            histogram = LatencyHistogram.merge([s.histogram for s in stats])
+            if histogram.total() != 0:
+                percentiles = get_histogram_percentiles(histogram)
+
+        return cls(sum(s.bw for s in stats), sum(s.iops for s in stats),
+            sum(s.lat_mean * w for s, w in zip(stats, weights)) / total_weight, lat_count,
+            sum(s.io_kbytes for s in stats), sum(s.total_ios for s in stats), max(s.runtime for s in stats),
+            percentiles, histogram)
+
+    # stats of groups run one after another, throughput is all IO over the sum of runtimes
+    @classmethod
+    def chain(cls, stats):
+        chained = cls.aggregate(stats)
+        chained.runtime = sum(s.runtime for s in stats)
+        if chained.runtime != 0:
+            chained.bw = int(chained.io_kbytes * 1000 / chained.runtime)
+            chained.iops = chained.total_ios * 1000 / chained.runtime
+
+        return chained
+
+
+class JobResult:
+    __slots__ = ["name", "groupid", "error", "read", "write", "trim", "usr_cpu", "sys_cpu", "runtime", "job_start",
+        "ss_attained"]
+
+    def __init__(self, name, groupid=0, error=0, read=None, write=None, trim=None, usr_cpu=0.0, sys_cpu=0.0, runtime=0,
+        job_start=None, ss_attained=None):
+        self.name = name
+        self.groupid = groupid
+        self.error = error
+        self.read = read if read is not None else DirectionStats()
+        self.write = write if write is not None else DirectionStats()
+        self.trim = trim if trim is not None else DirectionStats()
+        self.usr_cpu = usr_cpu
+        self.sys_cpu = sys_cpu
+        self.runtime = runtime
+        self.job_start = job_start
+        # None when steadystate option was not set
+        self.ss_attained = ss_attained
+
+    @classmethod
+    def from_json(cls, job_json):
+        directions = [DirectionStats.from_json(job_json[d]) if d in job_json else DirectionStats() for d in DIRECTIONS]
+        steady_state = job_json.get("steadystate")
+        return cls(job_json.get("jobname", ""), int(job_json.get("groupid", 0)), int(job_json.get("error", 0)),
+            *directions, float(job_json.get("usr_cpu", 0)), float(job_json.get("sys_cpu", 0)),
+            int(job_json.get("job_runtime", int(job_json.get("elapsed", 0)) * 1000)), job_json.get("job_start"),
+            int(steady_state.get("attained", 0)) if steady_state is not None else None)
+
+    def direction(self, name):
+        return getattr(self, name)
+
+    # CPU time per IO in us, usr_cpu and sys_cpu are percents of the job runtime
+    def get_cpu_per_io(self):
+        ios = sum(self.direction(d).total_ios for d in DIRECTIONS)
+        if ios == 0:
+            return 0.0
+
+        return (self.usr_cpu + self.sys_cpu) / 100 * self.runtime * 1000 / ios
+
+    @classmethod
+    def aggregate(cls, jobs, name=None):
+        ss = [job.ss_attained for job in jobs if job.ss_attained is not None]
+        starts = [job.job_start for job in jobs if job.job_start is not None]
+        return cls(name if name is not None else jobs[0].name, jobs[0].groupid, max(job.error for job in jobs),
+            *[DirectionStats.aggregate([job.direction(d) for job in jobs]) for d in DIRECTIONS],
+            sum(job.usr_cpu for job in jobs), sum(job.sys_cpu for job in jobs), max(job.runtime for job in jobs),
+            min(starts) if len(starts) != 0 else None, min(ss) if len(ss) != 0 else None)
+
+    # jobs are aggregated groups run one after another, CPU usage is weighted by group runtime
+    @classmethod
+    def chain(cls, jobs, name=None):
+        ss = [job.ss_attained for job in jobs if job.ss_attained is not None]
+        starts = [job.job_start for job in jobs if job.job_start is not None]
+        runtime = sum(job.runtime for job in jobs)
+        weights = [job.runtime / runtime if runtime != 0 else 1 / len(jobs) for job in jobs]
+        return cls(name if name is not None else jobs[0].name, jobs[0].groupid, max(job.error for job in jobs),
+            *[DirectionStats.chain([job.direction(d) for job in jobs]) for d in DIRECTIONS],
+            sum(job.usr_cpu * w for job, w in zip(jobs, weights)), sum(job.sys_cpu * w for job, w in zip(jobs, weights)),
+            runtime, min(starts) if len(starts) != 0 else None, min(ss) if len(ss) != 0 else None)
+
+
+class FioResult:
+    __slots__ = ["version", "jobs"]
+
+    def __init__(self, version, jobs):
+        self.version = version
+        self.jobs = jobs
+
+    @classmethod
+    def from_json(cls, result_json):
+        return cls(result_json.get("fio version", ""), [JobResult.from_json(job) for job in result_json["jobs"]])
+
+    @classmethod
+    def parse(cls, text):
+        return cls.from_json(json.loads(text))
+
+    def total(self):
+        groups = list(self.by_group().values())
+        return groups[0] if len(groups) == 1 else JobResult.chain(groups)
+
+    # {groupid: jobs of the group aggregated}, in the order groups were run
+    def by_group(self):
+        groups = dict()
+        for job in self.jobs:
+            groups.setdefault(job.groupid, []).append(job)
+
+        return {groupid: JobResult.aggregate(jobs) for groupid, jobs in groups.items()}
+
+    # jobs of the same name (numjobs without group_reporting) are aggregated to one
+    def by_name(self):
+        names = dict()
+        for job in self.jobs:
+            names.setdefault(job.name, []).append(job)
+
+        return {name: JobResult.aggregate(jobs, name) for name, jobs in names.items()}
+
+
+# dict with string values used by the test suite, see performance_test.parse_result
+def get_result_dict(job):
+    result = dict()
+    for d in DIRECTIONS:
+        stats = job.direction(d)
+        result[d + "_bw"] = str(stats.bw)
+        result[d + "_iops"] = str(int(round(stats.iops)))
+        result[d + "_lat"] = str(int(round(stats.lat_mean)))
+        result[d + "_ios"] = str(stats.total_ios)
+
+    for d in DIRECTIONS[:2]:
+        for (name, _), value in zip(PERCENTILES, job.direction(d).percentiles):
+            result[d + "_" + name] = str(int(round(value)))
+
+        if job.direction(d).histogram is not None and job.direction(d).histogram.total() != 0:
+            result[d + HIST_SUFFIX] = job.direction(d).histogram.to_string()
+
+    result["runtime"] = str(job.runtime)
+    result["cpu_us_per_io"] = str(round(job.get_cpu_per_io(), 2))
+    if job.ss_attained is not None:
+        result["ss_attained"] = str(job.ss_attained)
+        result["ss_runtime"] = str(job.runtime)
+
+    return result
@@ -0,0 +1,231 @@
+#!/usr/bin/python3
+
+# MIT License
+# 
+# Copyright (c) 2020 Andrii Melnyk andriy.melnyk@onapp.com
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Samples host side block device, CPU and IO pressure counters while a test is running.
+# Counters are cumulative, so derived values are differences between the samples around the test window:
+# device utilisation, average queue size, CPU time and cycles per IO, busiest CPU and IO pressure stall time.
+
+import os
+import time
+import threading
+import devinfo
+from testutils import DEFULT_LOGGER
+
+DEFAULT_INTERVAL = 1.0
+DISKSTATS_PATH = "/proc/diskstats"
+CPU_STAT_PATH = "/proc/stat"
+PRESSURE_IO_PATH = "/proc/pressure/io"
+CPUINFO_PATH = "/proc/cpuinfo"
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+HOST_PREFIX = "host_"
+BOUND_THRESHOLD = 90
+
+# first fields of /sys/block/<dev>/stat and of /proc/diskstats after major, minor and name, ticks are in ms
+DISK_FIELDS = ["reads", "reads_merged", "sectors_read", "read_ticks", "writes", "writes_merged", "sectors_written",
+    "write_ticks", "in_flight", "io_ticks", "time_in_queue"]
+# user nice system idle iowait irq softirq steal
+CPU_BUSY_FIELDS = [0, 1, 2, 5, 6, 7]
+CPU_IOWAIT_FIELD = 4
+
+
+def read_diskstats(name):
+    try:
+        with open(DISKSTATS_PATH) as stats_file:
+            for line in stats_file:
+                parts = line.split()
+                if len(parts) > 3 and parts[2] == name:
+                    return parts[3:]
+    except OSError:
+        pass
+
+    return []
+
+
+def read_disk(sys_path):
+    fields = devinfo.read_sys_value(sys_path + "/stat", "").split()
+    if len(fields) == 0:
+        fields = read_diskstats(os.path.basename(sys_path))
+
+    return dict(zip(DISK_FIELDS, [int(field) for field in fields]))
+
+
+def read_inflight(sys_path):
+    fields = devinfo.read_sys_value(sys_path + "/inflight", "").split()
+    return sum(int(field) for field in fields)
+
+
+# {"cpu": all CPUs, "cpu0": first CPU, ...}
+def read_cpu():
+    cpus = dict()
+    with open(CPU_STAT_PATH) as stat_file:
+        for line in stat_file:
+            if not line.startswith("cpu"):
+                break
+
+            parts = line.split()
+            fields = [int(field) for field in parts[1:9]]
+            cpus[parts[0]] = {"busy": sum(fields[i] for i in CPU_BUSY_FIELDS), "iowait": fields[CPU_IOWAIT_FIELD],
+                "total": sum(fields)}
+
+    return cpus
+
+
+def get_cpu_util(first, last):
+    total = last["total"] - first["total"]
+    return (last["busy"] - first["busy"]) * 100 / total if total > 0 else 0
+
+
+# one saturated submission CPU is a few percent of a many CPU host, so the busiest CPU is checked
+def get_max_cpu_util(first, last, cpus=None):
+    names = [name for name in first if name != "cpu" and name in last]
+    if cpus is not None:
+        names = [name for name in names if int(name[3:]) in cpus]
+
+    return max([get_cpu_util(first[name], last[name]) for name in names], default=0)
+
+
+# stall time totals in us, empty when kernel has no PSI
+def read_pressure():
+    pressure = dict()
+    try:
+        with open(PRESSURE_IO_PATH) as pressure_file:
+            for line in pressure_file:
+                parts = line.split()
+                pressure[parts[0]] = int(parts[-1].split("=")[1])
+    except OSError:
+        pass
+
+    return pressure
+
+
+def get_cpu_mhz():
+    mhz = []
+    try:
+        with open(CPUINFO_PATH) as cpuinfo_file:
+            for line in cpuinfo_file:
+                if line.startswith("cpu MHz"):
+                    mhz.append(float(line.split(":")[1]))
+    except OSError:
+        pass
+
+    return sum(mhz) / len(mhz) if len(mhz) != 0 else 0.0
+
+
+def get_bottleneck(host_stats):
+    if float(host_stats.get(HOST_PREFIX + "util", 0)) >= BOUND_THRESHOLD:
+        return "device"
+
+    if float(host_stats.get(HOST_PREFIX + "cpu_max_util", host_stats.get(HOST_PREFIX + "cpu_util", 0))) >= BOUND_THRESHOLD:
+        return "cpu"
+
+    return "none"
+
+
+class HostSampler:
+    # cpus are CPU numbers fio may use, busiest CPU is looked for among all CPUs when it is None
+    def __init__(self, target, interval=DEFAULT_INTERVAL, logger=DEFULT_LOGGER, cpus=None):
+        self.sys_path = devinfo.get_sys_block_path(target)
+        self.enabled = self.sys_path is not None
+        if not self.enabled:
+            logger.warning("No block device found for %s, host sampling disabled" % target)
+
+        self.cpus = cpus
+        self.interval = interval
+        self.logger = logger
+        self.samples = []
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def sample(self):
+        self.samples.append({"time": time.time(), "disk": read_disk(self.sys_path), "inflight": read_inflight(self.sys_path),
+            "cpu": read_cpu(), "pressure": read_pressure()})
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                self.logger.error("Host sampling failed %s" % str(e))
+
+    def start(self):
+        if not self.enabled:
+            return
+
+        self.sample()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+        if self.enabled:
+            self.sample()
+
+        return self.samples
+
+    # samples closest to the window borders, whole sampling time when window is not given
+    def get_window(self, start=None, end=None):
+        first = self.samples[0]
+        last = self.samples[-1]
+        before = [sample for sample in self.samples if start is not None and sample["time"] <= start]
+        after = [sample for sample in self.samples if end is not None and sample["time"] >= end]
+        if len(before) != 0:
+            first = before[-1]
+
+        if len(after) != 0:
+            last = after[0]
+
+        return [sample for sample in self.samples if first["time"] <= sample["time"] <= last["time"]]
+
+    def summarize(self, start=None, end=None):
+        window = self.get_window(start, end)
+        first, last = window[0], window[-1]
+        elapsed_ms = max((last["time"] - first["time"]) * 1000, 1)
+        disk = {k: last["disk"].get(k, 0) - first["disk"].get(k, 0) for k in DISK_FIELDS}
+        cpu = {k: last["cpu"]["cpu"][k] - first["cpu"]["cpu"][k] for k in first["cpu"]["cpu"]}
+        ios = disk["reads"] + disk["writes"]
+        cpu_us = cpu["busy"] * 1000000 / CLK_TCK
+        inflight = [sample["inflight"] for sample in window]
+        summary = {
+            "util": round(min(disk["io_ticks"] * 100 / elapsed_ms, 100), 1),
+            "queue": round(disk["time_in_queue"] / elapsed_ms, 2),
+            "inflight_max": max(inflight),
+            "inflight_avg": round(sum(inflight) / len(inflight), 1),
+            "ios": ios,
+            "cpu_util": round(cpu["busy"] * 100 / cpu["total"], 1) if cpu["total"] > 0 else 0,
+            "cpu_max_util": round(get_max_cpu_util(first["cpu"], last["cpu"], self.cpus), 1),
+            "iowait": round(cpu["iowait"] * 100 / cpu["total"], 1) if cpu["total"] > 0 else 0,
+            "cpu_us_per_io": round(cpu_us / ios, 2) if ios > 0 else 0,
+            "cycles_per_io": int(cpu_us * get_cpu_mhz() / ios) if ios > 0 else 0,
+        }
+        for kind in ["some", "full"]:
+            if kind in first["pressure"] and kind in last["pressure"]:
+                stall_us = last["pressure"][kind] - first["pressure"][kind]
+                summary["io_%s_ms" % kind] = stall_us // 1000
+                summary["io_%s_pct" % kind] = round(stall_us / (elapsed_ms * 10), 1)
+
+        return {HOST_PREFIX + k: str(v) for k, v in summary.items()}
@@ -0,0 +1,197 @@
+#!/usr/bin/python3
+
+# MIT License
+# 
+# Copyright (c) 2020 Andrii Melnyk andriy.melnyk@onapp.com
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Saturation knee search: measures fio IOPS over iodepth x numjobs with a coarse power of two sweep, then bisects
+# iodepth between the last and the first point meeting the target. Target is the smallest outstanding IO reaching
+# given fraction of peak IOPS, or with latency ceiling the highest IOPS with latency under the ceiling.
+
+import csv
+import json
+import argparse
+import testutils
+import performance_test
+
+MODE_PEAK = "peak"
+MODE_LAT = "lat"
+SATURATION_GAIN = 1.02
+CURVE_KEYS = ["iodepth", "numjobs", "qd", "iops", "bw", "lat"]
+
+
+def get_powers(limit):
+    values = [1]
+    while values[-1] * 2 <= limit:
+        values.append(values[-1] * 2)
+
+    if values[-1] != limit:
+        values.append(limit)
+
+    return values
+
+
+class KneeSearch:
+    def __init__(self, params, lat_metric="p99", fraction=0.9, lat_ceiling=None, logger=testutils.DEFULT_LOGGER):
+        self.params = params
+        self.lat_metric = lat_metric
+        self.fraction = fraction
+        self.lat_ceiling = lat_ceiling
+        self.mode = MODE_PEAK if lat_ceiling is None else MODE_LAT
+        self.logger = logger
+        self.points = dict()
+        self.peak = 0
+
+    def measure(self, iodepth, numjobs):
+        if (iodepth, numjobs) in self.points:
+            return self.points[(iodepth, numjobs)]
+
+        fio_params = dict(self.params)
+        fio_params["iodepth"] = str(iodepth)
+        fio_params["numjobs"] = str(numjobs)
+        fio_params["group_reporting"] = "1"
+        result = performance_test.runcustom(['', '', 'knee', "params=%s" % json.dumps(fio_params)], self.logger)
+        point = performance_test.get_main_stats(result, self.lat_metric)
+        point.update({"iodepth": iodepth, "numjobs": numjobs, "qd": iodepth * numjobs})
+        self.points[(iodepth, numjobs)] = point
+        self.peak = max(self.peak, point["iops"])
+        self.logger.info("iodepth %d numjobs %d iops %d bw %d KiB/s %s lat %d ns" % (iodepth, numjobs, point["iops"],
+            point["bw"], self.lat_metric, point["lat"]))
+        return point
+
+    def qualifies(self, point):
+        if self.mode == MODE_LAT:
+            return point["lat"] <= self.lat_ceiling
+
+        return point["iops"] >= self.fraction * self.peak
+
+    # measures iodepth powers of two until IOPS stop growing or latency gets over the ceiling
+    def sweep(self, numjobs, max_iodepth):
+        flat_steps = 0
+        best = 0
+        for iodepth in get_powers(max_iodepth):
+            point = self.measure(iodepth, numjobs)
+            if self.mode == MODE_LAT and not self.qualifies(point):
+                break
+
+            flat_steps = flat_steps + 1 if point["iops"] < best * SATURATION_GAIN else 0
+            best = max(best, point["iops"])
+            if flat_steps == 2:
+                break
+
+    # bisects iodepth between the neighbour measured points where target condition changes
+    def refine(self, numjobs):
+        iodepths = sorted(iodepth for iodepth, jobs in self.points if jobs == numjobs)
+        for lo, hi in zip(iodepths, iodepths[1:]):
+            lo_ok = self.qualifies(self.points[(lo, numjobs)])
+            hi_ok = self.qualifies(self.points[(hi, numjobs)])
+            if lo_ok == hi_ok or not self.can_improve(lo, hi, numjobs):
+                continue
+
+            while hi - lo > max(1, hi // 10):
+                mid = (lo + hi) // 2
+                if self.qualifies(self.measure(mid, numjobs)) == lo_ok:
+                    lo = mid
+                else:
+                    hi = mid
+
+            return
+
+    # bracket can not give better knee than already found one
+    def can_improve(self, lo, hi, numjobs):
+        knee = self.get_knee()
+        if knee is None:
+            return True
+
+        if self.mode == MODE_LAT:
+            return self.points[(hi, numjobs)]["iops"] > knee["iops"]
+
+        return lo * numjobs < knee["qd"]
+
+    def get_knee(self):
+        qualified = [point for point in self.points.values() if self.qualifies(point)]
+        if len(qualified) == 0:
+            return None
+
+        if self.mode == MODE_LAT:
+            return sorted(qualified, key=lambda point: (-point["iops"], point["qd"]))[0]
+
+        return sorted(qualified, key=lambda point: (point["qd"], -point["iops"]))[0]
+
+    def get_curve(self):
+        return sorted(self.points.values(), key=lambda point: (point["numjobs"], point["iodepth"]))
+
+    def run(self, max_iodepth, max_numjobs):
+        numjobs_list = get_powers(max_numjobs)
+        for numjobs in numjobs_list:
+            self.sweep(numjobs, max_iodepth)
+
+        for numjobs in numjobs_list:
+            self.refine(numjobs)
+
+        return self.get_knee()
+
+
+def main(dev, params, max_iodepth, max_numjobs, lat_metric, fraction, lat_ceiling, logger, csv_path=None):
+    fio_params = {"filename": dev, "size": "4GB", "runtime": "10", "time_based": "1", "direct": "1", "ioengine": "libaio",
+        "bs": "4k", "rw": "randread"}
+    fio_params.update(params)
+    search = KneeSearch(fio_params, lat_metric, fraction, lat_ceiling, logger)
+    knee = search.run(max_iodepth, max_numjobs)
+    if knee is None:
+        logger.error("No point meets %s" % ("%s latency %d ns" % (lat_metric, lat_ceiling) if lat_ceiling is not None else
+            "%d%% of peak iops" % int(fraction * 100)))
+    else:
+        logger.info("knee iodepth %d numjobs %d iops %d (peak %d) bw %d KiB/s %s lat %d ns" % (knee["iodepth"], knee["numjobs"],
+            knee["iops"], search.peak, knee["bw"], lat_metric, knee["lat"]))
+
+    curve = search.get_curve()
+    if csv_path is not None:
+        with open(csv_path, "w") as csv_file:
+            csv_writer = csv.writer(csv_file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            csv_writer.writerow(CURVE_KEYS + ["knee"])
+            for point in curve:
+                csv_writer.writerow([point[k] for k in CURVE_KEYS] + [1 if point is knee else 0])
+
+    return knee, curve
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Saturation knee search parameters:")
+    parser.add_argument('-d', dest='dev', action='store', type=str, required=True, help='Test device path')
+    parser.add_argument('-w', dest='rw', action='store', type=str, default="randread", help='fio rw mode default randread')
+    parser.add_argument('-b', dest='bs', action='store', type=str, default="4k", help='Block size default 4k')
+    parser.add_argument('-Q', dest='max_iodepth', action='store', type=int, default=256, help='Max iodepth default 256')
+    parser.add_argument('-J', dest='max_numjobs', action='store', type=int, default=16, help='Max numjobs default 16')
+    parser.add_argument('-r', dest='runtime', action='store', type=int, default=10, help='Runtime of every point in seconds default 10')
+    parser.add_argument('-F', dest='fraction', action='store', type=float, default=0.9, help='Fraction of peak iops the knee has to reach default 0.9')
+    parser.add_argument('-L', dest='lat_ceiling', action='store', type=int, default=None, help='Latency ceiling in ns, search highest iops under it instead of peak fraction')
+    parser.add_argument('-m', dest='lat_metric', action='store', type=str, default="p99", choices=["mean"] + [name for name, _ in performance_test.PERCENTILES], help='Latency metric default p99')
+    parser.add_argument('-o', dest='csv_path', action='store', type=str, default=None, help='CSV file for the measured curve')
+    parser.add_argument('-l', dest='log_level', action='store', type=int, default=5, choices=range(0, 8), help='Log level CRITICAL: 0, FATAL: 1, ERROR: 2, WARNING: 3, WARN: 4, INFO: 5, DEBUG: 6, NOTSET: 7 by default 5')
+    args = parser.parse_args()
+    logger = testutils.setup_log(testutils.LOG_TYPE_VERBOSE, args.log_level)
+    params = {"rw": args.rw, "bs": args.bs, "runtime": str(args.runtime)}
+    try:
+        main(args.dev, params, args.max_iodepth, args.max_numjobs, args.lat_metric, args.fraction, args.lat_ceiling, logger,
+            args.csv_path)
+    except Exception as e:
+        logger.error("Search failed %s" % str(e))
@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+
+# MIT License
+# 
+# Copyright (c) 2020 Andrii Melnyk andriy.melnyk@onapp.com
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Log-linear latency histogram built from fio json+ clat_ns bins. Values below SUB_BUCKETS ns are exact, above
+# every power of two is split to SUB_BUCKETS linear buckets (about 3% precision). Histograms of jobs, repeated runs
+# and hosts are merged by summing bucket counts, so percentiles of the merged histogram are exact up to bucket width.
+
+import math
+
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+
+def get_index(value):
+    value = int(value)
+    if value < SUB_BUCKETS:
+        return max(value, 0)
+
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return (shift + 1) * SUB_BUCKETS + (value >> shift) - SUB_BUCKETS
+
+
+# middle of the bucket
+def get_value(index):
+    if index < SUB_BUCKETS:
+        return index
+
+    shift = index // SUB_BUCKETS - 1
+    lower = (index % SUB_BUCKETS + SUB_BUCKETS) << shift
+    return lower + ((1 << shift) >> 1)
+
+
+class LatencyHistogram:
+    __slots__ = ["counts"]
+
+    def __init__(self, counts=None):
+        self.counts = counts if counts is not None else dict()
+
+    def add(self, value, count=1):
+        index = get_index(value)
+        self.counts[index] = self.counts.get(index, 0) + int(count)
+
+    # bins is clat_ns.bins of fio json+ output {"latency ns": count}
+    @classmethod
+    def from_fio_bins(cls, bins):
+        histogram = cls()
+        for value, count in bins.items():
+            histogram.add(int(value), count)
+
+        return histogram
+
+    @classmethod
+    def merge(cls, histograms):
+        merged = cls()
+        for histogram in histograms:
+            for index, count in histogram.counts.items():
+                merged.counts[index] = merged.counts.get(index, 0) + count
+
+        return merged
+
+    def total(self):
+        return sum(self.counts.values())
+
+    def percentile(self, percent):
+        total = self.total()
+        if total == 0:
+            return 0
+
+        target = max(int(math.ceil(percent * total / 100)), 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return get_value(index)
+
+        return get_value(max(self.counts))
+
+    def mean(self):
+        total = self.total()
+        if total == 0:
+            return 0.0
+
+        return sum(get_value(index) * count for index, count in self.counts.items()) / total
+
+    def cdf(self):
+        total = self.total()
+        seen = 0
+        result = dict()
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            result[index] = seen / total
+
+        return result
+
+    # "index:count" pairs with index stored as difference from the previous one
+    def to_string(self):
+        pairs = []
+        prev = 0
+        for index in sorted(self.counts):
+            pairs.append("%d:%d" % (index - prev, self.counts[index]))
+            prev = index
+
+        return ",".join(pairs)
+
+    @classmethod
+    def from_string(cls, text):
+        histogram = cls()
+        index = 0
+        for pair in text.split(","):
+            if pair == "":
+                continue
+
+            delta, count = pair.split(":")
+            index += int(delta)
+            histogram.counts[index] = int(count)
+
+        return histogram
+
+
+# percentile changes between two histograms and max distance between their CDFs (Kolmogorov-Smirnov statistic)
+def diff(base, other, percentiles):
+    result = dict()
+    for name, percent in percentiles:
+        base_value = base.percentile(percent)
+        other_value = other.percentile(percent)
+        change = (other_value - base_value) * 100 / base_value if base_value != 0 else 0.0
+        result[name] = (base_value, other_value, round(change, 1))
+
+    base_cdf = base.cdf()
+    other_cdf = other.cdf()
+    base_level = other_level = 0.0
+    distance = 0.0
+    for index in sorted(set(base_cdf) | set(other_cdf)):
+        base_level = base_cdf.get(index, base_level)
+        other_level = other_cdf.get(index, other_level)
+        distance = max(distance, abs(base_level - other_level))
+
+    result["ks"] = round(distance, 4)
+    return result
@@ -25,7 +25,9 @@
 import sys
 import json
 from testutils import DEFULT_LOGGER
-from fiolib import Fio
+from fiolib import Fio, DEFAULT_STATUS_INTERVAL
+from vmtestlib import VmPool
+from fioresult import FioResult, PERCENTILES, DIRECTIONS, get_result_dict
 
 def print_help_exit():
     print("Options:\n"\
@@ -33,6 +35,7 @@ def print_help_exit():
         "show <test name> - show fio test configuration by name (stored in fio folder with .fio ending)\n"\
         "runlocal <test name> dev=<block device path> [output=<filename>] - run test at block device at current device\n"\
         "run <test name> dev=<block device path> [output=<filename>]- run test at block device at VM\n"\
+        "runpool <test names,> dev=<block device paths,> [vms=<count>] - run tests at devices at pool of booted VMs\n"\
         "add <test name> params=[] - add test to lib\n"\
         "del <test name> - delete test from lib\n"\
         "runcustom <test name> params=[] - run test with params without adding to lib\n")
@@ -68,22 +71,60 @@ def run_test(args_dict, local=True):
         with open(result_file, "w+") as file_result:
             file_result.write(result)
 
-    result_json = json.loads('{"result":"FAILURE"}')
+    result_json = print_result(result)
+    print("End performance testing")
+    return result_json
+
+def print_job(job):
+    for direction in DIRECTIONS:
+        stats = job.direction(direction)
+        if direction == "trim" and stats.total_ios == 0:
+            continue
+
+        print("%s: bw %d KiB/s lat %d ns iops %d" % (direction, stats.bw, int(round(stats.lat_mean)), int(round(stats.iops))))
+        print("%s: clat percentiles %s" % (direction, " ".join("%s %d ns" % (name, int(round(value)))
+            for (name, _), value in zip(PERCENTILES, stats.percentiles))))
+
+# returns parsed FioResult or None when output can not be parsed
+def print_result(result):
     try:
-        result_json = json.loads(result)
-        read_bw = str(result_json["jobs"][0]["read"]["bw"])
-        read_iops = str(int(round(float(result_json["jobs"][0]["read"]["iops"]))))
-        read_lat = str(int(round(float(result_json["jobs"][0]["read"]["lat_ns"]["mean"]))))
-        print("read: bw %s KiB/s lat %s ns iops %s" % (read_bw, read_lat, read_iops))
-        write_bw = str(result_json["jobs"][0]["write"]["bw"])
-        write_iops = str(int(round(float(result_json["jobs"][0]["write"]["iops"]))))
-        write_lat = str(int(round(float(result_json["jobs"][0]["write"]["lat_ns"]["mean"]))))
-        print("write: bw %s KiB/s lat %s ns iops %s" % (write_bw, write_lat, write_iops))
+        fio_result = FioResult.parse(result)
     except Exception as e:
         print("Failed to parse fio output %s Exception %s" % (str(result), str(e)))
+        return None
+
+    if len(fio_result.jobs) > 1:
+        for job in fio_result.jobs:
+            print("job %s:" % job.name)
+            print_job(job)
+
+        print("all jobs:")
+
+    print_job(fio_result.total())
+    return fio_result
+
+def run_pool(args_dict):
+    if len(args_dict) < 4 or len(str(args_dict[3]).split("=")) < 2:
+        print_help_exit()
+
+    sequences = str(args_dict[2]).split(",")
+    devs = str(args_dict[3]).split("=")[1].split(",")
+    vm_count = int(str(args_dict[4]).split("=")[1]) if len(args_dict) > 4 else 1
+    print("Start performance testing")
+    results = dict()
+    with VmPool(size=vm_count, test_dev_name=devs[0]) as pool:
+        for dev in devs:
+            for sequence in sequences:
+                print("Test %s device %s" % (sequence, dev))
+                result, err = Fio(dev).run_test_at_pool(sequence, pool)
+                if result is None:
+                    print("FIO error %s" % str(err))
+                    continue
+
+                results[(dev, sequence)] = print_result(result)
 
     print("End performance testing")
-    return result_json
+    return results
 
 def del_test(seq):
     fio_obj = Fio()
@@ -104,7 +145,12 @@ def add_test(args_dict):
 
     fio_obj.add_config(test_name, json_params)
 
-def runcustom(args_dict, logger=DEFULT_LOGGER):
+def format_progress(test_name, stats):
+    return "%s %ds: read bw %d KiB/s iops %d lat %d ns write bw %d KiB/s iops %d lat %d ns" % (test_name, stats["elapsed"],
+        stats["read_bw"], stats["read_iops"], stats["read_lat"], stats["write_bw"], stats["write_iops"], stats["write_lat"])
+
+# progress is called with interval stats every status_interval seconds while fio is running
+def runcustom(args_dict, logger=DEFULT_LOGGER, progress=None, status_interval=DEFAULT_STATUS_INTERVAL):
     if len(args_dict) < 4 or len(str(args_dict[3]).split("=")) < 2:
         raise Exception("Incorrect parameters for runcustom %s" % str(args_dict))
     
@@ -118,27 +164,85 @@ def runcustom(args_dict, logger=DEFULT_LOGGER):
     
     config = fio_obj.add_config(test_name, json_params, writefile=False)
     logger.debug("Start performance testing")
-    result, err = fio_obj.run_test_config(config)
+    result, err = fio_obj.run_test_config(config, progress, status_interval)
+    if result is None:
+        raise Exception("FIO error %s" % str(err))
+
+    result = parse_result(result, logger)
+    logger.debug("End performance testing")
+    return result
+
+# splits parsed json output of fio run with several jobs to parsed outputs of jobs with the same name
+def split_jobs(result_json):
+    jobs = dict()
+    for job in result_json["jobs"]:
+        jobs.setdefault(job["jobname"], []).append(job)
+
+    outputs = dict()
+    for job_name in jobs:
+        outputs[job_name] = dict(result_json)
+        outputs[job_name]["jobs"] = jobs[job_name]
+
+    return outputs
+
+# runs list of (job name, params) in one fio process, returns {job name: parsed result} like runcustom
+def runbatch(jobs, logger=DEFULT_LOGGER, progress=None, status_interval=DEFAULT_STATUS_INTERVAL):
+    fio_obj = Fio()
+    logger.debug("Start batch performance testing %s" % ", ".join(job_name for job_name, _ in jobs))
+    result, err = fio_obj.run_test_config(fio_obj.get_batch_config(jobs), progress, status_interval)
     if result is None:
         raise Exception("FIO error %s" % str(err))
 
-    result_json = json.loads('{"result":"FAILURE"}')
     try:
         result_json = json.loads(result)
-        read_bw = str(result_json["jobs"][0]["read"]["bw"])
-        read_iops = str(int(round(float(result_json["jobs"][0]["read"]["iops"]))))
-        read_lat = str(int(round(float(result_json["jobs"][0]["read"]["lat_ns"]["mean"]))))
-        logger.debug("read: bw %s KiB/s lat %s ns iops %s" % (read_bw, read_lat, read_iops))
-        write_bw = str(result_json["jobs"][0]["write"]["bw"])
-        write_iops = str(int(round(float(result_json["jobs"][0]["write"]["iops"]))))
-        write_lat = str(int(round(float(result_json["jobs"][0]["write"]["lat_ns"]["mean"]))))
-        logger.debug("write: bw %s KiB/s lat %s ns iops %s" % (write_bw, write_lat, write_iops))
+        job_results = FioResult.from_json(result_json).by_name()
+        outputs = split_jobs(result_json)
     except Exception as e:
         raise Exception("Failed to parse fio output %s Exception %s" % (str(result), str(e)))
 
-    logger.debug("End performance testing")
-    return {"result":str(result_json), "read_bw":read_bw, "read_iops":read_iops, "read_lat":read_lat,
-        "write_bw":write_bw, "write_iops":write_iops, "write_lat":write_lat}
+    missing = [job_name for job_name, _ in jobs if job_name not in job_results]
+    if len(missing) != 0:
+        raise Exception("No fio results for jobs %s" % ", ".join(missing))
+
+    results = dict()
+    for job_name, _ in jobs:
+        results[job_name] = get_result_dict(job_results[job_name])
+        results[job_name]["result"] = outputs[job_name]
+    logger.debug("End batch performance testing")
+    return results
+
+# parses fio json output to the dict returned by runcustom, all jobs of the output are aggregated
+# output is parsed once, "result" keeps the parsed json and is serialized only when it is stored
+def parse_result(result, logger=DEFULT_LOGGER):
+    try:
+        result_json = json.loads(result)
+        job = FioResult.from_json(result_json).total()
+    except Exception as e:
+        raise Exception("Failed to parse fio output %s Exception %s" % (str(result), str(e)))
+
+    for direction in DIRECTIONS:
+        stats = job.direction(direction)
+        logger.debug("%s: bw %d KiB/s lat %d ns iops %d" % (direction, stats.bw, int(round(stats.lat_mean)), int(round(stats.iops))))
+
+    parsed = get_result_dict(job)
+    logger.debug("clat percentiles %s" % str({k: v for k, v in parsed.items() if k.split("_")[-1].startswith("p")}))
+    if job.ss_attained is not None:
+        logger.debug("steady state attained %d after %d ms" % (job.ss_attained, job.runtime))
+
+    parsed["result"] = result_json
+    return parsed
+
+# total throughput with latency of the direction which did most of IO, used by the tools comparing runs
+def get_main_stats(result, lat_metric="mean"):
+    direction = "read" if int(result["read_iops"]) >= int(result["write_iops"]) else "write"
+    main_stats = {"direction": direction, "iops": int(result["read_iops"]) + int(result["write_iops"]),
+        "bw": int(result["read_bw"]) + int(result["write_bw"]),
+        "lat": int(result[direction + ("_lat" if lat_metric == "mean" else "_" + lat_metric)]),
+        "cpu_us_per_io": float(result["cpu_us_per_io"])}
+    for name, _ in PERCENTILES:
+        main_stats[name] = int(result[direction + "_" + name])
+
+    return main_stats
 
 def main():
     if len(sys.argv) >= 2:
@@ -154,6 +258,9 @@ def main():
         elif sys.argv[1] == "run":
             run_test(sys.argv, local=False)
             return
+        elif sys.argv[1] == "runpool":
+            run_pool(sys.argv)
+            return
         elif sys.argv[1] == "runlocal":
             run_test(sys.argv)
             return
@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+
+# MIT License
+# 
+# Copyright (c) 2020 Andrii Melnyk andriy.melnyk@onapp.com
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# NUMA and CPU affinity placement of fio jobs. Local placement pins jobs to CPUs of the device NUMA node which
+# handle its queue interrupts when there is one for every job, otherwise to the whole node, and binds memory
+# to that node. Remote placement uses the whole farthest node.
+# Comparison mode runs the same workloads local, remote and unpinned to measure the placement penalty.
+
+import os
+import argparse
+import devinfo
+import testutils
+import workloads
+import comparison
+
+PLACEMENT_LOCAL = "local"
+PLACEMENT_REMOTE = "remote"
+PLACEMENT_UNPINNED = "unpinned"
+PLACEMENTS = [PLACEMENT_LOCAL, PLACEMENT_REMOTE, PLACEMENT_UNPINNED]
+PLACEMENT_SUITE_PATH = os.path.join(workloads.SUITES_DIR, "placement.json")
+REPORT_KEYS = ["iops", "lat", "p99", "p99.9", "cpu_us_per_io"]
+FIO_NUMA_SUPPORT = None
+
+
+# numa_cpu_nodes and numa_mem_policy exist only in fio built with libnuma
+def is_fio_numa_supported():
+    global FIO_NUMA_SUPPORT
+    if FIO_NUMA_SUPPORT is None:
+        out, _ = testutils.systemExec(["fio", "--cmdhelp=numa_mem_policy"])
+        FIO_NUMA_SUPPORT = out is not None and "numa_mem_policy" in out and "Build fio with libnuma" not in out
+
+    return FIO_NUMA_SUPPORT
+
+
+# device node, None when the platform does not report it
+def get_local_node(target):
+    node = devinfo.get_numa_node(target)
+    if node < 0:
+        nodes = devinfo.get_numa_nodes()
+        return nodes[0] if len(nodes) == 1 else None
+
+    return node
+
+
+def get_remote_node(node):
+    nodes = devinfo.get_numa_nodes()
+    distances = devinfo.get_node_distances(node)
+    remote = [(distance, other) for other, distance in zip(nodes, distances) if other != node]
+    if len(remote) == 0:
+        return None
+
+    return max(remote)[1]
+
+
+# fio params for the placement and its description for logs, numjobs is the most jobs run with the placement
+def get_placement(target, placement, numjobs=1):
+    if placement == PLACEMENT_UNPINNED:
+        return dict(), "unpinned"
+
+    node = get_local_node(target)
+    if node is None:
+        raise Exception("NUMA node of %s is unknown, can not use %s placement" % (target, placement))
+
+    if placement == PLACEMENT_REMOTE:
+        node = get_remote_node(node)
+        if node is None:
+            raise Exception("Host has one NUMA node, there is no remote placement for %s" % target)
+        cpus = devinfo.get_node_cpus(node)
+    else:
+        # CPUs completing device IO avoid cross CPU completion, but fewer of them than jobs would measure CPU starvation
+        cpus = [cpu for cpu in devinfo.get_irq_cpus(target) if cpu in devinfo.get_node_cpus(node)]
+        if len(cpus) < numjobs:
+            cpus = devinfo.get_node_cpus(node)
+
+    if len(cpus) == 0:
+        raise Exception("NUMA node %d has no CPUs" % node)
+
+    params = {"cpus_allowed": devinfo.format_cpu_list(cpus), "cpus_allowed_policy": "shared"}
+    if is_fio_numa_supported():
+        params.update({"numa_cpu_nodes": str(node), "numa_mem_policy": "bind:%d" % node})
+
+    return params, "%s node %d cpus %s" % (placement, node, params["cpus_allowed"])
+
+
+# returns {test name: {placement: stats}}, placements which can not be used on the host are skipped
+def main(dev, suite_path, runtime, logger, csv_path=None):
+    fio_params = {"filename": dev, "size": "4GB", "runtime": str(runtime), "time_based": "1", "direct": "1",
+        "ioengine": "libaio"}
+    tests = workloads.expand_suite(workloads.load_suite(suite_path))
+    numjobs = max([int(test["params"].get("numjobs", 1)) for test in tests], default=1)
+    placements = []
+    for placement in PLACEMENTS:
+        try:
+            params, description = get_placement(dev, placement, numjobs)
+        except Exception as e:
+            logger.warning("skip %s placement: %s" % (placement, str(e)))
+            continue
+
+        logger.info("placement %s" % description)
+        placements.append((placement, params))
+
+    results = comparison.run_variants(tests, fio_params, placements, "placement", logger)
+    comparison.report(results, REPORT_KEYS, PLACEMENT_LOCAL, "placement", logger, csv_path)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NUMA placement comparison parameters:")
+    parser.add_argument('-d', dest='dev', action='store', type=str, required=True, help='Test device path')
+    parser.add_argument('-T', dest='suite_path', action='store', type=str, default=PLACEMENT_SUITE_PATH, help='Test suite json or yaml file default %s' % PLACEMENT_SUITE_PATH)
+    parser.add_argument('-r', dest='runtime', action='store', type=int, default=10, help='Runtime of every test in seconds default 10')
+    parser.add_argument('-o', dest='csv_path', action='store', type=str, default=None, help='CSV file for the comparison')
+    parser.add_argument('-l', dest='log_level', action='store', type=int, default=5, choices=range(0, 8), help='Log level CRITICAL: 0, FATAL: 1, ERROR: 2, WARNING: 3, WARN: 4, INFO: 5, DEBUG: 6, NOTSET: 7 by default 5')
+    args = parser.parse_args()
+    logger = testutils.setup_log(testutils.LOG_TYPE_VERBOSE, args.log_level)
+    try:
+        main(args.dev, args.suite_path, args.runtime, logger, args.csv_path)
+    except Exception as e:
+        logger.error("Comparison failed %s" % str(e))
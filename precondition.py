@@ -0,0 +1,179 @@
+#!/usr/bin/python3
+
+# MIT License
+# 
+# Copyright (c) 2020 Andrii Melnyk andriy.melnyk@onapp.com
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# SNIA PTS style device preconditioning: workload independent sequential fill of the whole target twice,
+# then workload dependent random write until IOPS reach steady state.
+# Preconditioned state is remembered per device serial and capacity, so runs within the validity window skip it.
+# Write tests change device state, so they invalidate the marker.
+
+import os
+import json
+import time
+import threading
+import devinfo
+from fiolib import Fio, FioConfig
+from performance_test import parse_result
+from testutils import DEFULT_LOGGER
+
+DEFAULT_STATE_PATH = os.path.expanduser("~/.ptest/precondition.json")
+DEFAULT_VALIDITY = 24
+DEFAULT_MAX_RUNTIME = 7200
+# SNIA steady state: 5 one minute rounds within 20% of their average
+DEFAULT_SS = "iops:20%"
+DEFAULT_SS_DUR = 300
+FILL_PARAMS = {"rw": "write", "bs": "128k", "iodepth": "32", "numjobs": "1", "loops": "2", "direct": "1",
+    "ioengine": "libaio"}
+RANDOM_PARAMS = {"rw": "randwrite", "bs": "4k", "iodepth": "32", "numjobs": "4", "direct": "1", "ioengine": "libaio",
+    "time_based": "1", "norandommap": "1", "randrepeat": "0", "group_reporting": "1"}
+
+# parallel device tests share the state file
+STATE_LOCK = threading.Lock()
+
+
+# serial and capacity identify the media, regular files are identified by path and size
+def get_marker_key(target, size=None):
+    identity = devinfo.get_device_identity(target)
+    if os.path.isfile(target) or identity["serial"] is None:
+        return "%s:%s" % (os.path.realpath(target), str(size or identity["size"]))
+
+    return "%s:%s" % (identity["serial"], str(identity["size"]))
+
+
+def read_state(state_path):
+    try:
+        with open(state_path) as state_file:
+            return json.load(state_file)
+    except (OSError, ValueError):
+        return dict()
+
+
+def write_state(state_path, state):
+    if os.path.dirname(state_path) != "":
+        os.makedirs(os.path.dirname(state_path), exist_ok=True)
+
+    tmp_path = "%s.%d" % (state_path, os.getpid())
+    with open(tmp_path, "w") as state_file:
+        json.dump(state, state_file, indent=4)
+    os.replace(tmp_path, state_path)
+
+
+def get_marker(target, size=None, state_path=DEFAULT_STATE_PATH):
+    with STATE_LOCK:
+        return read_state(state_path).get(get_marker_key(target, size))
+
+
+# any write to the target ends its preconditioned state, whether it was preconditioned in this run or not
+def invalidate(target, size=None, state_path=DEFAULT_STATE_PATH, logger=DEFULT_LOGGER):
+    key = get_marker_key(target, size)
+    with STATE_LOCK:
+        state = read_state(state_path)
+        if key not in state:
+            return
+
+        state.pop(key)
+        write_state(state_path, state)
+
+    logger.info("precondition of %s invalidated" % target)
+
+
+class Preconditioner:
+    # validity is in hours, size is fio size for regular file targets
+    def __init__(self, target, size=None, validity=DEFAULT_VALIDITY, max_runtime=DEFAULT_MAX_RUNTIME, steady_state=DEFAULT_SS,
+        ss_dur=DEFAULT_SS_DUR, state_path=DEFAULT_STATE_PATH, logger=DEFULT_LOGGER):
+        if ss_dur > max_runtime:
+            raise Exception("precondition steady state duration %d s does not fit to max runtime %d s" % (ss_dur, max_runtime))
+
+        self.target = target
+        self.size = size
+        self.validity = validity
+        self.max_runtime = max_runtime
+        self.steady_state = steady_state
+        self.ss_dur = ss_dur
+        self.state_path = state_path
+        self.logger = logger
+        self.key = get_marker_key(target, size)
+
+    def get_marker(self):
+        return get_marker(self.target, self.size, self.state_path)
+
+    def is_valid(self):
+        marker = self.get_marker()
+        return marker is not None and time.time() - marker["timestamp"] < self.validity * 3600
+
+    def set_marker(self, marker):
+        with STATE_LOCK:
+            state = read_state(self.state_path)
+            state[self.key] = marker
+            write_state(self.state_path, state)
+
+    def invalidate(self):
+        invalidate(self.target, self.size, self.state_path, self.logger)
+
+    def get_config(self, job_name, params):
+        config = FioConfig()
+        job_params = dict(params)
+        job_params["filename"] = self.target
+        if self.size is not None:
+            job_params["size"] = self.size
+        config.add_job(job_name, job_params)
+        return config
+
+    def run_stage(self, job_name, params):
+        result, err = Fio(self.target).run_test_config(self.get_config(job_name, params))
+        if result is None:
+            raise Exception("precondition %s of %s failed %s" % (job_name, self.target, str(err)))
+
+        return parse_result(result, self.logger)
+
+    def run(self):
+        start = time.time()
+        self.logger.info("precondition %s: sequential fill x2" % self.target)
+        self.run_stage("precondition-fill", FILL_PARAMS)
+
+        self.logger.info("precondition %s: random write until steady state %s, max %d s" % (self.target, self.steady_state,
+            self.max_runtime))
+        params = dict(RANDOM_PARAMS)
+        params.update({"runtime": str(self.max_runtime), "steadystate": self.steady_state, "ss_dur": str(self.ss_dur)})
+        result = self.run_stage("precondition-randwrite", params)
+        attained = result.get("ss_attained") == "1"
+        if not attained:
+            self.logger.warning("precondition %s: steady state %s not attained in %d s" % (self.target, self.steady_state,
+                self.max_runtime))
+
+        marker = {"target": self.target, "timestamp": time.time(), "duration": int(time.time() - start),
+            "ss_attained": attained, "write_iops": int(result["write_iops"])}
+        self.set_marker(marker)
+        self.logger.info("precondition %s done in %d s, steady state write iops %d" % (self.target, marker["duration"],
+            marker["write_iops"]))
+        return marker
+
+    # preconditions the target unless it was done within the validity window, force ignores the marker
+    def ensure(self, force=False):
+        marker = self.get_marker()
+        if not force and self.is_valid():
+            self.logger.info("precondition %s skipped, done %d min ago" % (self.target, (time.time() - marker["timestamp"]) // 60))
+            return marker
+
+        return self.run()
@@ -23,455 +23,615 @@
 # SOFTWARE.
 
 
+import os
 import sys
 import json
 import csv
 import argparse
 import testutils
 import performance_test
+import scheduler
+import resultstore
+import stats
+import workloads
+import hostsampler
+import fioresult
+import latencyhist
+import precondition
+import testfiles
+import resultcache
+import placement
+import devinfo
 
 
-def compare_results(result, compare, test_name):
-    for k in result:
-        if k == "result": # skip json result from test output
-            continue
+CSV_KEYS = ["read_bw", "read_iops", "read_lat", "write_bw", "write_iops", "write_lat"] +\
+    ["read_" + name for name, _ in performance_test.PERCENTILES] + ["write_" + name for name, _ in performance_test.PERCENTILES]
+CSV_HEADER = ["Test Name", "read bw KiB/s", "read iops", "read lat ns", "write bw KiB/s", "write iops", "write lat ns"] +\
+    ["read %s ns" % name for name, _ in performance_test.PERCENTILES] + ["write %s ns" % name for name, _ in performance_test.PERCENTILES] +\
+    ["steady state", "steady state runtime ms"]
+SS_KEYS = ["ss_attained", "ss_runtime"]
+DEFAULT_CONFIDENCE = 95
+STEP_SUFFIX = "_%dthread"
+LAT_METRICS = ["mean"] + [name for name, _ in performance_test.PERCENTILES]
 
-        if int(result[k]) - compare[k]["val"] > compare[k]["div"]:
-            raise Exception(f"{test_name} result {result[k]} {k} divergates from comparsion {compare[k]['val']} {k}")
 
+def csv_row(test_name, result, directions):
+    return [test_name] + [int(result[k]) if k.split("_")[0] in directions and k in result else "" for k in CSV_KEYS] +\
+        [result.get(k, "") for k in SS_KEYS]
 
-def rand_read(fio_params, test_params):
-    fio_params["rw"] = "randread"
-    result = performance_test.runcustom(['', '', 'seq1', "params=%s" % json.dumps(fio_params)], test_params["logger"])
 
-    if hasattr(test_params["logger"], 'csv'):
-        test_params["logger"].csv(["rand_read", int(result["read_bw"]), int(result["read_iops"]),
-            int(result["read_lat"])])
+def get_lat(result, direction, metric="mean"):
+    if metric == "mean":
+        return int(result[direction + "_lat"])
 
-    if test_params["compare_result"] is not None:
-        compare_results(result, test_params["compare_result"], "rand_read")
-        return result
+    return int(result.get(direction + "_" + metric, 0))
 
-    if int(result["read_bw"]) < 500000:
-        raise Exception("rand_read bandwidth less than 500 MB/s")
 
-    if int(result["read_iops"]) < 150000:
-        raise Exception("rand_read iops less than 150000 ")
+# Result is worse than comparsion when throughput is lower or latency is higher more than allowed divergence.
+# With repeated runs or several baseline samples the difference has to be statistically significant too.
+def compare_results(result, compare, test_name):
+    for k in result:
+        if k in ["result", "samples"] or k not in compare: # skip json result from test output and metrics missed in comparsion file
+            continue
 
-    if int(result["read_lat"]) > 10000:
-        raise Exception("rand_read latency bigger than 10 us")
+        diff = int(result[k]) - compare[k]["val"]
+        if resultstore.is_lower_better(k):
+            worse = diff > compare[k]["div"]
+        else:
+            worse = -diff > compare[k]["div"]
 
-    return result
+        if not worse:
+            continue
 
+        samples = [float(sample[k]) for sample in result["samples"]] if "samples" in result else [float(result[k])]
+        baseline = compare[k].get("samples") or [float(compare[k]["val"])]
+        if not stats.is_significant(samples, baseline, compare[k].get("confidence", DEFAULT_CONFIDENCE)):
+            continue
 
-def seq_read(fio_params, test_params):
-    fio_params["rw"] = "read"
-    result = performance_test.runcustom(['', '', 'seq1', "params=%s" % json.dumps(fio_params)], test_params["logger"])
+        raise Exception(f"{test_name} result {result[k]} {k} worse than comparsion {compare[k]['val']} {k}")
 
-    if hasattr(test_params["logger"], 'csv'):
-        test_params["logger"].csv(["seq_read", int(result["read_bw"]), int(result["read_iops"]), int(result["read_lat"])])
 
-    if test_params["compare_result"] is not None:
-        compare_results(result, test_params["compare_result"], "seq_read")
-        return result
-    
-    if int(result["read_bw"]) < 500000:
-        raise Exception("seq_read bandwidth less than 500 MB/s")
-    
-    if int(result["read_iops"]) < 150000:
-        raise Exception("seq_read iops less than 150000 ")
-    
-    if int(result["read_lat"]) > 10000:
-        raise Exception("seq_read bigger than 10 us")
+def aggregate_results(samples):
+    result = dict()
+    for k in samples[0]:
+        if k in ["result", "host_samples"]:
+            continue
 
+        if k.endswith(fioresult.HIST_SUFFIX):
+            # percentiles of all runs are taken from the merged histogram instead of the mean of percentiles
+            histogram = latencyhist.LatencyHistogram.merge([latencyhist.LatencyHistogram.from_string(sample[k])
+                for sample in samples if k in sample])
+            result[k] = histogram.to_string()
+            direction = k[:-len(fioresult.HIST_SUFFIX)]
+            for (name, _), value in zip(fioresult.PERCENTILES, fioresult.get_histogram_percentiles(histogram)):
+                result[direction + "_" + name] = str(int(round(value)))
+            continue
+
+        if k in result:
+            continue
+
+        value = stats.mean([float(sample[k]) for sample in samples if k in sample])
+        # host stats and CPU per IO are fractional, fio metrics are kept integer
+        result[k] = str(round(value, 2)) if k.startswith(hostsampler.HOST_PREFIX) or k in fioresult.FRACTIONAL_KEYS else \
+            str(int(round(value)))
+
+    if "result" in samples[-1]:
+        result["result"] = samples[-1]["result"]
+    if "host_samples" in samples[-1]:
+        result["host_samples"] = samples[-1]["host_samples"]
+    result["samples"] = samples
     return result
 
-def rand_write(fio_params, test_params):
-    fio_params["rw"] = "randwrite"
-    result = performance_test.runcustom(['', '', 'seq1', "params=%s" % json.dumps(fio_params)], test_params["logger"])
 
-    if hasattr(test_params["logger"], 'csv'):
-        test_params["logger"].csv(["rand_write","","","", int(result["write_bw"]), int(result["write_iops"]), int(result["write_lat"])])
+def get_sample_stats(result, confidence=DEFAULT_CONFIDENCE):
+    sample_stats = dict()
+    for k in CSV_KEYS:
+        values = [float(sample[k]) for sample in result["samples"] if k in sample]
+        if len(values) == 0:
+            continue
 
-    if test_params["compare_result"] is not None:
-        compare_results(result, test_params["compare_result"], "rand_write")
-        return result
+        mean, low, high = stats.confidence_interval(values, confidence)
+        sample_stats[k] = {"mean": int(round(mean)), "median": int(round(stats.median(values))), "low": int(round(low)),
+            "high": int(round(high))}
 
-    if int(result["write_bw"]) < 500000:
-        raise Exception("rand_write bandwidth less than 500 MB/s")
-    
-    if int(result["write_iops"]) < 130000:
-        raise Exception("rand_write iops less than 130000 ")
-    
-    if int(result["write_lat"]) > 10000:
-        raise Exception("rand_write latency bigger than 10 us")
+    return sample_stats
 
-    return result
 
-def seq_write(fio_params, test_params):
-    fio_params["rw"] = "write"
-    result = performance_test.runcustom(['', '', 'seq1', "params=%s" % json.dumps(fio_params)], test_params["logger"])
+def combine_results(samples):
+    return samples[0] if len(samples) == 1 else aggregate_results(samples)
 
-    if hasattr(test_params["logger"], 'csv'):
-        test_params["logger"].csv(["seq_write","","","", int(result["write_bw"]), int(result["write_iops"]), int(result["write_lat"])])
 
-    if test_params["compare_result"] is not None:
-        compare_results(result, test_params["compare_result"], "seq_write")
-        return result
+def start_host_sampler(fio_params, test_params):
+    if test_params.get("host_interval") is None:
+        return None
 
-    if int(result["write_bw"]) < 500000:
-        raise Exception("seq_write bandwidth less than 500 MB/s")
-    
-    if int(result["write_iops"]) < 130000:
-        raise Exception("seq_write iops less than 130000 ")
-    
-    if int(result["write_lat"]) > 10000:
-        raise Exception("seq_write latency bigger than 10 us")
+    cpus = devinfo.parse_cpu_list(fio_params["cpus_allowed"]) if "cpus_allowed" in fio_params else None
+    sampler = hostsampler.HostSampler(fio_params["filename"], test_params["host_interval"], test_params["logger"], cpus)
+    if not sampler.enabled:
+        # warned once, the target does not change between tests
+        test_params["host_interval"] = None
+        return None
 
-    return result
+    sampler.start()
+    return sampler
 
-def rand_R70_W30(fio_params, test_params):
-    fio_params["rw"] = "randrw"
-    fio_params["rwmixread"] = "70"
-    fio_params["rwmixwrite"] = "30"
-    result = performance_test.runcustom(['', '', 'seq1', "params=%s" % json.dumps(fio_params)], test_params["logger"])
 
-    if hasattr(test_params["logger"], 'csv'):
-        test_params["logger"].csv(["rand_R70_W30", int(result["read_bw"]), int(result["read_iops"]), int(result["read_lat"]),
-            int(result["write_bw"]), int(result["write_iops"]), int(result["write_lat"])])
+# host stats of the job time window when fio reports job start, otherwise of the whole sampling time
+def add_host_stats(result, sampler, window=False):
+    start = end = None
+    if window:
+        job = result["result"]["jobs"][0]
+        if "job_start" not in job:
+            return
 
-    if test_params["compare_result"] is not None:
-        compare_results(result, test_params["compare_result"], "rand_R70_W30")
-        return result
+        start = int(job["job_start"]) / 1000
+        end = start + int(job.get("job_runtime", int(job.get("elapsed", 0)) * 1000)) / 1000
 
-    if int(result["write_bw"]) < 150000:
-        raise Exception("rand_R70_W30 write bandwidth less than 150 MB/s")
-    
-    if int(result["write_iops"]) < 40000:
-        raise Exception("rand_R70_W30 write iops less than 40000 ")
-    
-    if int(result["write_lat"]) > 10000:
-        raise Exception("rand_R70_W30 write latency bigger than 10 us")
-    
-    if int(result["read_bw"]) < 400000:
-        raise Exception("rand_R70_W30 read bandwidth less than 400 MB/s")
-    
-    if int(result["read_iops"]) < 90000:
-        raise Exception("rand_R70_W30 read iops less than 90000 ")
-    
-    if int(result["read_lat"]) > 10000:
-        raise Exception("rand_R70_W30 read latency bigger than 10 us")
+    result.update(sampler.summarize(start, end))
+    result["host_samples"] = sampler.get_window(start, end)
 
-    return result
 
-def seq_R70_W30(fio_params, test_params):
-    fio_params["rw"] = "rw"
-    fio_params["rwmixread"] = "70"
-    fio_params["rwmixwrite"] = "30"
-    result = performance_test.runcustom(['', '', 'seq1', "params=%s" % json.dumps(fio_params)], test_params["logger"])
+def run_fio_once(fio_params, test_params):
+    if test_params.get("status_interval") is not None:
+        def progress(stats):
+            test_params["logger"].info(performance_test.format_progress(test_params["test_name"], stats))
 
-    if hasattr(test_params["logger"], 'csv'):
-        test_params["logger"].csv(["seq_R70_W30", int(result["read_bw"]), int(result["read_iops"]), int(result["read_lat"]),
-            int(result["write_bw"]), int(result["write_iops"]), int(result["write_lat"])])
+        run = lambda: performance_test.runcustom(['', '', 'seq1', "params=%s" % json.dumps(fio_params)],
+            test_params["logger"], progress, test_params["status_interval"])
+    else:
+        run = lambda: performance_test.runcustom(['', '', 'seq1', "params=%s" % json.dumps(fio_params)], test_params["logger"])
 
-    if test_params["compare_result"] is not None:
-        compare_results(result, test_params["compare_result"], "seq_R70_W30")
-        return result
-    
-    if int(result["write_bw"]) < 150000:
-        raise Exception("seq_R70_W30 write bandwidth less than 150 MB/s")
-    
-    if int(result["write_iops"]) < 40000:
-        raise Exception("seq_R70_W30 write iops less than 40000 ")
-    
-    if int(result["write_lat"]) > 10000:
-        raise Exception("seq_R70_W30 write latency bigger than 10 us")
-    
-    if int(result["read_bw"]) < 400000:
-        raise Exception("seq_R70_W30 read bandwidth less than 400 MB/s")
-    
-    if int(result["read_iops"]) < 90000:
-        raise Exception("seq_R70_W30 read iops less than 90000 ")
-    
-    if int(result["read_lat"]) > 10000:
-        raise Exception("seq_R70_W30 read latency bigger than 10 us")
+    sampler = start_host_sampler(fio_params, test_params)
+    test_params["fio_started"] = True
+    try:
+        result = run()
+    finally:
+        if sampler is not None:
+            sampler.stop()
 
-    return result
+    if sampler is not None:
+        add_host_stats(result, sampler)
 
-def thread_scaling_common(params, threads=1, logger=testutils.DEFULT_LOGGER):
-    result = dict()
-    params["group_reporting"] = 1
-    params["numjobs"] = 1
-    one_thread_result = performance_test.runcustom(['', '', 'seq1', "params=%s" % json.dumps(params)], logger)
-    params["numjobs"] = str(threads)
-    many_threads_result = performance_test.runcustom(['', '', 'seq1', "params=%s" % json.dumps(params)], logger)
-    if int(one_thread_result["read_bw"]) != 0:
-        result["read_bw"] = ((int(many_threads_result["read_bw"]) - int(one_thread_result["read_bw"]))*100)//int(one_thread_result["read_bw"])
-        result["read_iops"] = ((int(many_threads_result["read_iops"]) - int(one_thread_result["read_iops"]))*100)//int(one_thread_result["read_iops"])
-        result["read_lat"] = ((int(many_threads_result["read_lat"]) - int(one_thread_result["read_lat"]))*100)//int(one_thread_result["read_lat"])
-
-    if int(one_thread_result["write_bw"]) != 0:
-        result["write_bw"] = ((int(many_threads_result["write_bw"]) - int(one_thread_result["write_bw"]))*100)//int(one_thread_result["write_bw"])
-        result["write_iops"] = ((int(many_threads_result["write_iops"]) - int(one_thread_result["write_iops"]))*100)//int(one_thread_result["write_iops"])
-        result["write_lat"] = ((int(many_threads_result["write_lat"]) - int(one_thread_result["write_lat"]))*100)//int(one_thread_result["write_lat"])
     return result
 
-def thread_rand_read_scaling3(fio_params, test_params):
-    fio_params["rw"] = "randread"
-    if test_params["scale_percents"]:
-        result = thread_scaling_common(fio_params, 3, test_params["logger"])
-    else:
-        fio_params["group_reporting"] = 1
-        fio_params["numjobs"] = 3
-        result = performance_test.runcustom(['', '', 'seq1', "params=%s" % json.dumps(fio_params)], logger)
 
-    test_params["logger"].debug("scale bw %d" % int(result["read_bw"]))
-    if hasattr(test_params["logger"], 'csv'):
-        test_params["logger"].csv(["thread_rand_read_scaling3", int(result["read_bw"]), int(result["read_iops"]), int(result["read_lat"])])
+# with repeats result values are means of all runs and runs are kept in result["samples"]
+# with results cache the same run on unchanged host and device is taken from the cache and marked as cached
+def run_fio(fio_params, test_params):
+    cache = test_params.get("cache")
+    if cache is not None:
+        key = cache.get_key(fio_params, {"repeats": test_params.get("repeats", 1), "host_interval": test_params.get("host_interval")})
+        result = cache.get(key)
+        if result is not None:
+            test_params["logger"].info("test %s result taken from cache" % test_params["test_name"])
+            result["cached"] = True
+            test_params["last_result"] = result
+            return result
+
+    result = combine_results([run_fio_once(fio_params, test_params) for i in range(test_params.get("repeats", 1))])
+    if cache is not None:
+        cache.put(key, result)
+
+    # kept to store results of failed tests
+    test_params["last_result"] = result
+    return result
 
-    if test_params["compare_result"] is not None:
-        compare_results(result, test_params["compare_result"], "thread_rand_read_scaling3")
-        return result
 
-    if int(result["read_bw"]) < 80:
-        raise Exception("thread_rand_read_scaling3 read bandwidth less than 80%")
-    
-    test_params["logger"].debug("scale iops %d" % int(result["read_iops"]))
-    if int(result["read_iops"]) < 80:
-        raise Exception("thread_rand_read_scaling3 read iops less than 80%")
+# numjobs runs needed for scaling test besides the test numjobs itself
+def get_scaling_steps(test, threads, test_params):
+    if not test["scaling"]:
+        return []
 
-    test_params["logger"].debug("scale lat %d" % int(result["read_lat"]))
-    if int(result["read_lat"]) > 70:
-        raise Exception("thread_rand_read_scaling3 read latency bigger than 80%")
+    if test_params.get("scaling_curve"):
+        steps = [1]
+        while steps[-1] * 2 < threads:
+            steps.append(steps[-1] * 2)
 
-    return result
+        return [n for n in steps if n < threads]
 
-def thread_rand_read_scaling30(fio_params, test_params):
-    fio_params["rw"] = "randread"
     if test_params["scale_percents"]:
-        result = thread_scaling_common(fio_params, 30, test_params["logger"])
+        return [1]
+
+    return []
+
+# steps is {numjobs: result}, efficiency is throughput of N jobs against N times throughput of one job
+def get_curve_stats(test_name, steps, logger):
+    throughput = {n: int(result["read_iops"]) + int(result["write_iops"]) for n, result in steps.items()}
+    curve = list()
+    for n in sorted(throughput):
+        efficiency = throughput[n] / (n * throughput[1]) if throughput[1] != 0 else 0.0
+        curve.append({"numjobs": n, "iops": throughput[n], "efficiency": round(efficiency, 3)})
+        logger.info("test %s numjobs %d iops %d efficiency %.2f" % (test_name, n, throughput[n], efficiency))
+
+    curve_stats = {"curve": curve}
+    if len(curve) < 3 or throughput[1] == 0:
+        return curve_stats
+
+    sigma, kappa, lam = stats.usl_fit(sorted(throughput.items()))
+    peak = stats.usl_peak(sigma, kappa)
+    for point in curve:
+        point["usl_iops"] = int(stats.usl_throughput(point["numjobs"], sigma, kappa, lam))
+
+    curve_stats.update({"usl_sigma": round(sigma, 6), "usl_kappa": round(kappa, 6)})
+    if peak is not None:
+        curve_stats["usl_peak_numjobs"] = round(peak, 1)
+        curve_stats["usl_peak_iops"] = int(stats.usl_throughput(peak, sigma, kappa, lam))
+
+    logger.info("test %s USL contention %.4f coherency %.6f peak %s" % (test_name, sigma, kappa,
+        "%.1f jobs %d iops" % (peak, curve_stats["usl_peak_iops"]) if peak is not None else "none"))
+    return curve_stats
+
+# steps is {numjobs: result} with the test numjobs (threads) and numjobs from get_scaling_steps
+def get_scaling_test_result(test, steps, threads, test_params):
+    if test_params["scale_percents"]:
+        result = get_scaling_result(steps[1], steps[threads])
     else:
-        fio_params["group_reporting"] = 1
-        fio_params["numjobs"] = 30
-        result = performance_test.runcustom(['', '', 'seq1', "params=%s" % json.dumps(fio_params)], logger)
+        result = dict(steps[threads])
 
-    test_params["logger"].debug("scale bw %d" % int(result["read_bw"]))
-    if hasattr(test_params["logger"], 'csv'):
-        test_params["logger"].csv(["thread_rand_read_scaling30", int(result["read_bw"]), int(result["read_iops"]), int(result["read_lat"])])
+    if test_params.get("scaling_curve"):
+        result.update(get_curve_stats(test["name"], steps, test_params["logger"]))
 
-    if test_params["compare_result"] is not None:
-        compare_results(result, test_params["compare_result"], "thread_rand_read_scaling30")
-        return result
-
-    if int(result["read_bw"]) < 180:
-        raise Exception("thread_rand_read_scaling30 read bandwidth less than 180%")
-    
-    test_params["logger"].debug("scale iops %d" % int(result["read_iops"]))
-    if int(result["read_iops"]) < 180:
-        raise Exception("thread_rand_read_scaling30 read iops less than 180%")
+    return result
 
-    test_params["logger"].debug("scale lat %d" % int(result["read_lat"]))
-    if int(result["read_lat"]) > 900:
-        raise Exception("thread_rand_read_scaling30 read latency bigger than 900%")
+def get_scaling_result(one_thread_result, many_threads_result):
+    result = get_scaling(one_thread_result, many_threads_result)
+    if "samples" in one_thread_result:
+        result["samples"] = [get_scaling(one, many) for one, many in
+            zip(one_thread_result["samples"], many_threads_result["samples"])]
 
     return result
 
-def thread_rand_write_scaling3(fio_params, test_params):
-    fio_params["rw"] = "randwrite"
-    if test_params["scale_percents"]:
-        result = thread_scaling_common(fio_params, 3, test_params["logger"])
-    else:
-        fio_params["group_reporting"] = 1
-        fio_params["numjobs"] = 3
-        result = performance_test.runcustom(['', '', 'seq1', "params=%s" % json.dumps(fio_params)], logger)
+def get_scaling(one_thread_result, many_threads_result):
+    result = dict()
+    for direction in ["read", "write"]:
+        if int(one_thread_result[direction + "_bw"]) == 0:
+            continue
 
-    test_params["logger"].debug("scale bw %d" % int(result["write_bw"]))
-    if hasattr(test_params["logger"], 'csv'):
-        test_params["logger"].csv(["thread_rand_write_scaling3", "","","", int(result["write_bw"]), int(result["write_iops"]), int(result["write_lat"])])
+        for k in CSV_KEYS:
+            if not k.startswith(direction) or int(one_thread_result[k]) == 0:
+                continue
 
-    if test_params["compare_result"] is not None:
-        compare_results(result, test_params["compare_result"], "thread_rand_write_scaling3")
-        return result
+            result[k] = ((int(many_threads_result[k]) - int(one_thread_result[k]))*100)//int(one_thread_result[k])
 
-    if int(result["write_bw"]) < 80:
-        raise Exception("thread_rand_write_scaling3 write bandwidth less than 80%")
-    
-    test_params["logger"].debug("scale iops %d" % int(result["write_iops"]))
-    if int(result["write_iops"]) < 80:
-        raise Exception("thread_rand_write_scaling3 write iops less than 80%")
+    # cached results have no fio json
+    if "result" in many_threads_result:
+        result["result"] = many_threads_result["result"]
+    result.update({k: v for k, v in many_threads_result.items() if k.startswith(hostsampler.HOST_PREFIX)})
+    return result
 
-    test_params["logger"].debug("scale lat %d" % int(result["write_lat"]))
-    if int(result["write_lat"]) > 70:
-        raise Exception("thread_rand_write_scaling3 write latency bigger than 80%")
+def check_thresholds(result, test, lat_metric):
+    for k, limits in test["thresholds"].items():
+        direction = k.split("_")[0]
+        if direction not in test["directions"]:
+            continue
 
-    return result
+        if k.endswith("_lat"):
+            name = "%s %s latency" % (direction, lat_metric)
+            value = get_lat(result, direction, lat_metric)
+        else:
+            name = k.replace("_", " ")
+            value = int(result.get(k, 0))
 
-def thread_rand_write_scaling30(fio_params, test_params):
-    fio_params["rw"] = "randwrite"
-    if test_params["scale_percents"]:
-        result = thread_scaling_common(fio_params, 30, test_params["logger"])
-    else:
-        fio_params["group_reporting"] = 1
-        fio_params["numjobs"] = 30
-        result = performance_test.runcustom(['', '', 'seq1', "params=%s" % json.dumps(fio_params)], logger)
+        if "min" in limits and value < limits["min"]:
+            raise Exception("%s %s %d less than %d" % (test["name"], name, value, limits["min"]))
 
-    test_params["logger"].debug("scale bw %d" % int(result["write_bw"]))
-    if hasattr(test_params["logger"], 'csv'):
-        test_params["logger"].csv(["thread_rand_write_scaling30", "","","", int(result["write_bw"]), int(result["write_iops"]), int(result["write_lat"])])
+        if "max" in limits and value > limits["max"]:
+            raise Exception("%s %s %d bigger than %d" % (test["name"], name, value, limits["max"]))
 
-    if test_params["compare_result"] is not None:
-        compare_results(result, test_params["compare_result"], "thread_rand_write_scaling30")
-        return result
 
-    if int(result["write_bw"]) < 80:
-        raise Exception("thread_rand_write_scaling30 write bandwidth less than 80%")
-    
-    test_params["logger"].debug("scale iops %d" % int(result["write_iops"]))
-    if int(result["write_iops"]) < 80:
-        raise Exception("thread_rand_write_scaling30 write iops less than 80%")
+def get_test_fio_params(fio_params, test):
+    test_fio_params = dict(fio_params)
+    test_fio_params.update(test["params"])
+    return test_fio_params
 
-    test_params["logger"].debug("scale lat %d" % int(result["write_lat"]))
-    if int(result["write_lat"]) > 70:
-        raise Exception("thread_rand_write_scaling30 write latency bigger than 80%")
 
-    return result
+# runs all tests in one fio process, returns {test name: result} the same as run_test gets running tests one by one
+def run_batch(tests, fio_params, test_params):
+    jobs = list()
+    for test in tests:
+        test_fio_params = get_test_fio_params(fio_params, test)
+        for numjobs in get_scaling_steps(test, int(test_fio_params.get("numjobs", 1)), test_params):
+            step_params = dict(test_fio_params)
+            step_params["numjobs"] = str(numjobs)
+            jobs.append((test["name"] + STEP_SUFFIX % numjobs, step_params))
 
-def thread_rand_R70_W30_scaling3(fio_params, test_params):
-    fio_params["rw"] = "randrw"
-    fio_params["rwmixread"] = "70"
-    fio_params["rwmixwrite"] = "30"
-    result = thread_scaling_common(fio_params, 3, test_params["logger"])
-    if test_params["scale_percents"]:
-        result = thread_scaling_common(fio_params, 3, test_params["logger"])
+        jobs.append((test["name"], test_fio_params))
+
+    if test_params.get("status_interval") is not None:
+        def progress(stats):
+            test_params["logger"].info(performance_test.format_progress(stats["jobname"], stats))
+
+        run = lambda: performance_test.runbatch(jobs, test_params["logger"], progress, test_params["status_interval"])
     else:
-        fio_params["group_reporting"] = 1
-        fio_params["numjobs"] = 3
-        result = performance_test.runcustom(['', '', 'seq1', "params=%s" % json.dumps(fio_params)], logger)
+        run = lambda: performance_test.runbatch(jobs, test_params["logger"])
 
-    test_params["logger"].debug("scale read bw %d write bw %d" % (int(result["write_bw"]), int(result["write_bw"])))
-    if hasattr(test_params["logger"], 'csv'):
-        test_params["logger"].csv(["thread_rand_R70_W30_scaling3", int(result["read_bw"]), int(result["read_iops"]), int(result["read_lat"]),
-            int(result["write_bw"]), int(result["write_iops"]), int(result["write_lat"])])
+    def run_sampled():
+        sampler = start_host_sampler(fio_params, test_params)
+        test_params["fio_started"] = True
+        try:
+            batch = run()
+        finally:
+            if sampler is not None:
+                sampler.stop()
 
-    if test_params["compare_result"] is not None:
-        compare_results(result, test_params["compare_result"], "thread_rand_R70_W30_scaling3")
-        return result
+        if sampler is not None:
+            for result in batch.values():
+                add_host_stats(result, sampler, window=True)
 
-    if int(result["read_bw"]) < 80:
-        raise Exception("thread_rand_R70_W30_scaling3 read bandwidth less than 80%")
-    
-    test_params["logger"].debug("scale iops %d" % int(result["read_iops"]))
-    if int(result["write_iops"]) < 80:
-        raise Exception("thread_rand_R70_W30_scaling3 read iops less than 80%")
+        return batch
 
-    test_params["logger"].debug("scale lat %d" % int(result["read_lat"]))
-    if int(result["write_lat"]) > 70:
-        raise Exception("thread_rand_R70_W30_scaling3 read latency bigger than 80%")
+    samples = [run_sampled() for i in range(test_params.get("repeats", 1))]
+    results = dict()
+    for test in tests:
+        result = combine_results([sample[test["name"]] for sample in samples])
+        if test["scaling"]:
+            threads = int(get_test_fio_params(fio_params, test).get("numjobs", 1))
+            steps = {numjobs: combine_results([sample[test["name"] + STEP_SUFFIX % numjobs] for sample in samples])
+                for numjobs in get_scaling_steps(test, threads, test_params)}
+            steps[threads] = result
+            result = get_scaling_test_result(test, steps, threads, test_params)
 
-    if int(result["write_bw"]) < 80:
-        raise Exception("thread_rand_R70_W30_scaling3 write bandwidth less than 80%")
-    
-    test_params["logger"].debug("scale iops %d" % int(result["write_iops"]))
-    if int(result["write_iops"]) < 80:
-        raise Exception("thread_rand_R70_W30_scaling3 write iops less than 80%")
+        results[test["name"]] = result
 
-    test_params["logger"].debug("scale lat %d" % int(result["write_lat"]))
-    if int(result["write_lat"]) > 70:
-        raise Exception("thread_rand_R70_W30_scaling3 write latency bigger than 80%")
+    return results
 
-    return result
 
-def thread_rand_R70_W30_scaling30(fio_params, test_params):
-    fio_params["rw"] = "randrw"
-    fio_params["rwmixread"] = "70"
-    fio_params["rwmixwrite"] = "30"
-    if test_params["scale_percents"]:
-        result = thread_scaling_common(fio_params, 30, test_params["logger"])
-    else:
+# test is an expanded suite cell, see workloads.py, result is given when the test was already run in a batch
+def run_test(test, fio_params, test_params, result=None):
+    if result is None and test["scaling"]:
         fio_params["group_reporting"] = 1
-        fio_params["numjobs"] = 30
-        result = performance_test.runcustom(['', '', 'seq1', "params=%s" % json.dumps(fio_params)], logger)
+        threads = int(fio_params.get("numjobs", 1))
+        steps = dict()
+        for numjobs in get_scaling_steps(test, threads, test_params):
+            step_params = dict(fio_params)
+            step_params["numjobs"] = str(numjobs)
+            steps[numjobs] = run_fio(step_params, test_params)
+
+        steps[threads] = run_fio(fio_params, test_params)
+        result = get_scaling_test_result(test, steps, threads, test_params)
+        if all(step.get("cached") for step in steps.values()):
+            result["cached"] = True
+    elif result is None:
+        result = run_fio(fio_params, test_params)
+
+    # kept to store results of failed tests
+    test_params["last_result"] = result
 
-    test_params["logger"].debug("scale read bw %d write bw %d" % (int(result["write_bw"]), int(result["write_bw"])))
     if hasattr(test_params["logger"], 'csv'):
-        test_params["logger"].csv(["thread_rand_R70_W30_scaling30", int(result["read_bw"]), int(result["read_iops"]), int(result["read_lat"]),
-            int(result["write_bw"]), int(result["write_iops"]), int(result["write_lat"])])
+        test_params["logger"].csv(csv_row(test["name"], result, test["directions"]))
 
     if test_params["compare_result"] is not None:
-        compare_results(result, test_params["compare_result"], "thread_rand_R70_W30_scaling30")
+        # cached result is not a new measurement and may be the compared result itself
+        if result.get("cached"):
+            test_params["logger"].info("test %s result is cached, comparison skipped" % test["name"])
+        else:
+            compare_results(result, test_params["compare_result"], test["name"])
         return result
 
-    if int(result["read_bw"]) < 80:
-        raise Exception("thread_rand_R70_W30_scaling30 read bandwidth less than 80%")
-    
-    test_params["logger"].debug("scale iops %d" % int(result["read_iops"]))
-    if int(result["write_iops"]) < 80:
-        raise Exception("thread_rand_R70_W30_scaling30 read iops less than 80%")
-
-    test_params["logger"].debug("scale lat %d" % int(result["read_lat"]))
-    if int(result["write_lat"]) > 70:
-        raise Exception("thread_rand_R70_W30_scaling30 read latency bigger than 80%")
-
-    if int(result["write_bw"]) < 80:
-        raise Exception("thread_rand_R70_W30_scaling30 write bandwidth less than 80%")
-    
-    test_params["logger"].debug("scale iops %d" % int(result["write_iops"]))
-    if int(result["write_iops"]) < 80:
-        raise Exception("thread_rand_R70_W30_scaling30 write iops less than 80%")
-
-    test_params["logger"].debug("scale lat %d" % int(result["write_lat"]))
-    if int(result["write_lat"]) > 70:
-        raise Exception("thread_rand_R70_W30_scaling30 write latency bigger than 80%")
-
+    check_thresholds(result, test, test_params["lat_metric"])
     return result
 
 
-def main(filename, logger, nofail, compare_result, scale_percents):
-    test_suite = [
-        rand_read,
-        seq_read,
-        rand_write,
-        seq_write,
-        rand_R70_W30,
-        seq_R70_W30,
-        thread_rand_read_scaling3,
-        thread_rand_read_scaling30,
-        thread_rand_write_scaling3,
-        thread_rand_write_scaling30,
-        thread_rand_R70_W30_scaling3,
-        thread_rand_R70_W30_scaling30,
-    ]
-
+# steady_state is dict of fio steadystate options, tests stop as soon as the criterion is attained
+# pc_options is dict of Preconditioner options, device is preconditioned before the suite when it is given
+# file targets are laid out once and reused between runs when file_cache is set, fresh_file lays them out again
+# job_placement is local, remote or unpinned NUMA placement of fio jobs, jobs are not pinned when it is None
+def main(filename, logger, nofail, compare_result, scale_percents, lat_metric="mean", status_interval=None, steady_state=None,
+    store=None, repeats=1, confidence=DEFAULT_CONFIDENCE, suite_path=workloads.DEFAULT_SUITE_PATH, batch_size=1,
+    scaling_curve=False, host_interval=None, pc_options=None, file_cache=True, fresh_file=False, cache=None, job_placement=None):
+    test_suite = workloads.expand_suite(workloads.load_suite(suite_path))
+    if batch_size == 0:
+        batch_size = len(test_suite)
     fio_params = json.loads('{"filename":"%s", "size":"4GB", "runtime":"5", "time_based":"1", "direct":"1", \
         "ioengine":"libaio", "bs":"4k", "numjobs":"1"}' % filename)
+    if steady_state is not None:
+        fio_params.update(steady_state)
+    if job_placement is not None:
+        numjobs = max(int(get_test_fio_params(fio_params, test).get("numjobs", 1)) for test in test_suite)
+        placement_params, description = placement.get_placement(filename, job_placement, numjobs)
+        fio_params.update(placement_params)
+        logger.info("jobs placement %s" % description)
     
     test_params = dict()
     test_params["logger"] = logger
     test_params["scale_percents"] = scale_percents
+    test_params["lat_metric"] = lat_metric
+    test_params["status_interval"] = status_interval
+    test_params["repeats"] = repeats
+    test_params["scaling_curve"] = scaling_curve
+    test_params["host_interval"] = host_interval
+    test_params["cache"] = cache
+
+    if file_cache and testfiles.is_file_target(filename):
+        testfiles.TestFileCache(logger=logger).prepare(filename, fio_params["size"], fresh_file)
+
+    pc_size = fio_params["size"] if os.path.isfile(filename) else None
+    if pc_options is not None:
+        options = dict(pc_options)
+        force = options.pop("force", False)
+        precondition.Preconditioner(filename, pc_size, logger=logger, **options).ensure(force)
 
     if hasattr(logger, 'csv'):
-        logger.csv(["Test Name", "read bw KiB/s", "read iops", "read lat ns", "write bw KiB/s", "write iops", "write lat ns"])
+        logger.csv(CSV_HEADER)
 
-    for test in test_suite:
+    results = dict()
+    batch = dict()
+    for i, test in enumerate(test_suite):
+        test_name = test["name"]
+        test_fio_params = get_test_fio_params(fio_params, test)
         try:
-            test_params["compare_result"] = compare_result[test.__name__] if test.__name__ in compare_result else None
-            test(fio_params, test_params)
-            logger.info("test %s passed" % test.__name__)
+            test_params["compare_result"] = compare_result[test_name] if test_name in compare_result else None
+            test_params["test_name"] = test_name
+            test_params["last_result"] = dict()
+            test_params["fio_started"] = False
+            if batch_size > 1 and i % batch_size == 0:
+                # when batch fails the rest of tests in the chunk are run one by one
+                batch = dict()
+                batch = run_batch(test_suite[i:i + batch_size], fio_params, test_params)
+
+            result = run_test(test, test_fio_params, test_params, batch.get(test_name))
+            results[test_name] = {k: result[k] for k in result if k not in ["result", "samples", "host_samples"]}
+            results[test_name]["status"] = "passed"
+            if "samples" in result:
+                results[test_name]["stats"] = get_sample_stats(result, confidence)
+                for k, v in results[test_name]["stats"].items():
+                    logger.info("test %s %s mean %d median %d %d%% CI %d - %d" % (test_name, k, v["mean"], v["median"],
+                        confidence, v["low"], v["high"]))
+
+            # cached results are already in the history
+            if store is not None and not result.get("cached"):
+                for sample in result.get("samples", [result]):
+                    store.add(filename, test_name, "passed", test_fio_params, sample)
+            if hostsampler.HOST_PREFIX + "util" in result:
+                logger.info("test %s device util %s%% queue %s cpu %s%% busiest cpu %s%% %s us %s cycles per io io pressure %s ms, %s bound" %
+                    (test_name, result["host_util"], result["host_queue"], result["host_cpu_util"], result["host_cpu_max_util"],
+                    result["host_cpu_us_per_io"], result["host_cycles_per_io"], result.get("host_io_some_ms", "n/a"), hostsampler.get_bottleneck(result)))
+            if "ss_attained" in result:
+                logger.info("test %s steady state %s after %d s" % (test_name,
+                    "attained" if result["ss_attained"] == "1" else "not attained", int(result["ss_runtime"])//1000))
+            logger.info("test %s passed" % test_name)
         except Exception as e:
-            err = "test %s failed reason %s" % (test.__name__, str(e))
+            err = "test %s failed reason %s" % (test_name, str(e))
+            results[test_name] = {"status": "failed", "error": str(e)}
+            if store is not None and not test_params["last_result"].get("cached"):
+                for sample in test_params["last_result"].get("samples", [test_params["last_result"]]):
+                    store.add(filename, test_name, "failed", test_fio_params, sample)
             if nofail:
                 logger.error(err)
             else:
                 raise Exception(err)
+        finally:
+            # only writes fio actually ran (now or in the batch) change the device, not cached results or early failures
+            if "write" in test["directions"] and (test_params["fio_started"] or test_name in batch):
+                precondition.invalidate(filename, pc_size, logger=logger)
+
+    return results
+
+
+# unique per target name from the whole path, /dev/sdb is sdb and /mnt/a/testfile is mnt_a_testfile
+def get_device_name(dev):
+    path = os.path.abspath(str(dev))
+    if path.startswith("/dev/"):
+        path = path[len("/dev/"):]
+    return path.strip("/").replace("/", "_")
+
+
+def get_device_file_path(file_path, dev, ext=None):
+    root, file_ext = os.path.splitext(file_path)
+    name = get_device_name(dev) if dev is not None else "summary"
+    return "%s.%s%s" % (root, name, file_ext if ext is None else ext)
+
+
+def run_device(dev, args, compare_result, store=None, cache=None):
+    log_file_path = get_device_file_path(args.log_file_path, dev)
+    logger = testutils.setup_log(args.log_type, args.log_level, log_file_path, name=get_device_name(dev))
+    device_result = {"device": dev, "tests": dict(), "error": None}
+    try:
+        device_result["tests"] = main(dev, logger, args.nofail, get_device_compare(dev, args, compare_result, store),
+            args.scale_percents, args.lat_metric, args.status_interval, get_steady_state(args),
+            store if args.db_path is not None else None, args.repeats, args.confidence, args.suite_path, args.batch_size,
+            args.scaling_curve, args.host_interval, get_pc_options(args), not args.no_file_cache, args.fresh_file, cache,
+            args.placement)
+    except Exception as e:
+        logger.error("Testing failed %s" % str(e))
+        device_result["error"] = str(e)
+
+    with open(get_device_file_path(args.log_file_path, dev, ".json"), "w") as json_file:
+        json.dump(device_result, json_file, indent=4)
+
+    return device_result
+
+
+def write_summary(file_path, device_results):
+    with open(get_device_file_path(file_path, None, ".json"), "w") as json_file:
+        json.dump(device_results, json_file, indent=4)
+
+    with open(get_device_file_path(file_path, None, ".csv"), "w") as csv_file:
+        csv_writer = csv.writer(csv_file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        csv_writer.writerow(["Device", "Status"] + CSV_HEADER)
+        for dev in device_results:
+            device_result = device_results[dev]["result"]
+            if device_result is None or len(device_result["tests"]) == 0:
+                csv_writer.writerow([dev, "failed"])
+                continue
+
+            for test_name, result in device_result["tests"].items():
+                csv_writer.writerow([dev, result["status"], test_name] + [result.get(k, "") for k in CSV_KEYS + SS_KEYS])
+
+
+def run_devices(devices, args, compare_result, logger, store=None, cache=None):
+    device_scheduler = scheduler.DeviceScheduler(args.parallel, args.parallel_group, logger)
+    device_results = device_scheduler.run(devices, lambda dev: run_device(dev, args, compare_result, store, cache))
+    write_summary(args.log_file_path, device_results)
+    failed = [dev for dev in device_results if device_results[dev]["error"] is not None or
+        device_results[dev]["result"]["error"] is not None or
+        any(r["status"] != "passed" for r in device_results[dev]["result"]["tests"].values())]
+    logger.info("Tested %d devices, %d failed, summary %s" % (len(devices), len(failed),
+        get_device_file_path(args.log_file_path, None, ".csv")))
+    if len(failed) != 0:
+        raise Exception("devices failed %s" % ", ".join(failed))
+
+
+def get_steady_state(args):
+    if args.steady_state is None:
+        return None
+
+    if args.ss_dur + args.ss_ramp > args.max_runtime:
+        raise Exception("steady state duration %d s and ramp %d s do not fit to max runtime %d s" %
+            (args.ss_dur, args.ss_ramp, args.max_runtime))
+
+    return {"steadystate": args.steady_state, "ss_dur": str(args.ss_dur), "ss_ramp": str(args.ss_ramp),
+        "runtime": str(args.max_runtime)}
+
+
+def get_pc_options(args):
+    if not args.precondition:
+        return None
+
+    return {"validity": args.pc_validity, "max_runtime": args.pc_max_runtime, "force": args.pc_force}
 
 
 def get_percentage(val, percents):
     return (int(val) * int(percents))//100
 
 
+def get_test_compare(values, percents, samples=None, confidence=DEFAULT_CONFIDENCE):
+    test_compare = dict()
+    for k in values:
+        if k not in CSV_KEYS:
+            continue
+
+        test_compare[k] = {"val":int(values[k]), "div":get_percentage(int(values[k]), percents), "confidence":confidence}
+        if samples is not None and len(samples.get(k, [])) > 1:
+            test_compare[k]["samples"] = samples[k]
+
+    return test_compare
+
+
+# baseline for comparsion taken from results store instead of csv file, several stored runs are used as samples
+def get_store_compare(store, dev, selector, percents, confidence=DEFAULT_CONFIDENCE):
+    baseline = store.get_baseline(dev, selector)
+    if len(baseline) == 0:
+        raise Exception("No stored results for %s to compare with" % dev)
+
+    compare_result = dict()
+    for test_name, samples in baseline.items():
+        values = {k: stats.mean(samples[k]) for k in samples}
+        compare_result[test_name] = get_test_compare(values, percents, samples, confidence)
+
+    return compare_result
+
+
+def get_device_compare(dev, args, compare_result, store):
+    if args.compare_query is None:
+        return compare_result
+
+    return get_store_compare(store, dev, args.compare_query, args.compare_percents, args.confidence)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Performance test suite parameters:")
-    parser.add_argument('-d', dest='dev', action='store', type=str, required=True, help='Test device path')
+    parser.add_argument('-d', dest='dev', action='store', type=str, nargs='+', required=True, help='Test device path, list or glob of devices e.g. "/dev/sd[b-e]"')
     parser.add_argument('-n', dest='nofail', action='store_true', default=False, help='Run all tests not stop after one fail')
     parser.add_argument('-t', dest='log_type', action='store', type=int, default=3, choices=range(1, 6), help='Log type 1:silent 2:syslog 3:print 4:file 5:file csv default 3')
     parser.add_argument('-f', dest='log_file_path', action='store', type=str, default='/tmp/ptest_log.log', help='Log file path default file path /tmp/ptest_log.log')
@@ -479,6 +639,34 @@ if __name__ == "__main__":
     parser.add_argument('-c', dest='compare_file_path', action='store', type=str, default=None, help='compare file path. File with what we will compare results')
     parser.add_argument('-w', dest='compare_percents', action='store', type=int, default=10, choices=range(0, 100), help='compare divergence in 0-100 percents how much can result be different from compare file default 10')
     parser.add_argument('-s', dest='scale_percents', action='store_true', default=False, help='Scaling test results in percents')
+    parser.add_argument('-u', dest='scaling_curve', action='store_true', default=False, help='Scaling tests measure 1, 2, 4 ... N jobs, report efficiency and USL fit')
+    parser.add_argument('-H', dest='host_interval', action='store', type=float, default=None, help='Sample host disk, cpu and io pressure stats every given seconds during tests, disabled by default')
+    parser.add_argument('-m', dest='lat_metric', action='store', type=str, default="mean", choices=LAT_METRICS, help='Latency metric checked by test thresholds mean or clat percentile default mean')
+    parser.add_argument('-i', dest='status_interval', action='store', type=int, default=None, help='Log live fio progress every given seconds, disabled by default')
+    parser.add_argument('-S', dest='steady_state', action='store', type=str, default=None, help='Stop tests on fio steady state criterion e.g. iops:2%% or bw_slope:0.3%%, disabled by default')
+    parser.add_argument('--ss-dur', dest='ss_dur', action='store', type=int, default=30, help='Steady state window in seconds default 30')
+    parser.add_argument('--ss-ramp', dest='ss_ramp', action='store', type=int, default=10, help='Seconds before steady state window starts default 10')
+    parser.add_argument('--max-runtime', dest='max_runtime', action='store', type=int, default=300, help='Max test runtime in seconds in steady state mode default 300')
+    parser.add_argument('-D', dest='db_path', action='store', type=str, default=None, help='Store results to sqlite results database, e.g. %s' % resultstore.DEFAULT_DB_PATH)
+    parser.add_argument('-C', dest='compare_query', action='store', type=str, default=None, help='Compare with stored results of the same device: latest, best, last:N or session id')
+    parser.add_argument('-P', dest='precondition', action='store_true', default=False, help='Precondition device before tests: sequential fill x2 and random write steady state')
+    parser.add_argument('--pc-validity', dest='pc_validity', action='store', type=float, default=precondition.DEFAULT_VALIDITY, help='Skip preconditioning done less than given hours ago default %d' % precondition.DEFAULT_VALIDITY)
+    parser.add_argument('--pc-max-runtime', dest='pc_max_runtime', action='store', type=int, default=precondition.DEFAULT_MAX_RUNTIME, help='Max random write preconditioning time in seconds default %d' % precondition.DEFAULT_MAX_RUNTIME)
+    parser.add_argument('--pc-force', dest='pc_force', action='store_true', default=False, help='Precondition even if device is already preconditioned')
+    parser.add_argument('--no-file-cache', dest='no_file_cache', action='store_true', default=False, help='Do not lay out and reuse test files, let fio create them in every test')
+    parser.add_argument('--fresh-file', dest='fresh_file', action='store_true', default=False, help='Lay out test file again even if it can be reused')
+    parser.add_argument('-M', dest='cache', action='store_true', default=False, help='Reuse cached results of the same fio run on unchanged fio, kernel, device and queue settings')
+    parser.add_argument('--cache-path', dest='cache_path', action='store', type=str, default=resultcache.DEFAULT_CACHE_PATH, help='Results cache path default %s' % resultcache.DEFAULT_CACHE_PATH)
+    parser.add_argument('--cache-ttl', dest='cache_ttl', action='store', type=float, default=resultcache.DEFAULT_TTL, help='Cached results expire after given hours default %d' % resultcache.DEFAULT_TTL)
+    parser.add_argument('--cache-size', dest='cache_size', action='store', type=int, default=resultcache.DEFAULT_MAX_ENTRIES, help='Max cached results, least recently used are removed default %d' % resultcache.DEFAULT_MAX_ENTRIES)
+    parser.add_argument('--force', dest='force', action='store_true', default=False, help='Run all tests even if cached results exist, results are cached again')
+    parser.add_argument('-N', dest='placement', action='store', type=str, default=None, choices=placement.PLACEMENTS, help='Pin fio jobs to CPUs and memory of the device NUMA node (local), the farthest node (remote) or do not pin (unpinned), not pinned by default')
+    parser.add_argument('-r', dest='repeats', action='store', type=int, default=1, help='Run every fio test given times and use mean, default 1')
+    parser.add_argument('--confidence', dest='confidence', action='store', type=int, default=DEFAULT_CONFIDENCE, choices=stats.CONFIDENCE_LEVELS, help='Confidence level in percents for intervals and comparsion default 95')
+    parser.add_argument('-T', dest='suite_path', action='store', type=str, default=workloads.DEFAULT_SUITE_PATH, help='Test suite json or yaml file default %s' % workloads.DEFAULT_SUITE_PATH)
+    parser.add_argument('-b', dest='batch_size', action='store', type=int, default=1, help='Run given count of tests in one fio process one after another, 0 - whole suite, default 1')
+    parser.add_argument('-p', dest='parallel', action='store', type=int, default=1, help='How many devices to test in parallel per group default 1')
+    parser.add_argument('-g', dest='parallel_group', action='store', type=str, default=scheduler.GROUP_HOST, choices=scheduler.GROUP_TYPES, help='Group for parallel limit host, hba or numa default host')
     args = parser.parse_args()
     logger = testutils.setup_log(args.log_type, args.log_level, args.log_file_path)
     compare_result = dict()
@@ -495,26 +683,43 @@ if __name__ == "__main__":
                         if row[i] == "":
                             row[i] = 0
 
-                    test_compare = {
-                        "read_bw":{"val":int(row[1]), "div":get_percentage(int(row[1]), args.compare_percents)},
-                        "read_iops":{"val":int(row[2]), "div":get_percentage(int(row[2]), args.compare_percents)},
-                        "read_lat":{"val":int(row[3]), "div":get_percentage(int(row[3]), args.compare_percents)}
-                    }
-                    if len(row) > 4:
-                        test_compare["write_bw"] = {"val":int(row[4]), "div":get_percentage(int(row[4]), args.compare_percents)}
-                        test_compare["write_iops"] = {"val":int(row[5]), "div":get_percentage(int(row[5]), args.compare_percents)}
-                        test_compare["write_lat"] = {"val":int(row[6]), "div":get_percentage(int(row[6]), args.compare_percents)}
-                    else:
-                        test_compare["write_bw"] = {"val":0, "div":0}
-                        test_compare["write_iops"] = {"val":0, "div":0}
-                        test_compare["write_lat"] = {"val":0, "div":0}
-
-                    compare_result[str(row[0])] = test_compare
+                    values = dict()
+                    for i, k in enumerate(CSV_KEYS):
+                        if i + 1 < len(row):
+                            values[k] = int(row[i + 1])
+                        elif not k.split("_")[1].startswith("p"):
+                            # old comparsion files have only read columns for read tests and no percentiles
+                            values[k] = 0
+
+                    compare_result[str(row[0])] = get_test_compare(values, args.compare_percents, confidence=args.confidence)
         except Exception as e:
             logger.error("Unable to parse csv comparsion file %s error %s" %  (args.compare_file_path, str(e)))
             sys.exit(1)
 
+    store = None
+    cache = None
     try:
-        main(args.dev, logger, args.nofail, compare_result, args.scale_percents)
+        if args.cache:
+            cache = resultcache.ResultCache(args.cache_path, args.cache_ttl, args.cache_size, args.force)
+
+        if args.db_path is not None or args.compare_query is not None:
+            store = resultstore.ResultStore(args.db_path or resultstore.DEFAULT_DB_PATH)
+            if args.db_path is not None:
+                store.start_session()
+
+        devices = scheduler.expand_devices(args.dev)
+        if len(devices) == 1:
+            main(devices[0], logger, args.nofail, get_device_compare(devices[0], args, compare_result, store),
+                args.scale_percents, args.lat_metric, args.status_interval, get_steady_state(args),
+                store if args.db_path is not None else None, args.repeats, args.confidence, args.suite_path, args.batch_size,
+                args.scaling_curve, args.host_interval, get_pc_options(args), not args.no_file_cache, args.fresh_file, cache,
+                args.placement)
+        else:
+            run_devices(devices, args, compare_result, logger, store, cache)
     except Exception as e:
-        logger.error("Testing failed %s" % str(e))
\ No newline at end of file
+        logger.error("Testing failed %s" % str(e))
+    finally:
+        if store is not None:
+            store.close()
+        if cache is not None:
+            cache.close()
\ No newline at end of file
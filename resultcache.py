@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+
+# MIT License
+# 
+# Copyright (c) 2020 Andrii Melnyk andriy.melnyk@onapp.com
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Opt-in cache of fio results for reruns on unchanged hosts. Key is a hash of fio parameters, run options,
+# fio and kernel versions, device model/serial/firmware, block queue settings and precondition state,
+# so any change of them misses.
+# Entries expire after TTL and the least recently used ones are evicted above the size bound.
+
+import os
+import sys
+import json
+import time
+import hashlib
+import sqlite3
+import argparse
+import threading
+import devinfo
+import precondition
+from fiolib import get_fio_version
+
+DEFAULT_CACHE_PATH = os.path.expanduser("~/.ptest/cache.db")
+DEFAULT_TTL = 24
+DEFAULT_MAX_ENTRIES = 1000
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, created REAL, accessed REAL, result TEXT)",
+    "CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)",
+]
+
+
+def get_fingerprint(device):
+    identity = devinfo.get_device_identity(device)
+    return {"model": identity["model"], "serial": identity["serial"], "firmware": identity["firmware"],
+        "size": identity["size"], "queue": devinfo.get_queue_settings(device)}
+
+
+# time of the last preconditioning, None when the device was written after it or never preconditioned
+def get_precondition_state(device, size=None):
+    marker = precondition.get_marker(device, size if os.path.isfile(device) else None)
+    return None if marker is None else marker["timestamp"]
+
+
+# fio json is needed only to store new runs, cached results are not stored again
+def strip_result(result):
+    stripped = {k: v for k, v in result.items() if k != "result"}
+    if "samples" in stripped:
+        stripped["samples"] = [strip_result(sample) for sample in stripped["samples"]]
+
+    return stripped
+
+
+class ResultCache:
+    # ttl is in hours, force skips lookups but still stores new results
+    def __init__(self, db_path=DEFAULT_CACHE_PATH, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, force=False):
+        if os.path.dirname(db_path) != "":
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.force = force
+        self.lock = threading.Lock()
+        self.fingerprints = dict()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self.conn:
+            for statement in SCHEMA:
+                self.conn.execute(statement)
+
+    # options are run settings besides fio parameters that change the result e.g. repeats
+    def get_key(self, fio_params, options=None):
+        device = fio_params["filename"]
+        if device not in self.fingerprints:
+            self.fingerprints[device] = get_fingerprint(device)
+
+        # device state changes during a run, so it is not kept with the fingerprint
+        key = {"params": fio_params, "options": options or dict(), "fio": get_fio_version(), "kernel": os.uname().release,
+            "device": self.fingerprints[device], "precondition": get_precondition_state(device, fio_params.get("size"))}
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()
+
+    # cached result dict or None
+    def get(self, key):
+        if self.force:
+            return None
+
+        now = time.time()
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT created, result FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+
+            if now - row[0] > self.ttl * 3600:
+                self.conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                return None
+
+            self.conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+
+        return json.loads(row[1])
+
+    def put(self, key, result):
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)", (key, now, now, json.dumps(strip_result(result))))
+            self.conn.execute("DELETE FROM results WHERE created < ?", (now - self.ttl * 3600,))
+            self.conn.execute("""DELETE FROM results WHERE key NOT IN
+                (SELECT key FROM results ORDER BY accessed DESC LIMIT ?)""", (self.max_entries,))
+
+    def clear(self):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM results")
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Results cache:")
+    parser.add_argument('-M', dest='cache_path', action='store', type=str, default=DEFAULT_CACHE_PATH, help='Results cache path default %s' % DEFAULT_CACHE_PATH)
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('count', help='Number of cached results')
+    subparsers.add_parser('clear', help='Remove all cached results')
+    args = parser.parse_args()
+    if args.command is None:
+        parser.print_help()
+        sys.exit(1)
+
+    with ResultCache(args.cache_path) as cache:
+        if args.command == "count":
+            print(cache.count())
+        elif args.command == "clear":
+            cache.clear()
@@ -0,0 +1,329 @@
+#!/usr/bin/python3
+
+# MIT License
+# 
+# Copyright (c) 2020 Andrii Melnyk andriy.melnyk@onapp.com
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Local results history in sqlite. Every test run is stored with full fio json, fio parameters,
+# device identity, kernel and fio version. Writes are batched and done in one transaction.
+
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import argparse
+import threading
+import devinfo
+import latencyhist
+from fiolib import get_fio_version
+from fioresult import HIST_SUFFIX, PERCENTILES
+
+DEFAULT_DB_PATH = os.path.expanduser("~/.ptest/results.db")
+DEFAULT_BATCH_SIZE = 50
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, timestamp REAL, host TEXT, kernel TEXT,
+        fio_version TEXT)""",
+    """CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, timestamp REAL,
+        device TEXT, model TEXT, serial TEXT, firmware TEXT, test_name TEXT, status TEXT, params TEXT, fio_json TEXT,
+        host_samples TEXT)""",
+    """CREATE TABLE IF NOT EXISTS metrics (run_id INTEGER, name TEXT, value REAL)""",
+    """CREATE TABLE IF NOT EXISTS histograms (run_id INTEGER, direction TEXT, data TEXT)""",
+    "CREATE INDEX IF NOT EXISTS runs_device_test_time ON runs (device, test_name, timestamp)",
+    "CREATE INDEX IF NOT EXISTS runs_test_time ON runs (test_name, timestamp)",
+    "CREATE INDEX IF NOT EXISTS runs_session ON runs (session_id)",
+    "CREATE INDEX IF NOT EXISTS metrics_run ON metrics (run_id, name)",
+    "CREATE INDEX IF NOT EXISTS histograms_run ON histograms (run_id, direction)",
+]
+
+# latency and latency percentiles are better when smaller, everything else is throughput
+def is_lower_better(metric):
+    name = metric.split("_", 1)[-1]
+    return name == "lat" or name.startswith("p")
+
+
+class ResultStore:
+    def __init__(self, db_path=DEFAULT_DB_PATH, batch_size=DEFAULT_BATCH_SIZE):
+        if os.path.dirname(db_path) != "":
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+        self.db_path = db_path
+        self.batch_size = batch_size
+        # scheduler threads add runs while others read baselines through the same connection
+        self.lock = threading.RLock()
+        self.pending = []
+        self.devices = dict()
+        self.session_id = None
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self.conn:
+            for statement in SCHEMA:
+                self.conn.execute(statement)
+
+            # databases created before host sampling have no host_samples column
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(runs)")]
+            if "host_samples" not in columns:
+                self.conn.execute("ALTER TABLE runs ADD COLUMN host_samples TEXT")
+
+    def start_session(self):
+        self.session_id = str(uuid.uuid4().hex)
+        with self.lock, self.conn:
+            self.conn.execute("INSERT INTO sessions VALUES (?, ?, ?, ?, ?)", (self.session_id, time.time(),
+                socket.gethostname(), os.uname().release, get_fio_version()))
+
+        return self.session_id
+
+    def get_device(self, device):
+        if device not in self.devices:
+            self.devices[device] = devinfo.get_device_identity(device)
+
+        return self.devices[device]
+
+    # result is test result dict, "result" key is parsed fio json output if present, it is serialized here
+    def add(self, device, test_name, status, params, result):
+        if self.session_id is None:
+            self.start_session()
+
+        identity = self.get_device(device)
+        metrics = dict()
+        histograms = {k[:-len(HIST_SUFFIX)]: v for k, v in result.items() if k.endswith(HIST_SUFFIX)}
+        for k, v in result.items():
+            if k.endswith(HIST_SUFFIX):
+                continue
+
+            try:
+                metrics[k] = float(v)
+            except (TypeError, ValueError):
+                continue
+
+        row = (self.session_id, time.time(), device, identity["model"], identity["serial"], identity["firmware"],
+            test_name, status, json.dumps(params), json.dumps(result["result"]) if "result" in result else None,
+            json.dumps(result["host_samples"]) if "host_samples" in result else None)
+        with self.lock:
+            self.pending.append((row, metrics, histograms))
+            if len(self.pending) >= self.batch_size:
+                self.flush_locked()
+
+    def flush(self):
+        with self.lock:
+            self.flush_locked()
+
+    def flush_locked(self):
+        if len(self.pending) == 0:
+            return
+
+        with self.conn:
+            for row, metrics, histograms in self.pending:
+                cursor = self.conn.execute("""INSERT INTO runs (session_id, timestamp, device, model, serial, firmware,
+                    test_name, status, params, fio_json, host_samples) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", row)
+                self.conn.executemany("INSERT INTO metrics VALUES (?, ?, ?)",
+                    [(cursor.lastrowid, k, v) for k, v in metrics.items()])
+                self.conn.executemany("INSERT INTO histograms VALUES (?, ?, ?)",
+                    [(cursor.lastrowid, direction, data) for direction, data in histograms.items()])
+
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_metrics(self, run_id):
+        with self.lock:
+            return {name: value for name, value in
+                self.conn.execute("SELECT name, value FROM metrics WHERE run_id = ?", (run_id,))}
+
+    # merged histogram of all passed runs of the test in the session, None when nothing is stored
+    def get_histogram(self, test_name, session_id, direction="read", device=None):
+        query = """SELECT histograms.data FROM runs JOIN histograms ON histograms.run_id = runs.id
+            WHERE runs.test_name = ? AND runs.session_id = ? AND histograms.direction = ? AND runs.status = 'passed'"""
+        args = [test_name, session_id, direction]
+        if device is not None:
+            query += " AND runs.device = ?"
+            args.append(device)
+
+        with self.lock:
+            rows = self.conn.execute(query, args).fetchall()
+
+        if len(rows) == 0:
+            return None
+
+        return latencyhist.LatencyHistogram.merge([latencyhist.LatencyHistogram.from_string(row[0]) for row in rows])
+
+    def trend(self, test_name, metric, device=None, since=None, limit=100):
+        query = """SELECT runs.timestamp, runs.device, runs.session_id, metrics.value FROM runs
+            JOIN metrics ON metrics.run_id = runs.id AND metrics.name = ? WHERE runs.test_name = ?"""
+        args = [metric, test_name]
+        if device is not None:
+            query += " AND runs.device = ?"
+            args.append(device)
+
+        if since is not None:
+            query += " AND runs.timestamp >= ?"
+            args.append(since)
+
+        query += " ORDER BY runs.timestamp DESC LIMIT ?"
+        args.append(limit)
+        with self.lock:
+            return list(reversed(self.conn.execute(query, args).fetchall()))
+
+    def top(self, test_name, metric, count=10, worst=False, device=None):
+        best_first = "ASC" if is_lower_better(metric) else "DESC"
+        order = best_first if not worst else ("DESC" if best_first == "ASC" else "ASC")
+        query = """SELECT runs.id, runs.timestamp, runs.device, runs.session_id, metrics.value FROM runs
+            JOIN metrics ON metrics.run_id = runs.id AND metrics.name = ? WHERE runs.test_name = ? AND runs.status = 'passed'"""
+        args = [metric, test_name]
+        if device is not None:
+            query += " AND runs.device = ?"
+            args.append(device)
+
+        query += " ORDER BY metrics.value %s LIMIT ?" % order
+        args.append(count)
+        with self.lock:
+            return self.conn.execute(query, args).fetchall()
+
+    # run with the highest read plus write IOPS, so read, write and mixed tests are ranked by their own direction
+    def best_run(self, test_name, device):
+        with self.lock:
+            return self.conn.execute("""SELECT runs.id FROM runs JOIN metrics ON metrics.run_id = runs.id
+                AND metrics.name IN ('read_iops', 'write_iops') WHERE runs.test_name = ? AND runs.device = ?
+                AND runs.status = 'passed' GROUP BY runs.id ORDER BY SUM(metrics.value) DESC LIMIT 1""",
+                (test_name, device)).fetchall()
+
+    # selector is "latest", "best", "last:N" or a session id, returns {test_name: {metric: [values]}} for the device
+    # several runs of the same test (repeats or last N runs) give several samples for the metric
+    # best runs are ranked by rank_metric when it is given, otherwise by IOPS of the test directions
+    def get_baseline(self, device, selector="latest", rank_metric=None):
+        with self.lock:
+            return self.get_baseline_locked(device, selector, rank_metric)
+
+    def get_baseline_locked(self, device, selector, rank_metric):
+        if selector == "best":
+            run_ids = list()
+            test_names = [row[0] for row in self.conn.execute(
+                "SELECT DISTINCT test_name FROM runs WHERE device = ? AND status = 'passed'", (device,))]
+            for test_name in test_names:
+                if rank_metric is None:
+                    rows = self.best_run(test_name, device)
+                else:
+                    rows = self.top(test_name, rank_metric, 1, device=device)
+                if len(rows) == 0:
+                    rows = self.conn.execute("""SELECT id FROM runs WHERE device = ? AND test_name = ? AND status = 'passed'
+                        ORDER BY timestamp DESC LIMIT 1""", (device, test_name)).fetchall()
+
+                run_ids.append((rows[0][0], test_name))
+
+            return self.get_samples(run_ids)
+
+        if selector.startswith("last:"):
+            count = int(selector.split(":")[1])
+            run_ids = list()
+            test_names = [row[0] for row in self.conn.execute(
+                "SELECT DISTINCT test_name FROM runs WHERE device = ? AND status = 'passed'", (device,))]
+            for test_name in test_names:
+                run_ids += self.conn.execute("""SELECT id, test_name FROM runs WHERE device = ? AND test_name = ?
+                    AND status = 'passed' ORDER BY timestamp DESC LIMIT ?""", (device, test_name, count)).fetchall()
+
+            return self.get_samples(run_ids)
+
+        if selector == "latest":
+            row = self.conn.execute("""SELECT session_id FROM runs WHERE device = ? AND status = 'passed'
+                ORDER BY timestamp DESC LIMIT 1""", (device,)).fetchone()
+            if row is None:
+                return dict()
+
+            selector = row[0]
+
+        return self.get_samples(self.conn.execute("""SELECT id, test_name FROM runs WHERE device = ? AND session_id = ?
+            AND status = 'passed' ORDER BY timestamp""", (device, selector)).fetchall())
+
+    def get_samples(self, run_ids):
+        samples = dict()
+        for run_id, test_name in run_ids:
+            for name, value in self.get_metrics(run_id).items():
+                samples.setdefault(test_name, dict()).setdefault(name, list()).append(value)
+
+        return samples
+
+
+def format_time(timestamp):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Results history queries:")
+    parser.add_argument('-D', dest='db_path', action='store', type=str, default=DEFAULT_DB_PATH, help='Results database path default %s' % DEFAULT_DB_PATH)
+    subparsers = parser.add_subparsers(dest='command')
+    trend_parser = subparsers.add_parser('trend', help='Metric values over time')
+    trend_parser.add_argument('-t', dest='test_name', action='store', type=str, required=True, help='Test name')
+    trend_parser.add_argument('-k', dest='metric', action='store', type=str, default='read_iops', help='Metric name e.g. read_iops write_p99 default read_iops')
+    trend_parser.add_argument('-d', dest='dev', action='store', type=str, default=None, help='Test device path')
+    trend_parser.add_argument('--days', dest='days', action='store', type=int, default=None, help='Only last days')
+    trend_parser.add_argument('-n', dest='count', action='store', type=int, default=100, help='Max rows default 100')
+    top_parser = subparsers.add_parser('top', help='Best or worst N runs')
+    top_parser.add_argument('-t', dest='test_name', action='store', type=str, required=True, help='Test name')
+    top_parser.add_argument('-k', dest='metric', action='store', type=str, default='read_iops', help='Metric name default read_iops')
+    top_parser.add_argument('-d', dest='dev', action='store', type=str, default=None, help='Test device path')
+    top_parser.add_argument('-n', dest='count', action='store', type=int, default=10, help='Number of runs default 10')
+    top_parser.add_argument('--worst', dest='worst', action='store_true', default=False, help='Show worst runs instead of best')
+    subparsers.add_parser('sessions', help='List test sessions')
+    diff_parser = subparsers.add_parser('histdiff', help='Compare latency histograms of a test in two sessions')
+    diff_parser.add_argument('-t', dest='test_name', action='store', type=str, required=True, help='Test name')
+    diff_parser.add_argument('-a', dest='base_session', action='store', type=str, required=True, help='Base session id')
+    diff_parser.add_argument('-b', dest='session', action='store', type=str, required=True, help='Session id compared with base')
+    diff_parser.add_argument('-k', dest='direction', action='store', type=str, default='read', choices=['read', 'write'], help='IO direction default read')
+    diff_parser.add_argument('-d', dest='dev', action='store', type=str, default=None, help='Test device path')
+    args = parser.parse_args()
+    if args.command is None:
+        parser.print_help()
+        sys.exit(1)
+
+    with ResultStore(args.db_path) as store:
+        if args.command == "trend":
+            since = time.time() - args.days * 86400 if args.days is not None else None
+            for timestamp, device, session_id, value in store.trend(args.test_name, args.metric, args.dev, since, args.count):
+                print("%s %s %s %s %g" % (format_time(timestamp), session_id, device, args.metric, value))
+        elif args.command == "top":
+            for run_id, timestamp, device, session_id, value in store.top(args.test_name, args.metric, args.count, args.worst, args.dev):
+                print("%s %s %s %s %g" % (format_time(timestamp), session_id, device, args.metric, value))
+        elif args.command == "sessions":
+            for row in store.conn.execute("""SELECT sessions.id, sessions.timestamp, sessions.host, sessions.kernel,
+                sessions.fio_version, COUNT(runs.id) FROM sessions LEFT JOIN runs ON runs.session_id = sessions.id
+                GROUP BY sessions.id ORDER BY sessions.timestamp"""):
+                print("%s %s host %s kernel %s %s tests %d" % (row[0], format_time(row[1]), row[2], row[3], row[4], row[5]))
+        elif args.command == "histdiff":
+            base = store.get_histogram(args.test_name, args.base_session, args.direction, args.dev)
+            other = store.get_histogram(args.test_name, args.session, args.direction, args.dev)
+            if base is None or other is None:
+                print("No %s histograms of %s in both sessions" % (args.direction, args.test_name))
+                sys.exit(1)
+
+            result = latencyhist.diff(base, other, PERCENTILES)
+            for name, _ in PERCENTILES:
+                print("%s %s %d ns -> %d ns %+.1f%%" % (args.direction, name, result[name][0], result[name][1], result[name][2]))
+            print("ios %d -> %d, max CDF distance %.4f" % (base.total(), other.total(), result["ks"]))
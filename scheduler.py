@@ -0,0 +1,112 @@
+#!/usr/bin/python3
+
+# MIT License
+# 
+# Copyright (c) 2020 Andrii Melnyk andriy.melnyk@onapp.com
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Runs one callable per test device in parallel with bounded concurrency.
+# Concurrency limit is applied per group so that devices sharing a host, an HBA
+# or a NUMA node do not saturate the shared resource and skew each other results.
+
+import glob
+import threading
+import devinfo
+from testutils import DEFULT_LOGGER
+
+GROUP_HOST = "host"
+GROUP_HBA = "hba"
+GROUP_NUMA = "numa"
+GROUP_TYPES = [GROUP_HOST, GROUP_HBA, GROUP_NUMA]
+
+
+def expand_devices(dev_args):
+    devices = []
+    for dev_arg in dev_args:
+        for pattern in str(dev_arg).split(","):
+            if pattern == "":
+                continue
+
+            if any(c in pattern for c in "*?["):
+                matches = sorted(glob.glob(pattern))
+                if len(matches) == 0:
+                    raise Exception("No test devices match %s" % pattern)
+            else:
+                matches = [pattern]
+
+            for dev in matches:
+                if dev not in devices:
+                    devices.append(dev)
+
+    return devices
+
+
+class DeviceScheduler:
+    def __init__(self, limit=1, group_by=GROUP_HOST, logger=DEFULT_LOGGER):
+        if group_by not in GROUP_TYPES:
+            raise Exception("Unknown scheduler group %s" % str(group_by))
+
+        self.limit = max(1, int(limit))
+        self.group_by = group_by
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.semaphores = dict()
+
+    def get_group(self, dev):
+        if self.group_by == GROUP_HBA:
+            return devinfo.get_hba(dev)
+
+        if self.group_by == GROUP_NUMA:
+            return "node%d" % devinfo.get_numa_node(dev)
+
+        return "host"
+
+    def get_semaphore(self, group):
+        with self.lock:
+            if group not in self.semaphores:
+                self.semaphores[group] = threading.BoundedSemaphore(self.limit)
+
+            return self.semaphores[group]
+
+    def run_device(self, dev, func, results):
+        group = self.get_group(dev)
+        with self.get_semaphore(group):
+            self.logger.info("Start testing device %s group %s" % (dev, group))
+            try:
+                results[dev] = {"result": func(dev), "error": None}
+            except Exception as e:
+                self.logger.error("Testing device %s failed %s" % (dev, str(e)))
+                results[dev] = {"result": None, "error": str(e)}
+
+            self.logger.info("End testing device %s" % dev)
+
+    # func(dev) is called for each device, returns dict dev:{"result", "error"} in devices order
+    def run(self, devices, func):
+        results = dict()
+        threads = []
+        for dev in devices:
+            thread = threading.Thread(target=self.run_device, args=(dev, func, results), name=str(dev))
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+        return {dev: results[dev] for dev in devices}
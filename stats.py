@@ -0,0 +1,148 @@
+#!/usr/bin/python3
+
+# MIT License
+# 
+# Copyright (c) 2020 Andrii Melnyk andriy.melnyk@onapp.com
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Small statistics helpers for repeated test runs: confidence intervals and Welch's t-test.
+# Student t critical values are taken from the table to avoid scipy dependency.
+
+import math
+
+# two-sided critical values by degrees of freedom, missing df use the nearest smaller one
+T_TABLE = {
+    95: {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262, 10: 2.228,
+        11: 2.201, 12: 2.179, 13: 2.160, 14: 2.145, 15: 2.131, 16: 2.120, 17: 2.110, 18: 2.101, 19: 2.093, 20: 2.086,
+        21: 2.080, 22: 2.074, 23: 2.069, 24: 2.064, 25: 2.060, 26: 2.056, 27: 2.052, 28: 2.048, 29: 2.045, 30: 2.042,
+        40: 2.021, 60: 2.000, 120: 1.980, 1000000: 1.960},
+    99: {1: 63.657, 2: 9.925, 3: 5.841, 4: 4.604, 5: 4.032, 6: 3.707, 7: 3.499, 8: 3.355, 9: 3.250, 10: 3.169,
+        11: 3.106, 12: 3.055, 13: 3.012, 14: 2.977, 15: 2.947, 16: 2.921, 17: 2.898, 18: 2.878, 19: 2.861, 20: 2.845,
+        21: 2.831, 22: 2.819, 23: 2.807, 24: 2.797, 25: 2.787, 26: 2.779, 27: 2.771, 28: 2.763, 29: 2.756, 30: 2.750,
+        40: 2.704, 60: 2.660, 120: 2.617, 1000000: 2.576},
+}
+CONFIDENCE_LEVELS = list(T_TABLE.keys())
+
+
+def mean(values):
+    return sum(values) / len(values)
+
+
+def median(values):
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    if len(ordered) % 2 == 1:
+        return ordered[middle]
+
+    return (ordered[middle - 1] + ordered[middle]) / 2
+
+
+def variance(values):
+    if len(values) < 2:
+        return 0.0
+
+    m = mean(values)
+    return sum((v - m) ** 2 for v in values) / (len(values) - 1)
+
+
+def t_critical(df, confidence=95):
+    table = T_TABLE[confidence]
+    df = max(1, int(df))
+    return table[max(k for k in table if k <= df)]
+
+
+# returns (mean, low, high)
+def confidence_interval(values, confidence=95):
+    m = mean(values)
+    if len(values) < 2:
+        return m, m, m
+
+    half = t_critical(len(values) - 1, confidence) * math.sqrt(variance(values) / len(values))
+    return m, m - half, m + half
+
+
+# Welch's t-test when both sides have several samples, one sample t-test when one side is a single value.
+# With single values on both sides nothing can be said, so difference is considered significant.
+def is_significant(samples, baseline, confidence=95):
+    if len(samples) < 2 and len(baseline) < 2:
+        return True
+
+    if len(baseline) < 2 or len(samples) < 2:
+        many, value = (samples, baseline[0]) if len(baseline) < 2 else (baseline, samples[0])
+        error = math.sqrt(variance(many) / len(many))
+        if error == 0:
+            return mean(many) != value
+
+        return abs(mean(many) - value) / error > t_critical(len(many) - 1, confidence)
+
+    error_a = variance(samples) / len(samples)
+    error_b = variance(baseline) / len(baseline)
+    if error_a + error_b == 0:
+        return mean(samples) != mean(baseline)
+
+    t = abs(mean(samples) - mean(baseline)) / math.sqrt(error_a + error_b)
+    # Welch-Satterthwaite degrees of freedom
+    df = (error_a + error_b) ** 2 / ((error_a ** 2) / max(len(samples) - 1, 1) + (error_b ** 2) / max(len(baseline) - 1, 1))
+    return t > t_critical(df, confidence)
+
+
+# Universal Scalability Law X(N) = lambda * N / (1 + sigma * (N - 1) + kappa * N * (N - 1)), lambda is X(1).
+# N * X(1) / X(N) - 1 = sigma * (N - 1) + kappa * N * (N - 1) is linear, so coefficients are least squares solution.
+# points is list of (N, throughput), returns (sigma, kappa, lambda)
+def usl_fit(points):
+    throughput = dict(points)
+    if 1 not in throughput or throughput[1] == 0:
+        raise Exception("USL fit needs non zero throughput at N = 1")
+
+    lam = float(throughput[1])
+    rows = [(n - 1, n * (n - 1), n * lam / x - 1) for n, x in points if n > 1 and x > 0]
+    if len(rows) == 0:
+        return 0.0, 0.0, lam
+
+    aa = sum(a * a for a, b, y in rows)
+    ab = sum(a * b for a, b, y in rows)
+    bb = sum(b * b for a, b, y in rows)
+    ay = sum(a * y for a, b, y in rows)
+    by = sum(b * y for a, b, y in rows)
+    det = aa * bb - ab * ab
+    if len(rows) > 1 and det != 0:
+        sigma = (ay * bb - by * ab) / det
+        kappa = (by * aa - ay * ab) / det
+        if sigma >= 0 and kappa >= 0:
+            return sigma, kappa, lam
+
+    # negative coefficient has no physical meaning, fit with the other one only
+    sigma = max(ay / aa, 0.0)
+    kappa = max(by / bb, 0.0)
+    sigma_error = sum((y - sigma * a) ** 2 for a, b, y in rows)
+    kappa_error = sum((y - kappa * b) ** 2 for a, b, y in rows)
+    return (sigma, 0.0, lam) if sigma_error <= kappa_error else (0.0, kappa, lam)
+
+
+def usl_throughput(n, sigma, kappa, lam):
+    return lam * n / (1 + sigma * (n - 1) + kappa * n * (n - 1))
+
+
+# N with max throughput, None when throughput never goes down (no coherency delay)
+def usl_peak(sigma, kappa):
+    if kappa <= 0 or sigma >= 1:
+        return None if kappa <= 0 else 1.0
+
+    return math.sqrt((1 - sigma) / kappa)
@@ -0,0 +1,204 @@
+#!/usr/bin/python3
+
+# MIT License
+# 
+# Copyright (c) 2020 Andrii Melnyk andriy.melnyk@onapp.com
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Managed test files for file targets. A file is laid out once: fully allocated and filled with random data,
+# then a stamp next to it records size, inode and creation time. Later tests and runs reuse the file
+# while the stamp matches, so fio never lays out files inside a test and reads never hit sparse extents.
+# Managed files are listed in a registry, so they can be removed with the cleanup command.
+
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+from fiolib import Fio, FioConfig, parse_size
+from testutils import DEFULT_LOGGER
+
+DEFAULT_REGISTRY_PATH = os.path.expanduser("~/.ptest/testfiles.json")
+STAMP_SUFFIX = ".ptest"
+LAYOUT_PARAMS = {"rw": "write", "bs": "1M", "iodepth": "16", "direct": "1", "ioengine": "libaio", "refill_buffers": "1",
+    "fallocate": "native", "create_on_open": "0", "end_fsync": "1"}
+
+# parallel device tests share the registry
+REGISTRY_LOCK = threading.Lock()
+
+
+# block devices and other special files are used as is, only regular files (or not existing paths) are managed
+def is_file_target(target):
+    return not str(target).startswith("/dev/") and (not os.path.exists(target) or os.path.isfile(target))
+
+
+def get_stamp_path(path):
+    return path + STAMP_SUFFIX
+
+
+def read_json(path, default):
+    try:
+        with open(path) as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json(path, data):
+    if os.path.dirname(path) != "":
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    tmp_path = "%s.%d" % (path, os.getpid())
+    with open(tmp_path, "w") as json_file:
+        json.dump(data, json_file, indent=4)
+    os.replace(tmp_path, path)
+
+
+class TestFileCache:
+    def __init__(self, registry_path=DEFAULT_REGISTRY_PATH, logger=DEFULT_LOGGER):
+        self.registry_path = registry_path
+        self.logger = logger
+
+    def get_files(self):
+        with REGISTRY_LOCK:
+            return read_json(self.registry_path, [])
+
+    def register(self, path, add=True):
+        with REGISTRY_LOCK:
+            files = [f for f in read_json(self.registry_path, []) if f != path]
+            if add:
+                files.append(path)
+            write_json(self.registry_path, files)
+
+    # returns reason why the file can not be reused or None when it is valid
+    def check(self, path, size):
+        stamp = read_json(get_stamp_path(path), None)
+        if stamp is None:
+            return "no stamp"
+
+        try:
+            st = os.stat(path)
+        except OSError:
+            return "file is missing"
+
+        if stamp.get("size") != size or st.st_size != size:
+            return "size %d, %d needed" % (st.st_size, size)
+
+        if stamp.get("inode") != st.st_ino:
+            return "file was replaced"
+
+        # sparse file has less blocks allocated than its size
+        if st.st_blocks * 512 < size:
+            return "file is not fully allocated"
+
+        return None
+
+    def layout(self, path, size):
+        start = time.time()
+        self.logger.info("lay out test file %s %d bytes" % (path, size))
+        if os.path.dirname(path) != "":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        for old_path in [get_stamp_path(path), path]:
+            if os.path.exists(old_path):
+                os.remove(old_path)
+
+        config = FioConfig()
+        params = dict(LAYOUT_PARAMS)
+        params.update({"filename": path, "size": str(size)})
+        config.add_job("layout", params)
+        result, err = Fio(path).run_test_config(config)
+        if result is None:
+            raise Exception("Failed to lay out test file %s %s" % (path, str(err)))
+
+        st = os.stat(path)
+        stamp = {"size": size, "inode": st.st_ino, "created": time.time(), "stamp": uuid.uuid4().hex,
+            "layout_time": round(time.time() - start, 1)}
+        write_json(get_stamp_path(path), stamp)
+        self.register(path)
+        reason = self.check(path, size)
+        if reason is not None:
+            raise Exception("Test file %s is not valid after layout: %s" % (path, reason))
+
+        self.logger.info("test file %s laid out in %.1f s" % (path, stamp["layout_time"]))
+        return stamp
+
+    # returns stamp of a valid test file, lays the file out when it is missing or does not match
+    def prepare(self, path, size, fresh=False):
+        path = os.path.abspath(path)
+        size = parse_size(size)
+        reason = "fresh file requested" if fresh else self.check(path, size)
+        if reason is None:
+            stamp = read_json(get_stamp_path(path), None)
+            self.logger.info("reuse test file %s laid out %s" % (path, time.strftime("%Y-%m-%d %H:%M:%S",
+                time.localtime(stamp["created"]))))
+            return stamp
+
+        self.logger.info("test file %s can not be reused: %s" % (path, reason))
+        return self.layout(path, size)
+
+    def remove(self, path):
+        for file_path in [path, get_stamp_path(path)]:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+        self.register(path, add=False)
+        self.logger.info("removed test file %s" % path)
+
+    # removes given managed files or all of them
+    def cleanup(self, paths=None):
+        files = self.get_files()
+        for path in files if paths is None else [os.path.abspath(p) for p in paths]:
+            if path not in files:
+                self.logger.warning("%s is not a managed test file" % path)
+                continue
+
+            self.remove(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Managed test files:")
+    parser.add_argument('-R', dest='registry_path', action='store', type=str, default=DEFAULT_REGISTRY_PATH, help='Test files registry path default %s' % DEFAULT_REGISTRY_PATH)
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.add_parser('list', help='List managed test files')
+    prepare_parser = subparsers.add_parser('prepare', help='Lay out test file or check that it can be reused')
+    prepare_parser.add_argument('-d', dest='path', action='store', type=str, required=True, help='Test file path')
+    prepare_parser.add_argument('-z', dest='size', action='store', type=str, default="4GB", help='Test file size default 4GB')
+    prepare_parser.add_argument('--fresh', dest='fresh', action='store_true', default=False, help='Lay out the file again')
+    cleanup_parser = subparsers.add_parser('cleanup', help='Remove managed test files')
+    cleanup_parser.add_argument('-d', dest='paths', action='store', type=str, nargs='*', default=None, help='Test file paths, all managed files by default')
+    args = parser.parse_args()
+    if args.command is None:
+        parser.print_help()
+        sys.exit(1)
+
+    cache = TestFileCache(args.registry_path)
+    if args.command == "list":
+        for path in cache.get_files():
+            stamp = read_json(get_stamp_path(path), None)
+            reason = cache.check(path, stamp["size"]) if stamp is not None else "no stamp"
+            print("%s %s %s" % (path, str(stamp["size"]) if stamp is not None else "-", "valid" if reason is None else reason))
+    elif args.command == "prepare":
+        cache.prepare(args.path, args.size, args.fresh)
+    elif args.command == "cleanup":
+        cache.cleanup(args.paths)
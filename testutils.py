@@ -25,6 +25,11 @@
 import logging
 import logging.handlers
 import csv
+import time
+import asyncio
+import tempfile
+import functools
+import threading
 from re import VERBOSE
 from subprocess import Popen, PIPE
 
@@ -56,13 +61,13 @@ class CsvLogger(logging.Logger):
     def __init__(self, logtype, log_file_name):
         super(CsvLogger, self).__init__(logtype)
         self.file = log_file_name
-        with open(log_file_name, mode='w') as csv_file:
-            csv.writer(csv_file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        # file stays open for the logger lifetime, every row is flushed so the file is readable during the test
+        self.csv_file = open(log_file_name, mode='w')
+        self.csv_writer = csv.writer(self.csv_file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
 
     def csv(self, msg):
-        with open(self.file, mode='a+') as csv_file:
-            csv_writer = csv.writer(csv_file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-            csv_writer.writerow(msg)
+        self.csv_writer.writerow(msg)
+        self.csv_file.flush()
 
 DEFULT_LOGGER=DefaultLogger()
 LOGTYPE_DICT={
@@ -82,11 +87,17 @@ LOG_TYPE_VERBOSE = 3
 LOG_TYPE_FILE = 4
 LOG_TYPE_FILE_CSV = 5
 
-def setup_log(type=LOG_TYPE_VERBOSE, level=3, log_file_name="/tmp/ptest_log.log"):
+def setup_log(type=LOG_TYPE_VERBOSE, level=3, log_file_name="/tmp/ptest_log.log", name=None):
     logger = DEFULT_LOGGER
     try:
-        logger = logging.getLogger(str(type))
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(funcName)s - %(message)s')
+        if name is None:
+            logger = logging.getLogger(str(type))
+            formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(funcName)s - %(message)s')
+        else:
+            # separate logger per tested device, so parallel runs do not share handlers
+            logger = logging.getLogger("%s-%s" % (str(type), str(name)))
+            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(funcName)s - %(message)s')
+
         if type == LOG_TYPE_SYSLOG:
             handler = logging.handlers.SysLogHandler()
         elif type == LOG_TYPE_VERBOSE:
@@ -94,7 +105,7 @@ def setup_log(type=LOG_TYPE_VERBOSE, level=3, log_file_name="/tmp/ptest_log.log"
         elif type == LOG_TYPE_FILE:
             handler = logging.handlers.RotatingFileHandler(log_file_name, maxBytes=1000000, backupCount=5)
         elif type == LOG_TYPE_FILE_CSV:
-            logger = CsvLogger(str(type), log_file_name)
+            logger = CsvLogger(str(type) if name is None else "%s-%s" % (str(type), str(name)), log_file_name)
             handler = logging.StreamHandler()
         else:
             handler = logging.NullHandler()
@@ -107,23 +118,215 @@ def setup_log(type=LOG_TYPE_VERBOSE, level=3, log_file_name="/tmp/ptest_log.log"
 
     return logger
 
-def systemExec(cmd, shell=False, verbouse=False, logger=DEFULT_LOGGER):
+# seconds between SIGTERM and SIGKILL when command is stopped on timeout or cancel
+KILL_TIMEOUT = 5
+# max output line length for asyncExec, asyncio default 64 KiB is too small for some one line json outputs
+LINE_LIMIT = 16 * 1024 * 1024
+
+
+# Exit information of a command run by asyncExec
+# returncode is None when command was not started, timed_out and cancelled tell why it was stopped
+class ExecResult:
+    __slots__ = ("cmd", "returncode", "out", "err", "duration", "timed_out", "cancelled")
+
+    def __init__(self, cmd):
+        self.cmd = cmd
+        self.returncode = None
+        self.out = ""
+        self.err = ""
+        self.duration = 0.0
+        self.timed_out = False
+        self.cancelled = False
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and not self.timed_out and not self.cancelled
+
+    def get_error(self):
+        if self.timed_out:
+            return "command %s timed out after %.1f s %s" % (str(self.cmd), self.duration, self.err)
+
+        if self.cancelled:
+            return "command %s cancelled %s" % (str(self.cmd), self.err)
+
+        return self.err
+
+    def __str__(self):
+        return "returncode %s duration %.1f s timed out %s cancelled %s" % (str(self.returncode), self.duration,
+            str(self.timed_out), str(self.cancelled))
+
+
+async def read_lines(stream, lines, callback):
+    while True:
+        line = await stream.readline()
+        if not line:
+            return
+
+        line = str(line, 'utf-8', 'replace')
+        lines.append(line)
+        if callback is not None:
+            callback(line)
+
+
+async def write_input(stream, input):
+    try:
+        stream.write(input.encode('utf-8'))
+        await stream.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        # command exited without reading all input, its exit code tells what happened
+        pass
+    finally:
+        stream.close()
+
+
+async def stop_process(process, kill_timeout=KILL_TIMEOUT):
+    if process.returncode is not None:
+        return
+
+    try:
+        process.terminate()
+        await asyncio.wait_for(process.wait(), kill_timeout)
+    except ProcessLookupError:
+        pass
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+
+# Runs command without blocking the event loop and returns ExecResult.
+# on_stdout and on_stderr are called with every output line while command is running.
+# Command is terminated when timeout in seconds expires or the calling task is cancelled, cancellation is re-raised.
+async def asyncExec(cmd, shell=False, verbouse=False, logger=DEFULT_LOGGER, input=None, timeout=None,
+    on_stdout=None, on_stderr=None, kill_timeout=KILL_TIMEOUT):
+    result = ExecResult(cmd)
+    if verbouse:
+        logger.debug("command %s" % str(cmd))
+
+    start = time.monotonic()
+    stdin = asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL
     try:
-        if verbouse:
-            logger.debug("command %s" % str(cmd))
-        process = Popen(cmd, shell=shell, stdout=PIPE, stderr=PIPE)
-        out, err = process.communicate()
-        if process.returncode != 0:
-            if verbouse:
-                logger.debug("o None e %s" % str(err))
-            return None, str(err)
-
-        if verbouse:
-            logger.debug("o %s e %s" % (str(out, 'utf-8'), str(err, 'utf-8')))
-        return str(out, 'utf-8'), str(err, 'utf-8')
+        if shell:
+            process = await asyncio.create_subprocess_shell(cmd, stdin=stdin, stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE, limit=LINE_LIMIT)
+        else:
+            process = await asyncio.create_subprocess_exec(*cmd, stdin=stdin, stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE, limit=LINE_LIMIT)
     except EnvironmentError as e:
         logger.error("Failed to execute command %s exception: %s" % (str(cmd), str(e)))
+        result.err = str(e)
+        return result
+
+    out_lines = []
+    err_lines = []
+    tasks = [read_lines(process.stdout, out_lines, on_stdout), read_lines(process.stderr, err_lines, on_stderr)]
+    if input is not None:
+        tasks.append(write_input(process.stdin, input))
+
+    try:
+        await asyncio.wait_for(asyncio.gather(*tasks, process.wait()), timeout)
+    except asyncio.TimeoutError:
+        result.timed_out = True
+    except asyncio.CancelledError:
+        result.cancelled = True
+        await stop_process(process, kill_timeout)
+        raise
+    finally:
+        if result.timed_out:
+            await stop_process(process, kill_timeout)
+
+        result.returncode = process.returncode
+        result.out = "".join(out_lines)
+        result.err = "".join(err_lines)
+        result.duration = time.monotonic() - start
 
     if verbouse:
-        logger.debug("o None e None")
-    return None, None
+        logger.debug("%s o %s e %s" % (str(result), result.out, result.err))
+    return result
+
+
+# Blocking wrapper of asyncExec, must not be called from a running event loop (use asyncExec there)
+# returns (out, err), out is None when command failed, timed out or was not started
+def systemExec(cmd, shell=False, verbouse=False, logger=DEFULT_LOGGER, input=None, timeout=None):
+    result = asyncio.run(asyncExec(cmd, shell, verbouse, logger, input, timeout))
+    if result.returncode is None and not result.timed_out:
+        return None, None
+
+    if not result.ok:
+        return None, result.get_error()
+
+    return result.out, result.err
+
+
+# Runs blocking function in a worker thread of the running loop (asyncio.to_thread needs python 3.9)
+async def runInThread(func, *args):
+    return await asyncio.get_event_loop().run_in_executor(None, functools.partial(func, *args))
+
+
+# Runs blocking functions at the same time in worker threads, returns their results in the same order.
+# Exceptions are returned as results, so one failed step does not hide the others.
+async def runParallel(*funcs):
+    return await asyncio.gather(*[runInThread(func) for func in funcs], return_exceptions=True)
+
+
+# Same as systemExec but gives stdout line by line while command is running
+# returncode and err are set after iteration is finished
+class StreamExec:
+    def __init__(self, cmd, shell=False, verbouse=False, logger=DEFULT_LOGGER, input=None, timeout=None):
+        self.cmd = cmd
+        self.input = input
+        self.timeout = timeout
+        self.timed_out = False
+        self.shell = shell
+        self.verbouse = verbouse
+        self.logger = logger
+        self.returncode = None
+        self.err = None
+
+    def __iter__(self):
+        if self.verbouse:
+            self.logger.debug("command %s" % str(self.cmd))
+
+        # stderr goes to file, so command never blocks on full stderr pipe while we read stdout
+        with tempfile.TemporaryFile() as err_file:
+            try:
+                process = Popen(self.cmd, shell=self.shell, stdout=PIPE, stderr=err_file, universal_newlines=True, bufsize=1,
+                    stdin=PIPE if self.input is not None else None)
+                if self.input is not None:
+                    # fio job files are much smaller than pipe buffer, so writing before reading does not block
+                    process.stdin.write(self.input)
+                    process.stdin.close()
+            except EnvironmentError as e:
+                self.logger.error("Failed to execute command %s exception: %s" % (str(self.cmd), str(e)))
+                return
+
+            # killed command closes stdout, so the reader below stops instead of waiting forever
+            timer = threading.Timer(self.timeout, self.kill, (process,)) if self.timeout is not None else None
+            if timer is not None:
+                timer.start()
+
+            finished = False
+            try:
+                for line in process.stdout:
+                    yield line
+                finished = True
+            finally:
+                if timer is not None:
+                    timer.cancel()
+                process.stdout.close()
+                # reader stopped before command end, do not leave it running
+                if not finished and process.poll() is None:
+                    process.kill()
+
+                self.returncode = process.wait()
+                err_file.seek(0)
+                self.err = str(err_file.read(), 'utf-8')
+                if self.timed_out:
+                    self.err = "command %s timed out after %d s %s" % (str(self.cmd), self.timeout, self.err)
+
+        if self.verbouse:
+            self.logger.debug("returncode %s e %s" % (str(self.returncode), self.err))
+
+    def kill(self, process):
+        if process.poll() is None:
+            self.timed_out = True
+            process.kill()
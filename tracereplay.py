@@ -0,0 +1,255 @@
+#!/usr/bin/python3
+
+# MIT License
+# 
+# Copyright (c) 2020 Andrii Melnyk andriy.melnyk@onapp.com
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+# Replays production IO traces with fio read_iolog. A trace is a blkparse text output of a blktrace capture or an fio
+# write_iolog. It is normalized to the test target (one file, aligned offsets inside the target size, time from zero),
+# optionally time scaled and written as fio iolog version 3. Report compares achieved and original timing.
+
+import os
+import csv
+import argparse
+import tempfile
+import devinfo
+import testutils
+import testfiles
+from fiolib import Fio, FioConfig, parse_size, FIO_TIMEOUT_MARGIN, MIN_TIMEOUT_BANDWIDTH
+from performance_test import parse_result
+
+FORMAT_FIO = "fio"
+FORMAT_BLKPARSE = "blkparse"
+FORMATS = [FORMAT_FIO, FORMAT_BLKPARSE]
+FIO_IOLOG_HEADER = "fio version %d iolog"
+ACTIONS = ["read", "write", "trim"]
+DEFAULT_ALIGN = 4096
+# blkparse event used as IO start: D issued to driver, Q queued by the application
+DEFAULT_EVENT = "D"
+REPLAY_PARAMS = {"ioengine": "libaio", "direct": "1", "iodepth": "32"}
+REPORT_KEYS = ["ios", "read_ios", "write_ios", "trim_ios", "duration_ms", "iops"]
+
+
+class TraceEvent:
+    __slots__ = ["time", "action", "offset", "length"]
+
+    # time in ms from the trace start, offset and length in bytes
+    def __init__(self, time, action, offset, length):
+        self.time = time
+        self.action = action
+        self.offset = offset
+        self.length = length
+
+
+def detect_format(path):
+    with open(path) as trace_file:
+        first_line = trace_file.readline()
+
+    return FORMAT_FIO if first_line.startswith("fio version") else FORMAT_BLKPARSE
+
+
+# version 2 iolog has no timestamps, its events get time 0 and are replayed without timing
+def read_fio_iolog(path):
+    events = []
+    with open(path) as trace_file:
+        version = int(trace_file.readline().split()[2])
+        for line in trace_file:
+            parts = line.split()
+            time = 0.0
+            if version >= 3 and len(parts) > 0:
+                time = float(parts[0])
+                parts = parts[1:]
+
+            if len(parts) == 4 and parts[1] in ACTIONS:
+                events.append(TraceEvent(time, parts[1], int(parts[2]), int(parts[3])))
+
+    return events
+
+
+# blkparse default output: dev cpu seq time pid event rwbs sector + count [process]
+def read_blkparse(path, event=DEFAULT_EVENT):
+    events = []
+    with open(path) as trace_file:
+        for line in trace_file:
+            parts = line.split()
+            if len(parts) < 10 or parts[5] != event or parts[8] != "+":
+                continue
+
+            rwbs = parts[6]
+            action = "trim" if "D" in rwbs else "write" if "W" in rwbs else "read" if "R" in rwbs else None
+            try:
+                length = int(parts[9]) * 512
+                offset = int(parts[7]) * 512
+                time = float(parts[3]) * 1000
+            except ValueError:
+                continue
+
+            # flushes have no data
+            if action is not None and length != 0:
+                events.append(TraceEvent(time, action, offset, length))
+
+    return events
+
+
+def read_trace(path, trace_format=None, event=DEFAULT_EVENT):
+    if trace_format is None:
+        trace_format = detect_format(path)
+
+    events = read_fio_iolog(path) if trace_format == FORMAT_FIO else read_blkparse(path, event)
+    if len(events) == 0:
+        raise Exception("No IO events in %s trace %s" % (trace_format, path))
+
+    return events
+
+
+# time starts at zero and is divided by speed, IO is aligned and folded into the target size
+def normalize(events, size, align=DEFAULT_ALIGN, speed=1.0):
+    events = sorted(events, key=lambda e: e.time)
+    start = events[0].time
+    normalized = []
+    for e in events:
+        length = min(max((e.length + align - 1) // align * align, align), size)
+        offset = (e.offset // align * align) % (size - length + 1) // align * align
+        normalized.append(TraceEvent((e.time - start) / speed, e.action, offset, length))
+
+    return normalized
+
+
+def write_iolog(path, events, filename):
+    with open(path, "w") as iolog:
+        iolog.write(FIO_IOLOG_HEADER % 3 + "\n")
+        iolog.write("0 %s add\n0 %s open\n" % (filename, filename))
+        for e in events:
+            iolog.write("%d %s %s %d %d\n" % (int(e.time), filename, e.action, e.offset, e.length))
+        iolog.write("%d %s close\n" % (int(events[-1].time), filename))
+
+
+def get_trace_stats(events):
+    trace_stats = {"ios": len(events), "duration_ms": int(events[-1].time - events[0].time)}
+    for action in ACTIONS:
+        trace_stats[action + "_ios"] = sum(1 for e in events if e.action == action)
+    trace_stats["iops"] = trace_stats["ios"] * 1000 // trace_stats["duration_ms"] if trace_stats["duration_ms"] > 0 else 0
+    return trace_stats
+
+
+def get_replay_stats(result):
+    replay_stats = {"duration_ms": int(result["runtime"])}
+    for action in ACTIONS:
+        replay_stats[action + "_ios"] = int(result[action + "_ios"])
+    replay_stats["ios"] = sum(replay_stats[action + "_ios"] for action in ACTIONS)
+    replay_stats["iops"] = replay_stats["ios"] * 1000 // replay_stats["duration_ms"] if replay_stats["duration_ms"] > 0 else 0
+    return replay_stats
+
+
+def get_target_size(dev, size=None):
+    if size is not None:
+        return parse_size(size)
+
+    if testfiles.is_file_target(dev):
+        if not os.path.exists(dev):
+            raise Exception("Test file %s does not exist, give its size" % dev)
+        return os.path.getsize(dev)
+
+    dev_size = devinfo.get_device_identity(dev)["size"]
+    if dev_size is None:
+        raise Exception("Can not find size of %s, give it explicitly" % dev)
+
+    return dev_size
+
+
+# fio does not know how long an iolog replays, it is bounded by the trace duration plus the trace data at the
+# slowest expected bandwidth, so a device that falls behind the trace is not killed
+def get_replay_timeout(events):
+    duration = (events[-1].time - events[0].time) / 1000.0 if len(events) != 0 else 0
+    return duration + sum(e.length for e in events) / MIN_TIMEOUT_BANDWIDTH + FIO_TIMEOUT_MARGIN
+
+
+# no_stall replays as fast as possible keeping the order, otherwise trace timing is followed
+def replay(dev, events, iodepth, no_stall, logger):
+    params = dict(REPLAY_PARAMS)
+    params["iodepth"] = str(iodepth)
+    params["replay_no_stall"] = "1" if no_stall else "0"
+    # private iolog per run, parallel replays do not share it
+    with tempfile.NamedTemporaryFile("w", prefix="ptest-replay-", suffix=".iolog", delete=False) as iolog:
+        iolog_path = iolog.name
+
+    try:
+        write_iolog(iolog_path, events, dev)
+        params["read_iolog"] = iolog_path
+        config = FioConfig()
+        config.add_job("replay", params)
+        result, err = Fio(dev).run_test_config(config, timeout=get_replay_timeout(events))
+        if result is None:
+            raise Exception("FIO error %s" % str(err))
+
+        return parse_result(result, logger)
+    finally:
+        os.remove(iolog_path)
+
+
+def main(dev, trace_path, trace_format, event, speed, size, iodepth, no_stall, logger, csv_path=None):
+    events = normalize(read_trace(trace_path, trace_format, event), get_target_size(dev, size), speed=speed)
+    original = get_trace_stats(events)
+    logger.info("trace %s %d ios (read %d write %d trim %d) in %d ms, %d iops after %.2fx time scale" % (trace_path,
+        original["ios"], original["read_ios"], original["write_ios"], original["trim_ios"], original["duration_ms"],
+        original["iops"], speed))
+    result = replay(dev, events, iodepth, no_stall, logger)
+    achieved = get_replay_stats(result)
+    timing = round(achieved["duration_ms"] / float(original["duration_ms"]), 3) if original["duration_ms"] > 0 else None
+    logger.info("replay %d ios in %d ms, %d iops, duration %s of original, read lat %s ns p99 %s ns write lat %s ns p99 %s ns" %
+        (achieved["ios"], achieved["duration_ms"], achieved["iops"], "%.3fx" % timing if timing is not None else "n/a",
+        result["read_lat"], result["read_p99"], result["write_lat"], result["write_p99"]))
+    if not no_stall and timing is not None and timing > 1.05:
+        logger.warning("device did not keep up with the trace, replay took %.1f%% longer" % ((timing - 1) * 100))
+
+    if csv_path is not None:
+        with open(csv_path, "w") as csv_file:
+            csv_writer = csv.writer(csv_file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            csv_writer.writerow([""] + REPORT_KEYS)
+            csv_writer.writerow(["original"] + [original[k] for k in REPORT_KEYS])
+            csv_writer.writerow(["replay"] + [achieved[k] for k in REPORT_KEYS])
+
+    return original, achieved, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IO trace replay parameters:")
+    parser.add_argument('-d', dest='dev', action='store', type=str, required=True, help='Test device path')
+    parser.add_argument('-i', dest='trace_path', action='store', type=str, required=True, help='blkparse text output or fio write_iolog file')
+    parser.add_argument('-F', dest='trace_format', action='store', type=str, default=None, choices=FORMATS, help='Trace format, detected by default')
+    parser.add_argument('-e', dest='event', action='store', type=str, default=DEFAULT_EVENT, help='blkparse event taken as IO start, D (issue) or Q (queue) default %s' % DEFAULT_EVENT)
+    parser.add_argument('-x', dest='speed', action='store', type=float, default=1.0, help='Time scale, 2 replays twice as fast default 1')
+    parser.add_argument('-z', dest='size', action='store', type=str, default=None, help='Target size IO is folded into e.g. 100G, device or file size by default')
+    parser.add_argument('-q', dest='iodepth', action='store', type=int, default=32, help='Max IO in flight default 32')
+    parser.add_argument('--no-stall', dest='no_stall', action='store_true', default=False, help='Ignore trace timing and replay as fast as possible')
+    parser.add_argument('-o', dest='csv_path', action='store', type=str, default=None, help='CSV file for original and replay stats')
+    parser.add_argument('-l', dest='log_level', action='store', type=int, default=5, choices=range(0, 8), help='Log level CRITICAL: 0, FATAL: 1, ERROR: 2, WARNING: 3, WARN: 4, INFO: 5, DEBUG: 6, NOTSET: 7 by default 5')
+    args = parser.parse_args()
+    logger = testutils.setup_log(testutils.LOG_TYPE_VERBOSE, args.log_level)
+    if args.speed <= 0:
+        logger.error("Time scale has to be positive")
+    else:
+        try:
+            main(args.dev, args.trace_path, args.trace_format, args.event, args.speed, args.size, args.iodepth, args.no_stall,
+                logger, args.csv_path)
+        except Exception as e:
+            logger.error("Replay failed %s" % str(e))
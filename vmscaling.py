@@ -0,0 +1,159 @@
+#!/usr/bin/python3
+
+# MIT License
+# 
+# Copyright (c) 2020 Andrii Melnyk andriy.melnyk@onapp.com
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Noisy neighbour benchmark: runs the same fio test in 1, 2, 4 ... N VMs sharing the same device(s)
+# and reports aggregate throughput, fairness between VMs and latency inflation against single VM run.
+
+import csv
+import argparse
+import testutils
+import performance_test
+import scheduler
+from fiolib import Fio
+from vmtestlib import VmPool
+from fioresult import HIST_SUFFIX
+from latencyhist import LatencyHistogram
+
+
+def jain_index(values):
+    square_sum = sum(v * v for v in values)
+    if square_sum == 0:
+        return 1.0
+
+    return (sum(values) ** 2) / (len(values) * square_sum)
+
+
+def get_guest_stats(result, lat_metric):
+    guest_stats = performance_test.get_main_stats(result, lat_metric)
+    if guest_stats["direction"] + HIST_SUFFIX in result:
+        guest_stats["hist"] = LatencyHistogram.from_string(result[guest_stats["direction"] + HIST_SUFFIX])
+
+    return guest_stats
+
+
+# latency of all guests IO together, from merged histograms when every guest has one
+def get_merged_lat(guest_stats, lat_metric):
+    if any("hist" not in s for s in guest_stats):
+        return max(s["lat"] for s in guest_stats)
+
+    histogram = LatencyHistogram.merge([s["hist"] for s in guest_stats])
+    if lat_metric == "mean":
+        return int(histogram.mean())
+
+    return histogram.percentile(dict(performance_test.PERCENTILES)[lat_metric])
+
+
+def run_step(pool, devices, guests, config_name, params, lat_metric, logger):
+    vms = [pool.lease(devices[i % len(devices)]) for i in range(guests)]
+    try:
+        outputs = Fio().run_test_at_vms(config_name, vms, params)
+    finally:
+        for vm in vms:
+            pool.release(vm)
+
+    guest_stats = []
+    for vm, (out, err) in zip(vms, outputs):
+        if out is None:
+            raise Exception("FIO error at VM %s %s" % (vm.get_vm_name(), str(err)))
+
+        guest_stats.append(get_guest_stats(performance_test.parse_result(out, logger), lat_metric))
+
+    return guest_stats
+
+
+def get_step_summary(guests, guest_stats, baseline, lat_metric):
+    iops = [s["iops"] for s in guest_stats]
+    lats = [s["lat"] for s in guest_stats]
+    summary = {
+        "guests": guests,
+        "aggregate_iops": sum(iops),
+        "aggregate_bw": sum(s["bw"] for s in guest_stats),
+        "min_guest_iops": min(iops),
+        "max_guest_iops": max(iops),
+        "fairness": round(jain_index(iops), 3),
+        "mean_guest_lat": sum(lats) // len(lats),
+        "max_guest_lat": max(lats),
+        "merged_lat": get_merged_lat(guest_stats, lat_metric),
+    }
+    # like for like, so a flat host reports 1.0 for both
+    for inflation, lat in [("lat_inflation", "mean_guest_lat"), ("max_lat_inflation", "max_guest_lat")]:
+        if baseline is None or baseline[lat] == 0:
+            summary[inflation] = 1.0
+        else:
+            summary[inflation] = round(summary[lat] / baseline[lat], 2)
+
+    return summary
+
+
+SUMMARY_KEYS = ["guests", "aggregate_iops", "aggregate_bw", "min_guest_iops", "max_guest_iops", "fairness",
+    "mean_guest_lat", "max_guest_lat", "merged_lat", "lat_inflation", "max_lat_inflation"]
+
+
+def main(devices, guest_counts, config_name, params, lat_metric, logger, csv_path=None):
+    summaries = []
+    with VmPool(size=max(guest_counts), test_dev_name=devices[0], shareable=True) as pool:
+        baseline = None
+        for guests in guest_counts:
+            logger.info("Start %s at %d guests" % (config_name, guests))
+            guest_stats = run_step(pool, devices, guests, config_name, params, lat_metric, logger)
+            summary = get_step_summary(guests, guest_stats, baseline, lat_metric)
+            if guests == 1:
+                baseline = summary
+
+            logger.info("guests %d aggregate iops %d bw %d KiB/s fairness %.3f %s lat mean %d max %d all guests %d ns inflation mean %.2f max %.2f" %
+                (guests, summary["aggregate_iops"], summary["aggregate_bw"], summary["fairness"], lat_metric,
+                summary["mean_guest_lat"], summary["max_guest_lat"], summary["merged_lat"], summary["lat_inflation"],
+                summary["max_lat_inflation"]))
+            summaries.append(summary)
+
+    if csv_path is not None:
+        with open(csv_path, "w") as csv_file:
+            csv_writer = csv.writer(csv_file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            csv_writer.writerow(SUMMARY_KEYS)
+            for summary in summaries:
+                csv_writer.writerow([summary[k] for k in SUMMARY_KEYS])
+
+    return summaries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Noisy neighbour VM scaling test parameters:")
+    parser.add_argument('-d', dest='dev', action='store', type=str, nargs='+', required=True, help='Test device path, list or glob of devices shared by guests e.g. "/dev/sd[b-e]"')
+    parser.add_argument('-n', dest='guests', action='store', type=str, default="1,2,4", help='Comma separated guest counts default 1,2,4')
+    parser.add_argument('-T', dest='config_name', action='store', type=str, default="4k1thread1queue", help='fio test name from fio folder default 4k1thread1queue')
+    parser.add_argument('-r', dest='runtime', action='store', type=int, default=None, help='Override test runtime in seconds')
+    parser.add_argument('-m', dest='lat_metric', action='store', type=str, default="p99", choices=["mean"] + [name for name, _ in performance_test.PERCENTILES], help='Latency metric for inflation default p99')
+    parser.add_argument('-o', dest='csv_path', action='store', type=str, default=None, help='CSV file for summary')
+    parser.add_argument('-l', dest='log_level', action='store', type=int, default=5, choices=range(0, 8), help='Log level CRITICAL: 0, FATAL: 1, ERROR: 2, WARNING: 3, WARN: 4, INFO: 5, DEBUG: 6, NOTSET: 7 by default 5')
+    args = parser.parse_args()
+    logger = testutils.setup_log(testutils.LOG_TYPE_VERBOSE, args.log_level)
+    guest_counts = sorted(int(n) for n in args.guests.split(","))
+    if guest_counts[0] != 1:
+        guest_counts.insert(0, 1) # single guest run is the baseline for latency inflation
+
+    params = {"runtime": str(args.runtime)} if args.runtime is not None else None
+    try:
+        main(scheduler.expand_devices(args.dev), guest_counts, args.config_name, params, args.lat_metric, logger, args.csv_path)
+    except Exception as e:
+        logger.error("Testing failed %s" % str(e))
@@ -29,14 +29,24 @@ import os
 import time
 import glob
 import uuid
+import socket
+import asyncio
+import threading
 import xml.etree.ElementTree as ET
-from testutils import systemExec
+from subprocess import Popen, DEVNULL
+from testutils import systemExec, StreamExec, asyncExec, runParallel, runInThread
 
 BRIDGE_NAME="testbridge"
+SSH_PORT=22
+SSH_CONTROL_DIR="/tmp"
+# virsh may hang on stuck libvirtd, do not wait for it forever
+VIRSH_TIMEOUT=120
+# VMs of a pool boot at the same time, bridge and iptables rules are set up by one of them at a time
+NETWORK_LOCK = threading.Lock()
 
 class Testvm:
     def __init__(self, test_dev_name="/dev/zero", ram_size="1024000", vcpu_count="1", vm_ip="10.201.133.2",
-        bridge_ip="10.201.133.1", timeout=60, dev_name_inside_vm="vda"):
+        bridge_ip="10.201.133.1", timeout=60, dev_name_inside_vm="vda", shareable=False):
 
         self.vm_uuid = uuid.uuid4()
         self.dev_name = test_dev_name
@@ -46,6 +56,11 @@ class Testvm:
         self.bridge_ip = bridge_ip
         self.timeout = timeout
         self.dev_name_inside_vm = dev_name_inside_vm
+        # shareable disk can be attached to several VMs at the same time
+        self.shareable = shareable
+        self.config_path = None
+        self.destroyed = False
+        self.ssh_master = None
 
     def get_defult_config(self):
         self.vm_config_tree = ET.parse(os.path.dirname(__file__) + "/fio/default.xml")
@@ -62,6 +77,10 @@ class Testvm:
         return "/dev/" + self.dev_name_inside_vm
     
     def setup_network(self):
+        with NETWORK_LOCK:
+            self.setup_bridge()
+
+    def setup_bridge(self):
         bridges = {}
         try:
             paths = glob.glob("/sys/class/net/*/bridge")
@@ -140,44 +159,266 @@ class Testvm:
                 
                 for target in disk.findall('target'):
                     target.set("dev", self.dev_name_inside_vm)
+
+                if self.shareable and disk.find('shareable') is None:
+                    ET.SubElement(disk, 'shareable')
                     
         self.config_path = "%s/fio/%s.xml" % (base_dir, self.get_vm_name())
         #print("\n%s\n" % ET.dump(vm_config))
         self.write_config()
 
-    def run_command(self, cmd, verbouse=False):
-        out, err = systemExec(["ssh", "-oStrictHostKeyChecking=no ", "-oHostKeyAlgorithms=+ssh-dss",
-            "root@" + str(self.vm_ip), cmd], verbouse=verbouse)
+    def get_control_path(self):
+        return "%s/ptest-ssh-%s" % (SSH_CONTROL_DIR, self.get_vm_name())
+
+    # all ssh and scp calls go through master connection when it is open, so there is no handshake per call
+    def get_ssh_options(self):
+        return ["-oStrictHostKeyChecking=no", "-oHostKeyAlgorithms=+ssh-dss", "-oControlPath=%s" % self.get_control_path()]
+
+    def open_master(self, timeout=10):
+        # master runs as our child in foreground, backgrounded ssh keeps pipes open and blocks systemExec
+        try:
+            self.ssh_master = Popen(["ssh"] + self.get_ssh_options() + ["-oControlMaster=yes", "-N", "root@" + str(self.vm_ip)],
+                stdin=DEVNULL, stdout=DEVNULL, stderr=DEVNULL)
+        except EnvironmentError as e:
+            print("VM %s failed to open ssh master connection %s" % (self.get_vm_name(), str(e)))
+            return False
+
+        deadline = time.time() + timeout
+        while time.time() < deadline and self.ssh_master.poll() is None:
+            if os.path.exists(self.get_control_path()):
+                return True
+
+            time.sleep(0.05)
+
+        print("VM %s ssh master connection is not ready, use separate connections" % self.get_vm_name())
+        self.close_master()
+        return False
+
+    def close_master(self):
+        if self.ssh_master is None:
+            return
+
+        if self.ssh_master.poll() is None:
+            self.ssh_master.terminate()
+            self.ssh_master.wait()
+
+        self.ssh_master = None
+        systemExec(["rm", "-f", self.get_control_path()])
+
+    def get_ssh_command(self, cmd):
+        return ["ssh"] + self.get_ssh_options() + ["root@" + str(self.vm_ip), cmd]
+
+    def run_command(self, cmd, verbouse=False, input=None, timeout=None):
+        out, err = systemExec(self.get_ssh_command(cmd), verbouse=verbouse, input=input, timeout=timeout)
 
         return out, err
 
+    # iterate over result to get command output line by line while it is running
+    def run_command_stream(self, cmd, verbouse=False, input=None, timeout=None):
+        return StreamExec(self.get_ssh_command(cmd), verbouse=verbouse, input=input, timeout=timeout)
+
     def send_file(self, local_file, remote_file=None, verbouse=False):
         if remote_file is None:
             remote_file = local_file
 
-        systemExec(['scp', "-oHostKeyAlgorithms=+ssh-dss", "-oStrictHostKeyChecking=no", str(local_file),
+        systemExec(['scp'] + self.get_ssh_options() + [str(local_file),
             "root@%s:/%s" % (str(self.vm_ip), str(remote_file))], verbouse=verbouse)
 
-    def start(self, vm_config_path=None):
-        self.setup_network()
+    def get_file(self, remote_file, local_file, verbouse=False):
+        systemExec(['scp'] + self.get_ssh_options() + ["root@%s:/%s" % (str(self.vm_ip), str(remote_file)),
+            str(local_file)], verbouse=verbouse)
+
+    def is_alive(self):
+        out, _ = self.run_command("echo 1", timeout=self.timeout)
+        return out is not None and out.startswith("1")
+
+    def wait_for_ssh(self, timeout):
+        # wait for sshd banner instead of running ssh command every second
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                with socket.create_connection((str(self.vm_ip), SSH_PORT), timeout=max(deadline - time.time(), 0.1)) as conn:
+                    if conn.recv(4).startswith(b"SSH-"):
+                        return True
+            except OSError:
+                # connection refused or no route while VM is booting
+                time.sleep(0.2)
+
+        return False
+
+    def define(self, vm_config_path=None):
         self.generate_vm_config(vm_config_path)
+        systemExec(["virsh", "define", self.config_path], timeout=VIRSH_TIMEOUT)
+
+    # network setup and VM definition do not depend on each other, so they run at the same time
+    async def start_async(self, vm_config_path=None):
+        for step in await runParallel(self.setup_network, lambda: self.define(vm_config_path)):
+            if isinstance(step, Exception):
+                raise step
 
-        systemExec(["virsh", "define", self.config_path])
-        systemExec(["virsh", "start", self.get_vm_name()])
-        timeout = self.timeout
-        while(timeout > 0):
-            out, _ = self.run_command("echo 1")
-            if out is not None and out.startswith("1"):
+        result = await asyncExec(["virsh", "start", self.get_vm_name()], timeout=VIRSH_TIMEOUT)
+        if not result.ok:
+            print("VM %s failed to start %s" % (self.get_vm_name(), result.get_error()))
+            return False
+
+        if await runInThread(self.wait_for_ssh, self.timeout):
+            await runInThread(self.open_master)
+            if await runInThread(self.is_alive):
                 print("VM %s Booted" % self.get_vm_name())
-                break
+                return True
+
+        return False
+
+    def start(self, vm_config_path=None):
+        return asyncio.run(self.start_async(vm_config_path))
+
+    def change_disk(self, test_dev_name):
+        if test_dev_name == self.dev_name:
+            return True
+
+        # hot swap disk under test instead of rebooting VM with new config
+        out, err = systemExec(["virsh", "detach-disk", self.get_vm_name(), self.dev_name_inside_vm, "--live"], timeout=VIRSH_TIMEOUT)
+        if out is None:
+            print("VM %s failed to detach disk %s error %s" % (self.get_vm_name(), str(self.dev_name), str(err)))
+            return False
+
+        out, err = systemExec(["virsh", "attach-disk", self.get_vm_name(), str(test_dev_name), self.dev_name_inside_vm,
+            "--live", "--targetbus", "virtio", "--cache", "none", "--io", "native"] + (["--mode", "shareable"] if self.shareable else []),
+            timeout=VIRSH_TIMEOUT)
+        if out is None:
+            print("VM %s failed to attach disk %s error %s" % (self.get_vm_name(), str(test_dev_name), str(err)))
+            return False
+
+        self.dev_name = test_dev_name
+        # wait inside VM for the device so it costs one command
+        out, _ = self.run_command("i=0; while [ $i -lt %d ]; do test -b %s && echo 1 && break; i=$((i+1)); sleep 0.2; done" %
+            (self.timeout * 5, self.get_dev_name_inside_vm()), timeout=self.timeout * 2)
+        if out is not None and out.startswith("1"):
+            return True
+
+        print("VM %s disk %s did not appear inside VM" % (self.get_vm_name(), str(test_dev_name)))
+        return False
 
-            timeout-=1
-            time.sleep(1)
-    
     def stop(self):
-        systemExec(["virsh", "destroy", self.get_vm_name()])
+        systemExec(["virsh", "destroy", self.get_vm_name()], timeout=VIRSH_TIMEOUT)
+
+    def destroy(self):
+        if self.destroyed:
+            return
+
+        self.destroyed = True
+        self.close_master()
+        systemExec(["virsh", "destroy", self.get_vm_name()], timeout=VIRSH_TIMEOUT)
+        systemExec(["virsh", "undefine", self.get_vm_name()], timeout=VIRSH_TIMEOUT)
+        if self.config_path is not None:
+            systemExec(["rm", "-f", self.config_path])
+
+
+# Boots VMs once and leases them to tests one by one, disk under test is swapped between leases.
+# Use as context manager or call close() to destroy all VMs.
+class VmPool:
+    def __init__(self, size=1, test_dev_name="/dev/zero", ram_size="1024000", vcpu_count="1", ip_prefix="10.201.133.",
+        first_ip=2, bridge_ip="10.201.133.1", timeout=60, shareable=False):
+        self.size = size
+        self.test_dev_name = test_dev_name
+        self.ram_size = ram_size
+        self.vcpu_count = vcpu_count
+        self.ip_prefix = ip_prefix
+        self.first_ip = first_ip
+        self.bridge_ip = bridge_ip
+        self.timeout = timeout
+        self.shareable = shareable
+        self.free_vms = []
+        self.vms = []
+        self.condition = threading.Condition()
+
+    def new_vm(self, vm_ip):
+        vm = Testvm(test_dev_name=self.test_dev_name, ram_size=self.ram_size, vcpu_count=self.vcpu_count, vm_ip=vm_ip,
+            bridge_ip=self.bridge_ip, timeout=self.timeout, shareable=self.shareable)
+        if not vm.start():
+            vm.destroy()
+            raise Exception("VM %s failed to boot in %d s" % (vm.get_vm_name(), self.timeout))
+
+        return vm
+
+    # all VMs boot at the same time, when one fails the booted ones are destroyed
+    def start(self):
+        ips = [self.ip_prefix + str(self.first_ip + i) for i in range(self.size)]
+        vms = asyncio.run(runParallel(*[lambda vm_ip=vm_ip: self.new_vm(vm_ip) for vm_ip in ips]))
+        errors = [vm for vm in vms if isinstance(vm, Exception)]
+        if len(errors) != 0:
+            for vm in vms:
+                if not isinstance(vm, Exception):
+                    vm.destroy()
+
+            raise errors[0]
+
+        self.vms.extend(vms)
+        self.free_vms.extend(vms)
+        return self
+
+    def lease(self, test_dev_name):
+        with self.condition:
+            while len(self.free_vms) == 0:
+                if len(self.vms) == 0:
+                    raise Exception("VM pool has no VMs left")
+
+                self.condition.wait()
+
+            vm = self.free_vms.pop(0)
+
+        try:
+            healthy = vm.is_alive() and vm.change_disk(test_dev_name)
+        except Exception:
+            self.release(vm)
+            raise
+
+        if not healthy:
+            print("VM %s is not healthy, replace it" % vm.get_vm_name())
+            vm = self.replace(vm, test_dev_name)
+
+        return vm
+
+    # unhealthy VM is dropped from the pool, when its replacement fails to boot the pool gets one VM smaller
+    def replace(self, vm, test_dev_name):
+        vm.destroy()
+        with self.condition:
+            self.vms.remove(vm)
+
+        new_vm = Testvm(test_dev_name=test_dev_name, ram_size=self.ram_size, vcpu_count=self.vcpu_count, vm_ip=vm.vm_ip,
+            bridge_ip=self.bridge_ip, timeout=self.timeout, shareable=self.shareable)
+        try:
+            if not new_vm.start():
+                raise Exception("VM %s failed to boot in %d s" % (new_vm.get_vm_name(), self.timeout))
+        except Exception:
+            new_vm.destroy()
+            with self.condition:
+                # waiters check if the pool is empty now
+                self.condition.notify_all()
+
+            raise
+
+        with self.condition:
+            self.vms.append(new_vm)
+
+        return new_vm
+
+    def release(self, vm):
+        with self.condition:
+            self.free_vms.append(vm)
+            self.condition.notify()
+
+    def close(self):
+        with self.condition:
+            vms = self.vms
+            self.vms = []
+            self.free_vms = []
+
+        for vm in vms:
+            vm.destroy()
+
+    def __enter__(self):
+        return self.start()
 
-    def __del__(self):
-        systemExec(["virsh", "destroy", self.get_vm_name()])
-        systemExec(["virsh", "undefine", self.get_vm_name()])
-        systemExec(["rm", "-f", self.config_path])
\ No newline at end of file
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
\ No newline at end of file
@@ -0,0 +1,115 @@
+#!/usr/bin/python3
+
+# MIT License
+# 
+# Copyright (c) 2020 Andrii Melnyk andriy.melnyk@onapp.com
+# 
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+# 
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+# 
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import os
+import json
+import itertools
+
+SUITES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "suites")
+DEFAULT_SUITE_PATH = os.path.join(SUITES_DIR, "default.json")
+
+READ_RW = ["read", "randread"]
+WRITE_RW = ["write", "randwrite"]
+THRESHOLD_LIMITS = ["min", "max"]
+
+# Suite file describes workloads, every workload is a Cartesian product of its matrix axes (any fio option e.g.
+# rw, bs, iodepth, numjobs, rwmixread), thresholds may be overridden for the cells matching given axis values:
+# {
+#     "defaults": {"size": "4GB"},
+#     "workloads": [
+#         {"name": "{rw}_{bs}_qd{iodepth}", "matrix": {"rw": ["randread", "randwrite"], "bs": ["4k", "1M"],
+#             "iodepth": [1, 32]}, "thresholds": {"read_iops": {"min": 1000}, "read_lat": {"max": 10000}},
+#          "cells": [{"match": {"bs": "1M"}, "thresholds": {"read_iops": {"min": 100}}}]}
+#     ]
+# }
+def load_suite(path=DEFAULT_SUITE_PATH):
+    with open(path) as suite_file:
+        if os.path.splitext(path)[1] in [".yaml", ".yml"]:
+            try:
+                import yaml
+            except ImportError:
+                raise Exception("PyYAML is required for yaml suite %s, install python3-pyyaml or use json" % path)
+
+            return yaml.safe_load(suite_file)
+
+        return json.load(suite_file)
+
+
+def get_directions(rw):
+    if rw in READ_RW:
+        return ["read"]
+
+    if rw in WRITE_RW:
+        return ["write"]
+
+    return ["read", "write"]
+
+
+def get_thresholds(workload, cell):
+    thresholds = {k: dict(v) for k, v in workload.get("thresholds", {}).items()}
+    for override in workload.get("cells", []):
+        if all(str(cell.get(k)) == str(v) for k, v in override.get("match", {}).items()):
+            for k, v in override.get("thresholds", {}).items():
+                thresholds.setdefault(k, dict()).update(v)
+
+    for k, v in thresholds.items():
+        for limit in v:
+            if limit not in THRESHOLD_LIMITS:
+                raise Exception("Unknown threshold %s for %s in workload %s" % (limit, k, workload["name"]))
+
+    return thresholds
+
+
+def expand_workload(workload, defaults=None):
+    matrix = {k: v if isinstance(v, list) else [v] for k, v in workload.get("matrix", {}).items()}
+    cells = list()
+    for values in itertools.product(*matrix.values()):
+        cell = dict(zip(matrix.keys(), values))
+        params = dict(defaults or {})
+        params.update(workload.get("params", {}))
+        params.update(cell)
+        if "rwmixread" in params and "rwmixwrite" not in params:
+            params["rwmixwrite"] = 100 - int(params["rwmixread"])
+
+        params = {k: str(v) for k, v in params.items()}
+        cells.append({"name": workload["name"].format(**cell), "params": params,
+            "directions": get_directions(params.get("rw", "read")), "scaling": workload.get("scaling", False),
+            "thresholds": get_thresholds(workload, cell)})
+
+    return cells
+
+
+# returns flat list of test cells in the suite order
+def expand_suite(suite):
+    cells = list()
+    for workload in suite["workloads"]:
+        cells += expand_workload(workload, suite.get("defaults"))
+
+    names = [cell["name"] for cell in cells]
+    duplicates = sorted(set(name for name in names if names.count(name) > 1))
+    if len(duplicates) != 0:
+        raise Exception("Duplicated test names %s, add matrix axes to workload name e.g. {bs}" % ", ".join(duplicates))
+
+    return cells